@@ -0,0 +1,91 @@
+'''
+Compares the simulation speed of the traci and the libsumo backends (see core/sumo_backend.py).
+For every bundled map, one route file is generated and simulated with the Dijkstra policy on each backend,
+and the simulated steps per second of wall-clock time are reported.
+Run from the repository root, e.g.
+    python3 benchmark/backend_steps.py --maps configurations/maps/test.net.xml --controlled 20 --background 200
+Files generated during the benchmark: benchmark_<map>.rou.xml in a temporary directory
+'''
+import copy
+import glob
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.STR_SUMO import StrSumo, SUBSCRIPTION
+from core.Util import ConnectionInfo
+from core.target_vehicles_generation_protocols import target_vehicles_generator
+from core.sumo_backend import traci, select_backend, BACKENDS
+from controller.DijkstraController import DijkstraPolicy
+from sumolib import checkBinary
+
+
+def get_options():
+    opt_parser = optparse.OptionParser()
+    opt_parser.add_option("--maps", default="configurations/maps/*.net.xml",
+                          help="glob of the network files to run [default: %default]")
+    opt_parser.add_option("--backends", default=",".join(BACKENDS),
+                          help="comma separated backends to compare [default: %default]")
+    opt_parser.add_option("--controlled", type="int", default=20, help="number of controlled vehicles")
+    opt_parser.add_option("--background", type="int", default=200, help="number of uncontrolled vehicles")
+    opt_parser.add_option("--pattern", type="int", default=3, help="vehicle generation pattern")
+    opt_parser.add_option("--seed", type="int", default=42, help="seed of the background traffic")
+    options, args = opt_parser.parse_args()
+    return options
+
+
+def run_once(backend, net_file, route_file, vehicles):
+    """
+    :return: (number of simulated steps, wall-clock seconds of StrSumo.run)
+    """
+    select_backend(backend)
+    connection_info = ConnectionInfo(net_file)
+    simulation = StrSumo(DijkstraPolicy(connection_info, use_path_trees=True), connection_info,
+                         copy.deepcopy(vehicles), collection_mode=SUBSCRIPTION)
+    traci.start([checkBinary('sumo'), "-n", net_file, "-r", route_file, "--no-step-log", "--no-warnings"])
+    try:
+        start = time.perf_counter()
+        simulation.run()
+        elapsed = time.perf_counter() - start
+        steps = traci.simulation.getTime() / traci.simulation.getDeltaT()
+    finally:
+        traci.close()
+    return steps, elapsed
+
+
+def main():
+    options = get_options()
+    backends = options.backends.split(",")
+    temp_directory = tempfile.mkdtemp()
+    print("{:<28} {:<8} {:>8} {:>10} {:>10}".format("map", "backend", "steps", "seconds", "steps/s"))
+    try:
+        for net_file in sorted(glob.glob(options.maps)):
+            map_name = os.path.basename(net_file)
+            route_file = os.path.join(temp_directory, "benchmark_" + map_name.replace(".net.xml", ".rou.xml"))
+            generator = target_vehicles_generator(net_file)
+            vehicle_list = generator.generate_vehicles(options.controlled, options.background, options.pattern,
+                                                       route_file, net_file, seed=options.seed)
+            if not vehicle_list:
+                print("Skipping " + map_name + ": no vehicles could be generated")
+                continue
+            vehicles = {str(vehicle.vehicle_id): vehicle for vehicle in vehicle_list}
+
+            for backend in backends:
+                try:
+                    steps, elapsed = run_once(backend, net_file, route_file, vehicles)
+                except ImportError as err:
+                    print("Skipping " + backend + ": " + str(err))
+                    continue
+                print("{:<28} {:<8} {:>8.0f} {:>10.2f} {:>10.1f}".format(map_name, backend, steps, elapsed,
+                                                                      steps / elapsed))
+    finally:
+        shutil.rmtree(temp_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+'''
+Compares the two ways IncrementalPolicy keeps its shortest path trees up to date: rebuilding them whenever the
+travel times change (IncrementalPolicy(incremental=False)) and repairing them for the edges whose travel time
+changed since they were last used (the default, core/incremental_paths.py).
+One route file is generated with the given demand pattern and simulated once per mode with a StepProfiler; the
+time spent in the decisions phase, the number of edge weights changed per step and the results are reported.
+Run from the repository root, e.g.
+    python3 benchmark/incremental_routing.py --map configurations/test.net.xml --pattern 3 --backend meso
+Files generated during the benchmark: benchmark.rou.xml in a temporary directory
+'''
+import copy
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.STR_SUMO import StrSumo, SUBSCRIPTION
+from core.Util import ConnectionInfo
+from core.profiling import StepProfiler
+from core.target_vehicles_generation_protocols import target_vehicles_generator
+from core.sumo_backend import traci, select_backend, BACKENDS, TRACI
+from controller.IncrementalController import IncrementalPolicy
+from sumolib import checkBinary
+
+
+def get_options():
+    opt_parser = optparse.OptionParser()
+    opt_parser.add_option("--map", default="configurations/test.net.xml",
+                          help="network file to run [default: %default]")
+    opt_parser.add_option("--backend", default=TRACI, help="one of " + ", ".join(BACKENDS) + " [default: %default]")
+    opt_parser.add_option("--controlled", type="int", default=50, help="number of controlled vehicles")
+    opt_parser.add_option("--background", type="int", default=300, help="number of uncontrolled vehicles")
+    opt_parser.add_option("--pattern", type="int", default=3, help="vehicle generation pattern [default: %default]")
+    opt_parser.add_option("--seed", type="int", default=42, help="seed of the background traffic")
+    opt_parser.add_option("--resolution", type="float", default=1.0,
+                          help="travel time resolution of the policy in seconds [default: %default]")
+    options, args = opt_parser.parse_args()
+    return options
+
+
+class CountingPolicy(IncrementalPolicy):
+    """
+    IncrementalPolicy recording how many edge weights changed at every decision step.
+    """
+    def __init__(self, connection_info, **kwargs):
+        super().__init__(connection_info, **kwargs)
+        self.changed_weights = []
+        self._last_weights = None
+
+    def edge_weights(self):
+        weights = super().edge_weights()
+        if self._last_weights is not None:
+            self.changed_weights.append(int((weights != self._last_weights).sum()))
+        self._last_weights = weights
+        return weights
+
+
+def run_once(net_file, route_file, vehicles, incremental, resolution):
+    """
+    :return: (decisions seconds, policy, (total_time, end_number, deadlines_missed))
+    """
+    connection_info = ConnectionInfo(net_file)
+    policy = CountingPolicy(connection_info, resolution=resolution, incremental=incremental)
+    profiler = StepProfiler(count_round_trips=False)
+    simulation = StrSumo(policy, connection_info, copy.deepcopy(vehicles), collection_mode=SUBSCRIPTION,
+                         profiler=profiler)
+    traci.start([checkBinary('sumo'), "-n", net_file, "-r", route_file, "--no-step-log", "--no-warnings"])
+    try:
+        results = simulation.run()
+    finally:
+        traci.close()
+    return profiler.phase_totals()["decisions"], policy, results
+
+
+def main():
+    options = get_options()
+    select_backend(options.backend)
+    temp_directory = tempfile.mkdtemp()
+    try:
+        route_file = os.path.join(temp_directory, "benchmark.rou.xml")
+        generator = target_vehicles_generator(options.map)
+        vehicle_list = generator.generate_vehicles(options.controlled, options.background, options.pattern,
+                                                   route_file, options.map, seed=options.seed)
+        if not vehicle_list:
+            print("No vehicles could be generated on " + options.map)
+            return
+        vehicles = {str(vehicle.vehicle_id): vehicle for vehicle in vehicle_list}
+
+        print("{:<12} {:>12} {:>10} {:>14} {:>12} {:>8}".format(
+            "mode", "decisions s", "speedup", "changed/step", "total time", "arrived"))
+        baseline = None
+        for mode, incremental in (("recompute", False), ("incremental", True)):
+            seconds, policy, (total_time, end_number, _) = run_once(options.map, route_file, vehicles,
+                                                                    incremental, options.resolution)
+            if baseline is None:
+                baseline = seconds
+            changed = policy.changed_weights
+            print("{:<12} {:>12.3f} {:>10.1f} {:>14.1f} {:>12.0f} {:>8}".format(
+                mode, seconds, baseline / seconds, sum(changed) / max(len(changed), 1), total_time, end_number))
+    finally:
+        shutil.rmtree(temp_directory)
+
+
+if __name__ == "__main__":
+    main()
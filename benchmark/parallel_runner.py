@@ -0,0 +1,176 @@
+'''
+Runs a grid of testbed runs (map x policy x seed x demand pattern) on a process pool and collects the results
+of all runs in one CSV table. Every run owns its SUMO connection (traci.start with its own label) and its own
+temporary directory for the route and output files, so the runs do not interfere with each other.
+Run from the repository root, e.g.
+    python3 benchmark/parallel_runner.py --maps "configurations/maps/*.net.xml" --policies dijkstra,random \
+        --seeds 1,2,3 --patterns 1,3 --jobs 8 --output results.csv
+Files generated: the CSV table, plus one log file per run if --log-dir is given
+'''
+import contextlib
+import csv
+import glob
+import itertools
+import multiprocessing
+import optparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RESULT_COLUMNS = ["map", "policy", "seed", "pattern", "backend", "controlled", "background", "arrived",
+                  "average_time", "deadlines_missed", "steps", "wall_seconds", "error"]
+
+
+def make_policy(name, connection_info, model_file):
+    """
+    :param name: dijkstra, dijkstra-trees, congestion, incremental, random or qlearning
+    :return: the RouteController
+    """
+    from controller.DijkstraController import DijkstraPolicy
+    from controller.RouteController import RandomPolicy
+    if name == "dijkstra":
+        return DijkstraPolicy(connection_info)
+    if name == "dijkstra-trees":
+        return DijkstraPolicy(connection_info, use_path_trees=True)
+    if name == "congestion":
+        from controller.CongestionAwareController import CongestionAwarePolicy
+        return CongestionAwarePolicy(connection_info)
+    if name == "incremental":
+        from controller.IncrementalController import IncrementalPolicy
+        return IncrementalPolicy(connection_info, incremental=True)
+    if name == "random":
+        return RandomPolicy(connection_info)
+    if name == "qlearning":
+        from controller.QLearningController import QLearningPolicy
+        return QLearningPolicy(connection_info, model_file, batch_decisions=True, backend="numpy")
+    raise ValueError("Unknown policy: " + name)
+
+
+def run_scenario(scenario):
+    """
+    One testbed run, executed in a worker process.
+    :param scenario: dict with the keys map, policy, seed, pattern, backend, controlled, background,
+                     model_file, label, log_dir
+    :return: dict with the RESULT_COLUMNS of the run
+    """
+    result = {name: scenario.get(name, "") for name in RESULT_COLUMNS}
+    result["map"] = os.path.basename(scenario["map"])
+    run_directory = tempfile.mkdtemp(prefix=scenario["label"] + "-")
+    log_file = os.path.join(scenario["log_dir"] or run_directory, scenario["label"] + ".log")
+    try:
+        with open(log_file, "w") as log, contextlib.redirect_stdout(log):
+            from core.sumo_backend import traci, select_backend
+            from core.STR_SUMO import StrSumo, SUBSCRIPTION
+            from core.Util import ConnectionInfo
+            from core.target_vehicles_generation_protocols import target_vehicles_generator
+            from sumolib import checkBinary
+
+            select_backend(scenario["backend"])
+            # the controlled vehicles are drawn with the random module, the background with its own seed
+            random.seed(scenario["seed"])
+            net_file = scenario["map"]
+            route_file = os.path.join(run_directory, "routes.rou.xml")
+            generator = target_vehicles_generator(net_file)
+            vehicle_list = generator.generate_vehicles(scenario["controlled"], scenario["background"],
+                                                       scenario["pattern"], route_file, net_file,
+                                                       seed=scenario["seed"])
+            if not vehicle_list:
+                raise RuntimeError("no vehicles could be generated")
+            vehicles = {str(vehicle.vehicle_id): vehicle for vehicle in vehicle_list}
+
+            connection_info = ConnectionInfo(net_file)
+            policy = make_policy(scenario["policy"], connection_info, scenario["model_file"])
+            simulation = StrSumo(policy, connection_info, vehicles, collection_mode=SUBSCRIPTION)
+            traci.start([checkBinary("sumo"), "-n", net_file, "-r", route_file, "--no-step-log",
+                         "--tripinfo-output", os.path.join(run_directory, "trips.trips.xml")],
+                        label=scenario["label"])
+            try:
+                start = time.perf_counter()
+                total_time, end_number, deadlines_missed = simulation.run()
+                result["wall_seconds"] = "%.3f" % (time.perf_counter() - start)
+                result["steps"] = int(traci.simulation.getTime() / traci.simulation.getDeltaT())
+            finally:
+                traci.close()
+            result["arrived"] = end_number
+            result["average_time"] = "%.2f" % (total_time / end_number) if end_number else ""
+            result["deadlines_missed"] = deadlines_missed
+    except Exception as err:
+        result["error"] = type(err).__name__ + ": " + str(err)
+        with open(log_file, "a") as log:
+            traceback.print_exc(file=log)
+    finally:
+        shutil.rmtree(run_directory, ignore_errors=True)
+    return result
+
+
+def scenario_grid(options):
+    maps = sorted(itertools.chain.from_iterable(glob.glob(pattern) for pattern in options.maps.split(",")))
+    grid = itertools.product(maps, options.policies.split(","), [int(seed) for seed in options.seeds.split(",")],
+                             [int(pattern) for pattern in options.patterns.split(",")])
+    return [{"map": net_file, "policy": policy, "seed": seed, "pattern": pattern, "backend": options.backend,
+             "controlled": options.controlled, "background": options.background,
+             "model_file": options.model_file, "label": "run%d" % index, "log_dir": options.log_dir}
+            for index, (net_file, policy, seed, pattern) in enumerate(grid)]
+
+
+def get_options():
+    opt_parser = optparse.OptionParser()
+    opt_parser.add_option("--maps", default="configurations/maps/*.net.xml",
+                          help="comma separated globs of the network files [default: %default]")
+    opt_parser.add_option("--policies", default="dijkstra,random",
+                          help="comma separated policies: dijkstra, dijkstra-trees, congestion, incremental, random, "
+                               "qlearning [default: %default]")
+    opt_parser.add_option("--seeds", default="1", help="comma separated seeds [default: %default]")
+    opt_parser.add_option("--patterns", default="1,2,3", help="comma separated demand patterns [default: %default]")
+    opt_parser.add_option("--controlled", type="int", default=10, help="number of controlled vehicles per run")
+    opt_parser.add_option("--background", type="int", default=50, help="number of uncontrolled vehicles per run")
+    opt_parser.add_option("--backend", default="traci", help="traci, libsumo or meso [default: %default]")
+    opt_parser.add_option("--model-file", default="test/rl-high-all-fixed-late.h5",
+                          help="model of the qlearning policy [default: %default]")
+    opt_parser.add_option("--jobs", type="int", default=os.cpu_count(),
+                          help="number of worker processes [default: number of cores]")
+    opt_parser.add_option("--output", default="benchmark_results.csv", help="CSV table of the results")
+    opt_parser.add_option("--log-dir", default=None, help="keep the output of every run in this directory")
+    options, args = opt_parser.parse_args()
+    return options
+
+
+def main():
+    options = get_options()
+    if options.log_dir:
+        os.makedirs(options.log_dir, exist_ok=True)
+    scenarios = scenario_grid(options)
+    # build the map bundles and the converted model here once, so that the workers only read them
+    from core import map_bundle, dense_model
+    for net_file in sorted(set(scenario["map"] for scenario in scenarios)):
+        map_bundle.load_map_bundle(net_file)
+    if "qlearning" in options.policies.split(","):
+        dense_model.load_model(options.model_file)
+    print("Running {} scenarios on {} worker processes".format(len(scenarios), options.jobs))
+
+    start = time.perf_counter()
+    results = []
+    # a fresh process per run, so that no SUMO connection (or libsumo instance) outlives its run
+    with multiprocessing.Pool(processes=options.jobs, maxtasksperchild=1) as pool:
+        for result in pool.imap_unordered(run_scenario, scenarios):
+            results.append(result)
+            print("[{}/{}] {} {} seed {} pattern {}: {}".format(
+                len(results), len(scenarios), result["map"], result["policy"], result["seed"], result["pattern"],
+                result["error"] or "average time " + str(result["average_time"])))
+
+    results.sort(key=lambda result: (result["map"], result["policy"], result["seed"], result["pattern"]))
+    with open(options.output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(results)
+    print("Wrote {} results to {} in {:.1f} s".format(len(results), options.output, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+'''
+Compares the query time of the shortest path engines of the routing policies on random pairs of passenger edges:
+Dijkstra's algorithm (core/shortest_path.py), A* with landmark bounds (core/landmarks.py) and the bidirectional
+query of the contraction hierarchy (core/contraction.py).
+The bundled maps are small, so a synthetic grid of --grid x --grid junctions can be added to see how the engines
+scale; its preprocessing is not cached. A grid has no road hierarchy, which makes it a hard case for the
+contraction hierarchy, and contracting large grids takes minutes.
+Run from the repository root, e.g.
+    python3 benchmark/routing_engines.py --maps "configurations/*.net.xml" --grid 60 --queries 2000
+'''
+import glob
+import optparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from core.Util import ConnectionInfo
+from core.compiled_graph import CompiledGraph, DIRECTION_NAMES
+from core.contraction import ContractionHierarchy, ContractionHierarchyEngine
+from core.landmarks import AltEngine, LandmarkTable
+from core.shortest_path import ShortestPathEngine
+
+
+def grid_graph(size, seed):
+    """
+    :return: a CompiledGraph of a size x size grid of junctions with two-way streets of random length
+    """
+    rng = random.Random(seed)
+    junctions = [(x, y) for x in range(size) for y in range(size)]
+    edges = []
+    for x, y in junctions:
+        for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            if 0 <= x + dx < size and 0 <= y + dy < size:
+                edges.append(((x, y), (x + dx, y + dy)))
+    edge_index = {edge: index for index, edge in enumerate(edges)}
+    leaving = {}
+    for edge in edges:
+        leaving.setdefault(edge[0], []).append(edge)
+    codes = {name: code for code, name in enumerate(DIRECTION_NAMES)}
+    succ_ptr, succ_edge, succ_dir = [0], [], []
+    for (start, end) in edges:
+        heading = (end[0] - start[0], end[1] - start[1])
+        for successor in leaving[end]:
+            turn = (successor[1][0] - end[0], successor[1][1] - end[1])
+            cross = heading[0] * turn[1] - heading[1] * turn[0]
+            if turn == heading:
+                direction = "s"
+            elif turn == (-heading[0], -heading[1]):
+                direction = "t"
+            else:
+                direction = "l" if cross > 0 else "r"
+            succ_edge.append(edge_index[successor])
+            succ_dir.append(codes[direction])
+        succ_ptr.append(len(succ_edge))
+    num_edges = len(edges)
+    return CompiledGraph(["e%d" % index for index in range(num_edges)],
+                         [rng.uniform(50.0, 150.0) for _ in range(num_edges)], np.full(num_edges, 13.9),
+                         np.ones(num_edges), np.ones(num_edges, dtype=bool), succ_ptr, succ_edge, succ_dir)
+
+
+def time_queries(engine, pairs):
+    start = time.perf_counter()
+    for source, target in pairs:
+        engine.search(source, target)
+    return (time.perf_counter() - start) / len(pairs)
+
+
+def get_options():
+    opt_parser = optparse.OptionParser()
+    opt_parser.add_option("--maps", default="configurations/maps/*.net.xml",
+                          help="glob of the network files [default: %default]")
+    opt_parser.add_option("--grid", type="int", default=0,
+                          help="also run a synthetic grid of this many junctions per side")
+    opt_parser.add_option("--queries", type="int", default=2000, help="number of random queries per map")
+    opt_parser.add_option("--seed", type="int", default=1, help="seed of the queries")
+    options, args = opt_parser.parse_args()
+    return options
+
+
+def main():
+    options = get_options()
+    graphs = []
+    for net_file in sorted(glob.glob(options.maps)):
+        connection_info = ConnectionInfo(net_file)
+        bundle = connection_info.map_bundle
+        graphs.append((os.path.basename(net_file), connection_info.graph,
+                       [("alt", AltEngine, bundle.landmarks), ("ch", ContractionHierarchyEngine,
+                                                               bundle.contraction_hierarchy)]))
+    if options.grid > 0:
+        graph = grid_graph(options.grid, options.seed)
+        graphs.append(("grid%d" % options.grid, graph,
+                       [("alt", AltEngine, lambda graph=graph: LandmarkTable.build(graph)),
+                        ("ch", ContractionHierarchyEngine, lambda graph=graph: ContractionHierarchy.build(graph))]))
+
+    print("{:<28} {:>8} {:<10} {:>12} {:>10}".format("map", "edges", "engine", "us/query", "speedup"))
+    for name, graph, engines in graphs:
+        rng = random.Random(options.seed)
+        passenger = graph.passenger_edges.tolist()
+        pairs = [(rng.choice(passenger), rng.choice(passenger)) for _ in range(options.queries)]
+        baseline = time_queries(ShortestPathEngine(graph), pairs)
+        print("{:<28} {:>8} {:<10} {:>12.1f} {:>10}".format(name, graph.num_edges, "dijkstra", baseline * 1e6, "1.0"))
+        for engine_name, engine_class, load_preprocessing in engines:
+            start = time.perf_counter()
+            preprocessing = load_preprocessing()
+            seconds_loaded = time.perf_counter() - start
+            seconds = time_queries(engine_class(graph, preprocessing), pairs)
+            print("{:<28} {:>8} {:<10} {:>12.1f} {:>10.1f}   (preprocessing loaded in {:.2f} s)".format(
+                name, graph.num_edges, engine_name, seconds * 1e6, baseline / seconds, seconds_loaded))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import functools
+from controller.RouteController import RouteController
+from core.Util import ConnectionInfo, Vehicle
+import numpy as np
+
+
+class CongestionAwarePolicy(RouteController):
+    """
+    Routes every vehicle on the fastest path at the current travel times of the edges,
+    as estimated by SUMO (connection_info.network_state.travel_time).
+    Edges without an estimate, and every edge outside of a simulation, cost their free-flow travel time.
+    :param connection_info: object containing network information
+    """
+    parallel_safe = True
+
+    def __init__(self, connection_info):
+        super().__init__(connection_info)
+        graph = connection_info.graph
+        self.free_flow_time = graph.lengths / np.maximum(graph.speeds, 0.1)
+
+    def edge_weights(self):
+        """
+        :return: float64 array of the current travel time of every edge, indexed like connection_info.graph
+        """
+        network_state = self.connection_info.network_state
+        if network_state is None:
+            return self.free_flow_time
+        travel_time = network_state.travel_time
+        return np.where(travel_time > 0, np.maximum(travel_time, self.free_flow_time), self.free_flow_time)
+
+    def fastest_path_query(self):
+        """
+        :return: a function (start_edge, destination) -> (list of edge ids, list of directions) of the fastest
+                 path at the current travel times
+        """
+        return functools.partial(self.shortest_paths.shortest_path, weights=self.edge_weights().tolist())
+
+    def make_decisions(self, vehicles, connection_info):
+        """
+        :param vehicles: list of vehicles to make routing decisions for
+        :param connection_info: object containing network information
+        :return: local_targets: {vehicle_id, target_edge}
+        """
+        fastest_path = self.fastest_path_query()
+        local_targets = {}
+        for vehicle in vehicles:
+            decision_list = fastest_path(vehicle.current_edge, vehicle.destination)[1]
+            local_targets[vehicle.vehicle_id] = self.compute_local_target(decision_list, vehicle)
+        return local_targets
+
+    def make_route_decisions(self, vehicles, connection_info):
+        """
+        Commits each vehicle to its whole fastest path, see RouteController.make_route_decisions.
+        :return: routes: {vehicle_id: [edge_id]}
+        """
+        fastest_path = self.fastest_path_query()
+        routes = {}
+        for vehicle in vehicles:
+            route = fastest_path(vehicle.current_edge, vehicle.destination)[0]
+            if route:
+                routes[vehicle.vehicle_id] = route
+        return routes
@@ -1,63 +1,72 @@
 from controller.RouteController import RouteController
 from core.Util import ConnectionInfo, Vehicle
 import numpy as np
-import traci
-import math
-import copy
+from core.sumo_backend import traci
+
+# ways of answering the shortest path queries of DijkstraPolicy
+DIJKSTRA = "dijkstra" # one forward Dijkstra search per vehicle (self.shortest_paths)
+PATH_TREES = "trees" # per-destination reverse shortest path trees (self.path_trees)
+ALT = "alt" # one A* search with landmark lower bounds per vehicle (self.alt_paths)
+CH = "ch" # one bidirectional contraction hierarchy query per vehicle (self.ch_paths)
+ROUTINGS = (DIJKSTRA, PATH_TREES, ALT, CH)
 
 
 class DijkstraPolicy(RouteController):
+    """
+    :param connection_info: object containing network information
+    :param use_path_trees: answer the queries from the per-destination reverse shortest path trees
+                           (self.path_trees) instead of one forward search per vehicle.
+                           Both give shortest paths, equally short paths may be broken differently.
+                           Same as routing=PATH_TREES.
+    :param routing: DIJKSTRA, PATH_TREES, ALT or CH, the engine answering the queries; all of them give shortest
+                    paths. ALT and CH load (or compute and store, the first time) the landmarks or the contraction
+                    hierarchy of the map here.
+    """
+    parallel_safe = True
+    reads_network_state = False
 
-    def __init__(self, connection_info):
+    def __init__(self, connection_info, use_path_trees=False, routing=None):
         super().__init__(connection_info)
+        if routing is None:
+            routing = PATH_TREES if use_path_trees else DIJKSTRA
+        if routing not in ROUTINGS:
+            raise ValueError("Unknown routing: " + str(routing))
+        self.routing = routing
+        self.use_path_trees = routing == PATH_TREES
+        if routing == CH:
+            self.router = self.ch_paths
+        elif routing == ALT:
+            self.router = self.alt_paths
+        elif routing == PATH_TREES:
+            self.router = self.path_trees
+        else:
+            self.router = self.shortest_paths
 
     def make_decisions(self, vehicles, connection_info):
         """
         make_decisions algorithm uses Dijkstra's Algorithm to find the shortest path to each individual vehicle's destination
+        The search runs on the binary-heap engine self.shortest_paths (see core/shortest_path.py),
+        on the cached reverse trees self.path_trees, on the A* engine self.alt_paths or on the contraction
+        hierarchy self.ch_paths, depending on routing.
         :param vehicles: list of vehicles on the map
         :param connection_info: information about the map (roads, junctions, etc)
         """
         local_targets = {}
         for vehicle in vehicles:
             #print("{}: current - {}, destination - {}".format(vehicle.vehicle_id, vehicle.current_edge, vehicle.destination))
-            decision_list = []
-            unvisited = {edge: 1000000000 for edge in self.connection_info.edge_list} # map of unvisited edges
-            visited = {} # map of visited edges
-            current_edge = vehicle.current_edge
-
-            current_distance = self.connection_info.edge_length_dict[current_edge]
-            unvisited[current_edge] = current_distance
-            path_lists = {edge: [] for edge in self.connection_info.edge_list} #stores shortest path to each edge using directions
-            while True:
-                if current_edge not in self.connection_info.outgoing_edges_dict.keys():
-                    continue
-                for direction, outgoing_edge in self.connection_info.outgoing_edges_dict[current_edge].items():
-                    if outgoing_edge not in unvisited:
-                        continue
-                    edge_length = self.connection_info.edge_length_dict[outgoing_edge]
-                    new_distance = current_distance + edge_length
-                    if new_distance < unvisited[outgoing_edge]:
-                        unvisited[outgoing_edge] = new_distance
-                        current_path = copy.deepcopy(path_lists[current_edge])
-                        current_path.append(direction)
-                        path_lists[outgoing_edge] = copy.deepcopy(current_path)
-                        #print("{} + {} : {} + {}".format(path_lists[current_edge], direction, path_edge_lists[current_edge], outgoing_edge))
-
-                visited[current_edge] = current_distance
-                del unvisited[current_edge]
-                if not unvisited:
-                    break
-                if current_edge==vehicle.destination:
-                    break
-                possible_edges = [edge for edge in unvisited.items() if edge[1]]
-                current_edge, current_distance = sorted(possible_edges, key=lambda x: x[1])[0]
-                #print('{}:{}------------'.format(current_edge, current_distance))
-            #current_edge = vehicle.current_edge
-
-
-            for direction in path_lists[vehicle.destination]:
-                decision_list.append(direction)
+            decision_list = self.router.shortest_path(vehicle.current_edge, vehicle.destination)[1]
 
             local_targets[vehicle.vehicle_id] = self.compute_local_target(decision_list, vehicle)
         return local_targets
-    
+
+    def make_route_decisions(self, vehicles, connection_info):
+        """
+        Commits each vehicle to its whole shortest path, see RouteController.make_route_decisions.
+        :return: routes: {vehicle_id: [edge_id]}
+        """
+        routes = {}
+        for vehicle in vehicles:
+            route = self.router.shortest_path(vehicle.current_edge, vehicle.destination)[0]
+            if route:
+                routes[vehicle.vehicle_id] = route
+        return routes
@@ -0,0 +1,69 @@
+from controller.CongestionAwareController import CongestionAwarePolicy
+from core.Util import ConnectionInfo, Vehicle
+from core.incremental_paths import IncrementalTreeCache
+import numpy as np
+
+
+class IncrementalPolicy(CongestionAwarePolicy):
+    """
+    Routes every vehicle on the fastest path at the current travel times, like CongestionAwarePolicy, from one
+    shortest path tree per destination that is repaired for the edges whose travel time changed since it was
+    last used (self.incremental_trees, see core/incremental_paths.py).
+    :param connection_info: object containing network information
+    :param resolution: travel times are rounded to multiples of resolution seconds, so that small fluctuations
+                       of the estimates do not invalidate the trees; 0 to route on the exact estimates
+    :param incremental: False to rebuild the trees (self.path_trees) whenever the rounded travel times change
+                        instead, which is slower (see README.md) but lets the policy run in parallel workers
+    :param max_trees: maximum number of destinations whose repaired trees are kept
+    """
+    def __init__(self, connection_info, resolution=1.0, incremental=True, max_trees=256):
+        super().__init__(connection_info)
+        self.resolution = resolution
+        self.incremental = incremental
+        # repaired trees depend on the batches a controller has seen, so workers deciding different shards could
+        # break ties between equally fast paths differently than a single controller
+        self.parallel_safe = not incremental
+        self.incremental_trees = IncrementalTreeCache(connection_info.graph, max_trees) if incremental else None
+
+    def edge_weights(self):
+        weights = super().edge_weights()
+        if self.resolution > 0:
+            weights = np.maximum(np.round(weights / self.resolution), 1.0) * self.resolution
+        return weights
+
+    @property
+    def router(self):
+        """
+        :return: the tree cache answering the queries, updated to the current travel times
+        """
+        if self.incremental:
+            self.incremental_trees.set_weights(self.edge_weights())
+            return self.incremental_trees
+        self.path_trees.set_weights(self.edge_weights())
+        return self.path_trees
+
+    def make_decisions(self, vehicles, connection_info):
+        """
+        :param vehicles: list of vehicles to make routing decisions for
+        :param connection_info: object containing network information
+        :return: local_targets: {vehicle_id, target_edge}
+        """
+        router = self.router
+        local_targets = {}
+        for vehicle in vehicles:
+            decision_list = router.directions(vehicle.current_edge, vehicle.destination)
+            local_targets[vehicle.vehicle_id] = self.compute_local_target(decision_list, vehicle)
+        return local_targets
+
+    def make_route_decisions(self, vehicles, connection_info):
+        """
+        Commits each vehicle to its whole fastest path, see RouteController.make_route_decisions.
+        :return: routes: {vehicle_id: [edge_id]}
+        """
+        router = self.router
+        routes = {}
+        for vehicle in vehicles:
+            route = router.shortest_path(vehicle.current_edge, vehicle.destination)[0]
+            if route:
+                routes[vehicle.vehicle_id] = route
+        return routes
@@ -1,17 +1,57 @@
 from controller.RouteController import RouteController
 from core.Util import ConnectionInfo, Vehicle
-from keras.models import load_model
+from core import dense_model
 import numpy as np
-import traci
+from core.sumo_backend import traci
+from core import sim_log
+
+logger = sim_log.get_logger("QLearningController")
 
 
 class QLearningPolicy(RouteController):
-    def __init__(self, connection_info, model_file):
+    """
+    :param connection_info: object containing network information
+    :param model_file: file name of the trained Keras model, e.g. 'rl-high-all-fixed-late.h5'
+    :param batch_decisions: advance the look-ahead of all vehicles together, with one model.predict on the
+                            stacked states of every vehicle per look-ahead hop instead of one per vehicle and hop.
+                            Every vehicle gets the same decisions as in the one-by-one mode.
+    :param backend: "keras" to run the model with Keras, "numpy" to run its dense layers with NumPy
+                    (see core/dense_model.py), which does not import TensorFlow at all
+    :param precision: weights of the numpy backend, "float32" or "int8" (quantized per output, about 4 times smaller)
+    """
+    def __init__(self, connection_info, model_file, batch_decisions=False, backend="keras", precision="float32"):
         super().__init__(connection_info)
-        self.model = load_model(model_file)
+        if backend == "keras":
+            from keras.models import load_model
+            self.model = load_model(model_file)
+        elif backend == "numpy":
+            self.model = dense_model.load_model(model_file, precision)
+        else:
+            raise ValueError("Unknown model backend: " + str(backend))
+        self.batch_decisions = batch_decisions
+
+        graph = connection_info.graph
+        # the density columns of the state follow connection_info.edge_list, i.e. the passenger edges of the graph
+        self._density_rows = graph.passenger_edges
+        self._inverse_lengths = 1.0 / graph.lengths[self._density_rows]
+        # per edge index: availability bit and successor edge index (-1 if none) of every direction choice
+        self._choice_successors = np.full((graph.num_edges, len(self.direction_choices)), -1, dtype=np.int64)
+        for edge_id, outgoing in connection_info.outgoing_edges_dict.items():
+            row = connection_info.edge_index_dict[edge_id]
+            for column, choice in enumerate(self.direction_choices):
+                if choice in outgoing:
+                    self._choice_successors[row, column] = connection_info.edge_index_dict[outgoing[choice]]
+        self._choice_available = (self._choice_successors >= 0).astype(np.float64)
 
     def make_decisions(self, vehicles, connection_info: ConnectionInfo):
         local_targets = {}
+        if not vehicles:
+            # nothing to decide, so no edge states are requested from SUMO in this step
+            return local_targets
+        # the traffic does not change while the decisions of a step are made, so the densities are read once
+        densities = self.edge_densities()
+        if self.batch_decisions:
+            return self.make_batched_decisions(vehicles, densities)
 
         for vehicle in vehicles:
 
@@ -26,15 +66,15 @@ class QLearningPolicy(RouteController):
             #i = 0
 
             while total_length < connection_info.edge_length_dict[vehicle.current_edge]:
-                state = self.getState(start_edge)
+                state = self.getState(start_edge, densities)
                 action = self.act(state)
                 action = self.direction_choices[action]
                 if action not in connection_info.outgoing_edges_dict[start_edge]:
-                    print("Impossible turns made for vehicle #" + str(vehicle.vehicle_id) + " : " + action + " @ " + str(start_edge))
+                    logger.debug("Impossible turns made for vehicle #%s : %s @ %s", vehicle.vehicle_id, action, start_edge)
                     wrong_decision = True
                     break
 
-                print("Choice for " + str(start_edge) + " is: " + action)
+                logger.debug("Choice for %s is: %s", start_edge, action)
 
                 target_edge = connection_info.outgoing_edges_dict[start_edge][action]
                 start_edge = target_edge
@@ -49,6 +89,9 @@ class QLearningPolicy(RouteController):
 
                 #i += 1
 
+            if sim_log.recording():
+                sim_log.record("decision", vehicle=vehicle.vehicle_id, edge=vehicle.current_edge,
+                               choices="".join(decision_list), impossible_turn=wrong_decision)
             if wrong_decision:
                 continue
 
@@ -56,7 +99,60 @@ class QLearningPolicy(RouteController):
 
         return local_targets
 
+    def make_batched_decisions(self, vehicles, densities):
+        """
+        Runs the look-ahead of make_decisions for all vehicles at once: every hop stacks the states of the
+        vehicles still looking ahead into one matrix and makes a single forward pass of the model.
+        :param vehicles: list of vehicles to make routing decisions for
+        :param densities: the density columns of the state, see edge_densities
+        :return: local_targets: {vehicle_id, target_edge}
+        """
+        edge_ids = self.connection_info.graph.edge_ids
+        edge_index = self.connection_info.edge_index_dict
+        lengths = self.connection_info.graph.lengths
+
+        pending = [vehicle for vehicle in vehicles if vehicle.destination != vehicle.current_edge]
+        decision_lists = [[] for _ in pending]
+        wrong_decision = np.zeros(len(pending), dtype=bool)
+        # the look-ahead of a vehicle covers at least the length of its current edge
+        current = np.array([edge_index[vehicle.current_edge] for vehicle in pending], dtype=np.int64)
+        look_ahead = lengths[current].astype(np.float64)
+        total_length = np.zeros(len(pending), dtype=np.float64)
+        active = np.flatnonzero(total_length < look_ahead)
+
+        while len(active) > 0:
+            edges = current[active]
+            states = np.empty((len(active), 1 + len(self.direction_choices) + len(densities)), dtype=np.float64)
+            states[:, 0] = edges
+            states[:, 1:1 + len(self.direction_choices)] = self._choice_available[edges]
+            states[:, 1 + len(self.direction_choices):] = densities
+            actions = self.act_batch(states)
+
+            targets = self._choice_successors[edges, actions]
+            for row in np.flatnonzero(targets < 0):
+                vehicle_row = active[row]
+                logger.debug("Impossible turns made for vehicle #%s : %s @ %s", pending[vehicle_row].vehicle_id,
+                             self.direction_choices[actions[row]], edge_ids[edges[row]])
+                wrong_decision[vehicle_row] = True
+            moved = targets >= 0
+            for vehicle_row, action in zip(active[moved].tolist(), actions[moved].tolist()):
+                decision_lists[vehicle_row].append(self.direction_choices[action])
+
+            active = active[moved]
+            current[active] = targets[moved]
+            total_length[active] += lengths[targets[moved]]
+            active = active[total_length[active] < look_ahead[active]]
 
+        local_targets = {}
+        recording = sim_log.recording()
+        for vehicle_row, vehicle in enumerate(pending):
+            if recording:
+                sim_log.record("decision", vehicle=vehicle.vehicle_id, edge=vehicle.current_edge,
+                               choices="".join(decision_lists[vehicle_row]),
+                               impossible_turn=bool(wrong_decision[vehicle_row]))
+            if not wrong_decision[vehicle_row]:
+                local_targets[vehicle.vehicle_id] = self.compute_local_target(decision_lists[vehicle_row], vehicle)
+        return local_targets
 
     # this function reacheds the Neural Network trained before and let it make a decision for the situation now
     def act(self, state):
@@ -69,8 +165,29 @@ class QLearningPolicy(RouteController):
         #print('**************************')
         return np.argmax(mod_values[0])
 
+    def act_batch(self, states):
+        """
+        act for a matrix of states, one forward pass for all rows.
+        :param states: float64[k, state size] states as built by getState
+        :return: int64[k] index into direction_choices of the action of every row
+        """
+        act_values = self.model.predict(states, batch_size=len(states))
+        mod_values = act_values - 10000 * (1 - states[:, 1:7])
+        return np.argmax(mod_values, axis=1)
+
+    def edge_densities(self):
+        """
+        :return: float64 array of vehicles per meter on every edge of connection_info.edge_list, from the
+                 network snapshot of the step if StrSumo provides one, otherwise polled from TraCI
+        """
+        network_state = self.connection_info.network_state
+        if network_state is not None:
+            return network_state.vehicle_count[self._density_rows] * self._inverse_lengths
+        car_nums = [traci.edge.getLastStepVehicleNumber(edge_now) for edge_now in self.connection_info.edge_list]
+        return np.array(car_nums, dtype=np.float64) * self._inverse_lengths
+
     # this function gives the current state of the vehicle based on the state size
-    def getState(self, edge_now):
+    def getState(self, edge_now, densities=None):
         en = edge_now
         state = []
         state.append(self.connection_info.edge_index_dict[en])
@@ -82,10 +199,9 @@ class QLearningPolicy(RouteController):
                 state.append(0)
                 # 0 means this action cannot be chosen.
         # put the congestion ratio of all edges into the state.
-        for edge_now in self.connection_info.edge_list:
-            car_num = traci.edge.getLastStepVehicleNumber(edge_now)
-            density = car_num / self.connection_info.edge_length_dict[edge_now]
-            state.append(density)
+        if densities is None:
+            densities = self.edge_densities()
+        state.extend(densities.tolist())
 
         state = np.reshape(state, [1, len(state)])
         return state
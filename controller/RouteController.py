@@ -3,12 +3,16 @@ import random
 import os
 import sys
 from core.Util import *
+from core.shortest_path import ShortestPathEngine, ShortestPathTreeCache
+from core.landmarks import AltEngine, LandmarkTable
+from core.contraction import ContractionHierarchy, ContractionHierarchyEngine
+from core import sim_log
 if 'SUMO_HOME' in os.environ:
     tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
     sys.path.append(tools)
 else:
     sys.exit("No environment variable SUMO_HOME!")
-import traci
+from core.sumo_backend import traci
 import sumolib
 
 STRAIGHT = "s"
@@ -18,11 +22,14 @@ RIGHT = "r"
 SLIGHT_LEFT = "L"
 SLIGHT_RIGHT = "R"
 
+logger = sim_log.get_logger("RouteController")
+
 class RouteController(ABC):
     """
     Base class for routing policy
 
-    To implement a scheduling algorithm, implement the make_decisions() method.
+    To implement a scheduling algorithm, implement the make_decisions() method. In the full-route mode of
+    StrSumo, make_route_decisions() is called instead; it is derived from make_decisions() unless overridden.
     Please use the boilerplate code from the example, and implement your algorithm between
     the 'Your algo...' comments.
 
@@ -38,11 +45,54 @@ class RouteController(ABC):
                             - edge_index_dict {edge_index_dict} keep track of edge ids by an index
                             - edge_vehicle_count {edge_id: number of vehicles at edge}
                             - edge_list [edge_id]
+                            - graph CompiledGraph of the map
+                            - network_state NetworkSnapshot with per-edge vehicle_count, mean_speed,
+                              occupancy and travel_time arrays, fetched only when read
+
+    Every policy can call self.shortest_paths (a ShortestPathEngine over connection_info.graph),
+    e.g. self.shortest_paths.directions(vehicle.current_edge, vehicle.destination) gives a decision list.
+    self.path_trees (a ShortestPathTreeCache) answers the same question from one cached reverse search per
+    destination, which is much cheaper when many vehicles share a destination. Call
+    self.path_trees.set_weights(weights) whenever the edge costs a policy routes on change.
+    self.alt_paths (an AltEngine) answers shortest path queries on the edge lengths like self.shortest_paths,
+    with A* guided by landmark lower bounds that are stored with the map bundle; it is loaded on first use.
+    self.ch_paths (a ContractionHierarchyEngine) answers them from the contraction hierarchy of the map, also
+    stored with the map bundle and loaded on first use; it is the fastest of them for static edge lengths.
+
+    Policies whose decision for a vehicle only depends on that vehicle and the network state, and that do not
+    modify the vehicles, set parallel_safe; StrSumo can then decide large batches on a pool of worker processes
+    (see core/parallel_decisions.py) with the same results. Policies that never read connection_info.network_state
+    or connection_info.edge_vehicle_count clear reads_network_state, so the edge states are not fetched for them.
 
     """
+    parallel_safe = False
+    reads_network_state = True
+
     def __init__(self, connection_info: ConnectionInfo):
         self.connection_info = connection_info
         self.direction_choices = [STRAIGHT, TURN_AROUND,  SLIGHT_RIGHT, RIGHT, SLIGHT_LEFT, LEFT]
+        self.shortest_paths = ShortestPathEngine(connection_info.graph)
+        self.path_trees = ShortestPathTreeCache(connection_info.graph)
+        self._alt_paths = None
+        self._ch_paths = None
+
+    @property
+    def alt_paths(self):
+        if self._alt_paths is None:
+            graph = self.connection_info.graph
+            bundle = getattr(self.connection_info, "map_bundle", None)
+            landmarks = bundle.landmarks() if bundle is not None else LandmarkTable.build(graph)
+            self._alt_paths = AltEngine(graph, landmarks)
+        return self._alt_paths
+
+    @property
+    def ch_paths(self):
+        if self._ch_paths is None:
+            graph = self.connection_info.graph
+            bundle = getattr(self.connection_info, "map_bundle", None)
+            hierarchy = bundle.contraction_hierarchy() if bundle is not None else ContractionHierarchy.build(graph)
+            self._ch_paths = ContractionHierarchyEngine(graph, hierarchy)
+        return self._ch_paths
 
     def compute_local_target(self, decision_list, vehicle):
         current_target_edge = vehicle.current_edge
@@ -75,7 +125,7 @@ class RouteController(ABC):
                 i += 1
 
         except UserWarning as warning:
-            print(warning)
+            logger.debug("Vehicle %s: %s", vehicle.vehicle_id, warning)
 
         return current_target_edge
 
@@ -84,6 +134,35 @@ class RouteController(ABC):
     def make_decisions(self, vehicles, connection_info):
         pass
 
+    def make_route_decisions(self, vehicles, connection_info):
+        """
+        Decides a full route to the destination for every vehicle, used by StrSumo in the full-route mode.
+        By default the route follows the shortest path (by length, or by the weights the policy set with
+        self.path_trees.set_weights) to the local target chosen by make_decisions and continues on the shortest
+        path from there to the destination. SUMO routes to a local target by travel time after changeTarget,
+        so the route can differ from the path a vehicle takes in the per-edge mode.
+        Policies that plan whole paths should override it.
+        :param vehicles: list of vehicles to make routing decisions for
+        :param connection_info: object containing network information
+        :return: routes: {vehicle_id: [edge_id]}, each route starting at the vehicle's current edge;
+                 vehicles without a route keep their current one
+        """
+        routes = {}
+        local_targets = self.make_decisions(vehicles, connection_info)
+        for vehicle in vehicles:
+            local_target = local_targets.get(vehicle.vehicle_id)
+            if local_target is None:
+                continue
+            route = self.path_trees.shortest_path(vehicle.current_edge, local_target)[0] \
+                if local_target != vehicle.current_edge else [vehicle.current_edge]
+            if not route:
+                continue
+            if local_target != vehicle.destination:
+                rest = self.path_trees.shortest_path(local_target, vehicle.destination)[0]
+                route += rest[1:]
+            routes[vehicle.vehicle_id] = route
+        return routes
+
 
 class RandomPolicy(RouteController):
     """
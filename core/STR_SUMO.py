@@ -1,9 +1,18 @@
 import os
 import sys
+import json
+import logging
+import numpy as np
 import optparse
 from xml.dom.minidom import parse, parseString
 from core.Util import *
 from core.target_vehicles_generation_protocols import *
+from core.network_state import NetworkSnapshot, EdgeVehicleCountView
+from core import profiling
+from core import sim_log
+from core.vehicle_tracker import ControlledVehicleTracker
+from core.vehicle_table import VehicleTable, NO_EDGE
+from core.reroute_triggers import RerouteTriggers
 
 if 'SUMO_HOME' in os.environ:
     tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
@@ -11,7 +20,8 @@ if 'SUMO_HOME' in os.environ:
 else:
     sys.exit("No environment variable SUMO_HOME!")
 
-import traci
+from core.sumo_backend import traci
+import traci.constants as tc
 import sumolib
 from controller.RouteController import *
 
@@ -19,6 +29,8 @@ from controller.RouteController import *
 SUMO Selfless Traffic Routing (STR) Testbed
 """
 
+logger = sim_log.get_logger("STR_SUMO")
+
 MAX_SIMULATION_STEPS = 2000
 
 # TODO: decide which file to put these in. Right now they're also defined in RouteController!!
@@ -29,24 +41,76 @@ RIGHT = "r"
 SLIGHT_LEFT = "L"
 SLIGHT_RIGHT = "R"
 
+# ways of collecting the vehicle and edge states from SUMO at every step
+POLLING = "polling" # one TraCI query per vehicle / edge and variable
+SUBSCRIPTION = "subscription" # variable subscriptions, delivered together with every simulation step
+
+# ways of applying the decisions of the route controller
+LOCAL_TARGET = "local_target" # make_decisions on every edge change, applied with changeTarget to a nearby edge
+FULL_ROUTE = "full_route" # make_route_decisions when a reroute trigger fires, applied with setRoute
+
+STATE_FORMAT_VERSION = 1
+
 class StrSumo:
-    def __init__(self, route_controller, connection_info, controlled_vehicles):
+    def __init__(self, route_controller, connection_info, controlled_vehicles, collection_mode=POLLING, profiler=None,
+                 decision_mode=LOCAL_TARGET, reroute_triggers=None, parallel_decisions=None):
         """
         :param route_controller: object that implements the scheduling algorithm for controlled vehicles
         :param connection_info: object that includes the map information
         :param controlled_vehicles: a dictionary that includes the vehicles under control
+        :param collection_mode: POLLING or SUBSCRIPTION. With SUBSCRIPTION the road and speed of the controlled
+                                vehicles are subscribed once and read with getAllSubscriptionResults,
+                                which needs no extra round-trip to SUMO. With POLLING the road of every
+                                controlled vehicle in the simulation is queried. In both modes the controlled
+                                vehicles are followed from the departures and arrivals (see vehicle_tracker.py).
+        :param profiler: a profiling.StepProfiler recording the time of every phase of every step, the
+                         round-trips to SUMO and the latency of the route controller; None disables profiling
+        :param decision_mode: LOCAL_TARGET or FULL_ROUTE. With LOCAL_TARGET the route controller decides again
+                              whenever a vehicle enters a new edge. With FULL_ROUTE a vehicle is committed to the
+                              whole route returned by make_route_decisions and only decides again when one of
+                              reroute_triggers fires, which takes far fewer decisions and TraCI writes.
+        :param reroute_triggers: a reroute_triggers.RerouteTriggers for FULL_ROUTE, the default triggers if None
+        :param parallel_decisions: a parallel_decisions.ParallelDecisions deciding large batches of vehicles on a
+                                   pool of worker processes, started and stopped by run; the route controller
+                                   must be parallel_safe. None decides every batch in this process.
+        The edge states are always provided by a lazily populated NetworkSnapshot, installed as
+        connection_info.network_state and viewed by connection_info.edge_vehicle_count.
         """
         self.direction_choices = [STRAIGHT, TURN_AROUND, SLIGHT_RIGHT, RIGHT, SLIGHT_LEFT, LEFT]
         self.connection_info = connection_info
         self.route_controller = route_controller
         self.controlled_vehicles =  controlled_vehicles # dictionary of Vehicles by id
+        if collection_mode not in (POLLING, SUBSCRIPTION):
+            raise ValueError("Unknown collection mode: " + str(collection_mode))
+        self.collection_mode = collection_mode
+        if decision_mode not in (LOCAL_TARGET, FULL_ROUTE):
+            raise ValueError("Unknown decision mode: " + str(decision_mode))
+        self.decision_mode = decision_mode
+        self.network_state = NetworkSnapshot(connection_info.graph)
+        self.connection_info.network_state = self.network_state
+        self.connection_info.edge_vehicle_count = EdgeVehicleCountView(self.network_state)
+        self.profiler = profiler
+        self.network_state.profiler = profiler
+        self.tracker = ControlledVehicleTracker(controlled_vehicles, collection_mode == SUBSCRIPTION)
+        # the controlled vehicles become views of the rows of one table, with the edge indices of the graph
+        self.vehicle_table = VehicleTable(connection_info.graph.edge_ids)
+        self.vehicle_table.adopt(controlled_vehicles.values())
+        self.parallel_decisions = parallel_decisions
+        self.reroute_triggers = None
+        if decision_mode == FULL_ROUTE:
+            self.reroute_triggers = reroute_triggers if reroute_triggers is not None else RerouteTriggers()
+            self.reroute_triggers.network_state = self.network_state
         #print(self.controlled_vehicles)
 
-    def run(self):
+    def run(self, start_state=None, save_state_step=None, state_file=None, stop_after_save=False):
         """
         Runs the SUMO simulation
         At each time-step, cars that have moved edges make a decision based on user-supplied scheduler algorithm
         Decisions are enforced in SUMO by setting the destination of the vehicle to the result of the
+        :param start_state: state file written by save_state; the run continues from it instead of step 0
+        :param save_state_step: step at which the state is saved to state_file, after the decisions of that step
+        :param state_file: file name of the SUMO state, the StrSumo bookkeeping goes to state_file + ".json"
+        :param stop_after_save: end the run once the state is saved, see warm_up
         :returns: total time, number of cars that reached their destination, number of deadlines missed
         """
         total_time = 0
@@ -55,45 +119,62 @@ class StrSumo:
 
         step = 0
         vehicles_to_direct = [] #  the batch of controlled vehicles passed to make_decisions()
-        vehicle_IDs_in_simulation = []
+        self.tracker = ControlledVehicleTracker(self.controlled_vehicles, self.collection_mode == SUBSCRIPTION)
+        tracker = self.tracker
+
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.attach(traci)
+
+        if start_state is not None:
+            step, total_time, end_number, deadlines_missed = self.load_state(start_state)
+            # the state was saved after the decisions of its step, right before the simulation step
+            traci.simulationStep()
+            step += 1
+
+        parallel = self.parallel_decisions
+        if parallel is not None:
+            parallel.start(self.route_controller, self.vehicle_table, self.network_state)
 
         try:
             while traci.simulation.getMinExpectedNumber() > 0:
-                vehicle_ids = set(traci.vehicle.getIDList())
-
-                # store edge vehicle counts in connection_info.edge_vehicle_count
-                self.get_edge_vehicle_counts()
-                #initialize vehicles to be directed
-                vehicles_to_direct = []
-                # iterate through vehicles currently in simulation
-                for vehicle_id in vehicle_ids:
-
-                    #should not be added because there is no corresponding -1, this makes edge_vehicle_count becomes the total number of vehicles that used to be on this edge.
-                    #self.connection_info.edge_vehicle_count[traci.vehicle.getRoadID(vehicle_id)] += 1
-                    
-                    
-
-                    # handle newly arrived controlled vehicles
-                    if vehicle_id not in vehicle_IDs_in_simulation and vehicle_id in self.controlled_vehicles:
-                        vehicle_IDs_in_simulation.append(vehicle_id)
-                        traci.vehicle.setColor(vehicle_id, (255, 0, 0)) # set color so we can visually track controlled vehicles
-                        self.controlled_vehicles[vehicle_id].start_time = float(step)#Use the detected release time as start time
-
-                    if vehicle_id in self.controlled_vehicles.keys():
-                        current_edge = traci.vehicle.getRoadID(vehicle_id)
-
-                        if current_edge not in self.connection_info.edge_index_dict.keys():
-                            continue
-                        elif current_edge == self.controlled_vehicles[vehicle_id].destination:
-                            continue
-
-                        #print("{} now on: {}, records on {}; {} ".format(vehicle_id, current_edge, self.controlled_vehicles[vehicle_id].current_edge, current_edge!=self.controlled_vehicles[vehicle_id].current_edge))
-                        if current_edge != self.controlled_vehicles[vehicle_id].current_edge:
-                            self.controlled_vehicles[vehicle_id].current_edge = current_edge
-                            self.controlled_vehicles[vehicle_id].current_speed = traci.vehicle.getSpeed(vehicle_id)
-                            vehicles_to_direct.append(self.controlled_vehicles[vehicle_id])
+                if profiler is not None:
+                    profiler.begin_step(step)
+                # edge states are only fetched if the controller reads connection_info.edge_vehicle_count
+                # or connection_info.network_state during this step
+                self.network_state.advance(step)
+                # follow the departures and arrivals of the controlled vehicles, then collect the roads
+                # (and speeds, if subscribed) of the ones that entered a new road
+                tracker.update(step)
+                moved_roads, moved_speeds = tracker.moved()
+                if self.reroute_triggers is not None:
+                    self.reroute_triggers.forget(tracker.arrived)
+
+                vehicles_to_direct = self.select_vehicles_to_direct(moved_roads, moved_speeds)
+                if self.reroute_triggers is not None:
+                    vehicles_to_direct = self.reroute_triggers.due(vehicles_to_direct,
+                                                                   self.connection_info.edge_index_dict, step)
                 #print(len(vehicles_to_direct))
-                vehicle_decisions_by_id = self.route_controller.make_decisions(vehicles_to_direct, self.connection_info)
+                if profiler is not None:
+                    profiler.lap(profiling.COLLECT)
+                if parallel is not None:
+                    vehicle_decisions_by_id = parallel.decide(vehicles_to_direct, step,
+                                                              self.decision_mode == FULL_ROUTE)
+                elif self.decision_mode == FULL_ROUTE:
+                    vehicle_decisions_by_id = self.route_controller.make_route_decisions(vehicles_to_direct,
+                                                                                         self.connection_info)
+                else:
+                    vehicle_decisions_by_id = self.route_controller.make_decisions(vehicles_to_direct,
+                                                                                   self.connection_info)
+                recording = sim_log.recording()
+                if profiler is not None:
+                    profiler.record_decisions(self.route_controller, len(vehicles_to_direct),
+                                              profiler.lap(profiling.DECISIONS))
+                    profiler.count(profiling.VEHICLES_DIRECTED, len(vehicles_to_direct))
+                    profiler.count(profiling.DECISIONS_ISSUED, len(vehicle_decisions_by_id))
+                if self.decision_mode == FULL_ROUTE:
+                    self.apply_routes(vehicle_decisions_by_id, step, recording)
+                    vehicle_decisions_by_id = {}
                 for vehicle_id, local_target_edge in vehicle_decisions_by_id.items():
                     # if decision not in self.connection_info.outgoing_edges_dict[self.controlled_vehicles[vehicle_id].current_edge]:
                     #     raise ValueError(f'{decision} does not lead to a valid edge from edge '
@@ -101,47 +182,210 @@ class StrSumo:
                     #
                     # current_edge_of_vehicle = self.controlled_vehicles[vehicle_id].current_edge
                     # target_edge = self.connection_info.outgoing_edges_dict[current_edge_of_vehicle][decision]
-                    if vehicle_id in traci.vehicle.getIDList():
+                    # vehicles cannot leave the simulation before the next simulation step
+                    if vehicle_id in tracker.active:
                         #print("Changing the target of {} to {} with length {}".format(vehicle_id, local_target_edge, self.connection_info.edge_length_dict[local_target_edge]))
                         traci.vehicle.changeTarget(vehicle_id, local_target_edge)
                         self.controlled_vehicles[vehicle_id].local_destination = local_target_edge
+                        if recording:
+                            sim_log.record("target", step=step, vehicle=vehicle_id,
+                                           edge=self.controlled_vehicles[vehicle_id].current_edge,
+                                           target=local_target_edge)
+
+                if profiler is not None:
+                    profiler.lap(profiling.CHANGE_TARGET)
 
-                arrived_at_destination = traci.simulation.getArrivedIDList()
-
-                for vehicle_id in arrived_at_destination:
-                    if vehicle_id in self.controlled_vehicles:
-                        #print the raw result out to the terminal
-                        arrived_at_destination = False
-                        if self.controlled_vehicles[vehicle_id].local_destination == self.controlled_vehicles[vehicle_id].destination:
-                            arrived_at_destination = True
-                        time_span = step - self.controlled_vehicles[vehicle_id].start_time
-                        total_time += time_span
-                        miss = False
-                        if step > self.controlled_vehicles[vehicle_id].deadline:
-                            deadlines_missed.append(vehicle_id)
-                            miss = True
-                        end_number += 1
-                        print("Vehicle {} reaches the destination: {}, timespan: {}, deadline missed: {}"\
-                            .format(vehicle_id, arrived_at_destination, time_span, miss))
-                        #if not arrived_at_destination:
-                            #print("{} - {}".format(self.controlled_vehicles[vehicle_id].local_destination, self.controlled_vehicles[vehicle_id].destination))
+                time_spent, arrived = self.handle_arrivals(step, deadlines_missed)
+                total_time += time_spent
+                end_number += arrived
+                if profiler is not None:
+                    profiler.lap(profiling.ARRIVALS)
+                    profiler.count(profiling.ARRIVED, arrived)
+
+                if step == save_state_step:
+                    self.save_state(state_file, step, total_time, end_number, deadlines_missed)
+                    if stop_after_save:
+                        break
 
                 traci.simulationStep()
+                if profiler is not None:
+                    profiler.lap(profiling.SIMULATION_STEP)
+                    profiler.end_step()
                 step += 1
 
                 if step > MAX_SIMULATION_STEPS:
-                    print('Ending due to timeout.')
+                    logger.warning('Ending due to timeout.')
                     break
+            else:
+                # the vehicles arriving in the last simulation step are only reported after it
+                if profiler is not None:
+                    profiler.begin_step(step)
+                tracker.update(step)
+                time_spent, arrived = self.handle_arrivals(step, deadlines_missed)
+                total_time += time_spent
+                end_number += arrived
+                if profiler is not None:
+                    profiler.lap(profiling.ARRIVALS)
+                    profiler.count(profiling.ARRIVED, arrived)
+                    profiler.end_step()
 
         except ValueError as err:
-            print('Exception caught.')
-            print(err)
+            logger.error('Exception caught: %s', err)
+        finally:
+            if profiler is not None:
+                profiler.detach()
+            if parallel is not None:
+                parallel.stop()
 
         num_deadlines_missed = len(deadlines_missed)
 
         return total_time, end_number, num_deadlines_missed
 
+    def warm_up(self, save_state_step, state_file):
+        """
+        Simulates until save_state_step and saves the state there, so that runs of several route controllers
+        can all continue from it with run(start_state=state_file) instead of simulating the warm-up again.
+        Controlled vehicles departing before save_state_step are directed by this object's route controller.
+        :param save_state_step: step at which the state is saved
+        :param state_file: file name of the SUMO state, the StrSumo bookkeeping goes to state_file + ".json"
+        :returns: the results of the warm-up like run()
+        """
+        return self.run(save_state_step=save_state_step, state_file=state_file, stop_after_save=True)
+
+    def save_state(self, state_file, step, total_time, end_number, deadlines_missed):
+        """
+        Saves the SUMO state with traci.simulation.saveState, and the bookkeeping of run() that SUMO does not
+        know about (step, results so far and every controlled vehicle) as JSON next to it.
+        """
+        traci.simulation.saveState(state_file)
+        bookkeeping = {
+            "version": STATE_FORMAT_VERSION,
+            "step": step,
+            "total_time": total_time,
+            "end_number": end_number,
+            "deadlines_missed": deadlines_missed,
+            "vehicle_IDs_in_simulation": sorted(self.tracker.seen),
+            "vehicles": {vehicle_id: {"destination": vehicle.destination, "start_time": vehicle.start_time,
+                                      "deadline": vehicle.deadline, "current_edge": vehicle.current_edge,
+                                      "current_speed": vehicle.current_speed,
+                                      "local_destination": vehicle.local_destination}
+                         for vehicle_id, vehicle in self.controlled_vehicles.items()},
+        }
+        if self.reroute_triggers is not None:
+            bookkeeping["routes"] = self.reroute_triggers.to_dict()
+        with open(state_file + ".json", "w") as f:
+            json.dump(bookkeeping, f)
+
+    def load_state(self, state_file):
+        """
+        Loads a state written by save_state into the running simulation and restores the controlled vehicles,
+        creating the ones missing from self.controlled_vehicles. Subscriptions are not part of a SUMO state,
+        so the subscriptions of the controlled vehicles in the network and of the edges are made again.
+        :returns: (step, total time, number of arrived cars, deadlines missed)
+        """
+        with open(state_file + ".json") as f:
+            bookkeeping = json.load(f)
+        if bookkeeping.get("version") != STATE_FORMAT_VERSION:
+            raise ValueError("Unknown format of the state " + state_file)
+        traci.simulation.loadState(state_file)
+
+        for vehicle_id, fields in bookkeeping["vehicles"].items():
+            if vehicle_id not in self.controlled_vehicles:
+                self.controlled_vehicles[vehicle_id] = Vehicle(vehicle_id, fields["destination"],
+                                                               fields["start_time"], fields["deadline"],
+                                                               self.vehicle_table)
+            vehicle = self.controlled_vehicles[vehicle_id]
+            for name, value in fields.items():
+                setattr(vehicle, name, value)
+
+        self.tracker.restore(bookkeeping["vehicle_IDs_in_simulation"])
+        if self.reroute_triggers is not None:
+            # without committed routes (a state saved in LOCAL_TARGET mode) the vehicles decide on their next edge
+            self.reroute_triggers.load_dict(bookkeeping.get("routes", {}))
+        self.network_state.reset_subscription()
+
+        return bookkeeping["step"], bookkeeping["total_time"], bookkeeping["end_number"], bookkeeping["deadlines_missed"]
+
+    def handle_arrivals(self, step, deadlines_missed):
+        """
+        Records the controlled vehicles that arrived in the last simulation step, as found by tracker.update.
+        :param step: current step number
+        :param deadlines_missed: list of the ids of the vehicles that missed their deadline, extended in place
+        :return: (sum of the time spans of the arrived vehicles, number of arrived vehicles)
+        """
+        arrived = self.tracker.arrived # controlled vehicles only
+        if not arrived:
+            return 0, 0
+        table = self.vehicle_table
+        rows = table.rows(arrived)
+        time_spans = step - table.start_time[rows]
+        missed = step > table.deadline[rows]
+        deadlines_missed.extend(vehicle_id for vehicle_id, miss in zip(arrived, missed.tolist()) if miss)
+
+        recording = sim_log.recording()
+        if recording or logger.isEnabledFor(logging.DEBUG):
+            #log the raw result, shown with the DEBUG level
+            reached = table.local_destination[rows] == table.destination[rows]
+            for vehicle_id, arrived_at_destination, time_span, miss in zip(arrived, reached.tolist(),
+                                                                            time_spans.tolist(), missed.tolist()):
+                logger.debug("Vehicle %s reaches the destination: %s, timespan: %s, deadline missed: %s",
+                             vehicle_id, arrived_at_destination, time_span, miss)
+                if recording:
+                    sim_log.record("arrival", step=step, vehicle=vehicle_id, destination_reached=arrived_at_destination,
+                                   time_span=time_span, deadline_missed=miss)
+
+        return float(time_spans.sum()), len(arrived)
+
+    def apply_routes(self, routes, step, recording):
+        """
+        Replaces the routes of the vehicles in SUMO and commits them to the new routes.
+        :param routes: {vehicle id: [edge id]} returned by make_route_decisions
+        """
+        edge_index = self.connection_info.edge_index_dict
+        for vehicle_id, route in routes.items():
+            # vehicles cannot leave the simulation before the next simulation step
+            if vehicle_id not in self.tracker.active or not route:
+                continue
+            traci.vehicle.setRoute(vehicle_id, route)
+            self.controlled_vehicles[vehicle_id].local_destination = route[-1]
+            self.reroute_triggers.commit(vehicle_id, route, edge_index, step)
+            if recording:
+                sim_log.record("route", step=step, vehicle=vehicle_id, route=route)
+
+    def select_vehicles_to_direct(self, moved_roads, moved_speeds):
+        """
+        Finds the controlled vehicles that entered an edge of the network other than their destination and
+        the edge they were last directed on, evaluated on the columns of the vehicle table, and records their
+        new edge and speed in it.
+        :param moved_roads: {vehicle id: road id} of the controlled vehicles that changed road, see ControlledVehicleTracker.moved
+        :param moved_speeds: {vehicle id: speed} of these vehicles, None to query the speeds of the selected ones
+        :return: list of the Vehicles to pass to make_decisions, in the order of moved_roads
+        """
+        if not moved_roads:
+            return []
+        table = self.vehicle_table
+        edge_index = self.connection_info.edge_index_dict
+        vehicle_ids = list(moved_roads)
+        rows = table.rows(vehicle_ids)
+        edges = np.fromiter((edge_index.get(road, NO_EDGE) for road in moved_roads.values()), dtype=np.int64,
+                            count=len(vehicle_ids))
+        # roads outside the network (junctions) and the destination need no decision
+        selected = np.flatnonzero((edges != NO_EDGE) & (edges != table.destination[rows])
+                                  & (edges != table.current_edge[rows])).tolist()
+        if not selected:
+            return []
+        selected_ids = [vehicle_ids[i] for i in selected]
+        selected_rows = rows[selected]
+        table.current_edge[selected_rows] = edges[selected]
+        if moved_speeds is not None:
+            table.current_speed[selected_rows] = [moved_speeds[vehicle_id] for vehicle_id in selected_ids]
+        else:
+            table.current_speed[selected_rows] = [traci.vehicle.getSpeed(vehicle_id) for vehicle_id in selected_ids]
+        return [self.controlled_vehicles[vehicle_id] for vehicle_id in selected_ids]
+
     def get_edge_vehicle_counts(self):
-        for edge in self.connection_info.edge_list:
-            self.connection_info.edge_vehicle_count[edge] = traci.edge.getLastStepVehicleNumber(edge)
+        """
+        :return: {edge_id: number of vehicles at edge} of the current step, read from the network snapshot
+        """
+        return dict(self.connection_info.edge_vehicle_count)
 
@@ -7,23 +7,98 @@ else:
     sys.exit("No environment variable SUMO_HOME!")
 from sumolib import net
 import sumolib
+from core.compiled_graph import CompiledGraph
+from core import map_bundle
+from core.vehicle_table import VehicleTable
 
 class Vehicle:
-    def __init__(self, vehicle_id, destination, start_time, deadline):
+    """
+    A controlled vehicle, stored as a row of a VehicleTable (see vehicle_table.py).
+    """
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, vehicle_id, destination, start_time, deadline, table=None):
         """
         Args:
                 vehicle_id:         type: string. The id of the vehicle.
                 destination:        type: string. The id of the edge where the vehicle targets.
                 start_time:         type: float. The step # when the vehicle is released. This value will be updated by STR_SUMO.
                 deadline:           type: float. The deadline for this vehicle to reach the end of the target edge.
+                table:              type: VehicleTable. The table to add the vehicle to, a table of its own if None.
+                                    StrSumo gathers the controlled vehicles into one table anyway.
         """
-        self.vehicle_id = vehicle_id
-        self.destination = destination
-        self.start_time = start_time
-        self.deadline = deadline
-        self.current_edge = ""
-        self.current_speed = 0.0
-        self.local_destination = ""
+        if table is None:
+            table = VehicleTable()
+        self._table = table
+        self._row = table.append(vehicle_id, destination, start_time, deadline)
+
+    @classmethod
+    def view(cls, table, row):
+        """
+        :return: a Vehicle viewing an existing row of table, e.g. in a worker of parallel_decisions.py
+        """
+        vehicle = cls.__new__(cls)
+        vehicle._table = table
+        vehicle._row = row
+        return vehicle
+
+    def __getstate__(self):
+        return self._table, self._row
+
+    def __setstate__(self, state):
+        self._table, self._row = state
+
+    @property
+    def vehicle_id(self):
+        return self._table.vehicle_ids[self._row]
+
+    @property
+    def destination(self):
+        return self._table.edge_id(self._table.destination[self._row])
+
+    @destination.setter
+    def destination(self, edge_id):
+        self._table.destination[self._row] = self._table.edge(edge_id)
+
+    @property
+    def start_time(self):
+        return float(self._table.start_time[self._row])
+
+    @start_time.setter
+    def start_time(self, value):
+        self._table.start_time[self._row] = value
+
+    @property
+    def deadline(self):
+        return float(self._table.deadline[self._row])
+
+    @deadline.setter
+    def deadline(self, value):
+        self._table.deadline[self._row] = value
+
+    @property
+    def current_edge(self):
+        return self._table.edge_id(self._table.current_edge[self._row])
+
+    @current_edge.setter
+    def current_edge(self, edge_id):
+        self._table.current_edge[self._row] = self._table.edge(edge_id)
+
+    @property
+    def current_speed(self):
+        return float(self._table.current_speed[self._row])
+
+    @current_speed.setter
+    def current_speed(self, value):
+        self._table.current_speed[self._row] = value
+
+    @property
+    def local_destination(self):
+        return self._table.edge_id(self._table.local_destination[self._row])
+
+    @local_destination.setter
+    def local_destination(self, edge_id):
+        self._table.local_destination[self._row] = self._table.edge(edge_id)
 
 
 class ConnectionInfo:
@@ -36,50 +111,45 @@ class ConnectionInfo:
         - edge_index_dict {edge_index_dict} keep track of edge ids by an index
         - edge_vehicle_count {edge_id: number of vehicles at edge}
         - edge_list [edge_id]
+        - network_state NetworkSnapshot of the current step with NumPy arrays aligned with graph, set by StrSumo
+        - graph CompiledGraph with dense edge indices, CSR successor arrays and a length vector;
+          the dictionaries above are built from it, so edge_index_dict[edge_id] is the row of the edge in it
+        - map_bundle MapBundle the graph was loaded from, holding the tables derived from it; None without use_bundle
     :param net_file: file name of a SUMO network file, e.g. 'test.net.xml'
+    :param use_bundle: load the compiled map from the map bundle cache (see map_bundle.py) instead of parsing net_file
     """
-    def __init__(self, net_file):
+    def __init__(self, net_file, use_bundle=True):
         self.net_filename = net_file
-        net = sumolib.net.readNet(net_file)
-        self.outgoing_edges_dict = {}
-        self.edge_length_dict = {}
-        self.edge_index_dict = {}
+        if use_bundle:
+            self.map_bundle = map_bundle.load_map_bundle(net_file)
+            self.graph = self.map_bundle.graph()
+        else:
+            self.map_bundle = None
+            net = sumolib.net.readNet(net_file)
+            self.graph = CompiledGraph.from_net(net)
+        self._index_graph()
+
+    @classmethod
+    def from_graph(cls, graph, net_file=None, bundle=None):
+        """
+        Builds the network information of an already compiled graph without reading net_file,
+        e.g. of a graph viewing shared memory (see parallel_decisions.py).
+        :param graph: the CompiledGraph
+        :param net_file: file name of the SUMO network file the graph was compiled from, if any
+        :param bundle: the MapBundle of the graph, if any
+        """
+        connection_info = cls.__new__(cls)
+        connection_info.net_filename = net_file
+        connection_info.map_bundle = bundle
+        connection_info.graph = graph
+        connection_info._index_graph()
+        return connection_info
+
+    def _index_graph(self):
+        # the dictionaries are thin views of the compiled arrays for the controllers using edge ids
+        self.edge_index_dict = self.graph.edge_index
+        self.outgoing_edges_dict = self.graph.outgoing_edges_dict()
+        self.edge_length_dict = self.graph.edge_length_dict()
+        self.edge_list = self.graph.passenger_edge_ids()
         self.edge_vehicle_count = {}
-        self.edge_list = []
-
-        edge_index = 0
-
-        edges = net.getEdges()
-
-        # collect edge information into dictionaries
-        for current_edge in edges:
-            current_edge_id = current_edge.getID()
-
-            # add edge to edge list if it allows passenger vehicles
-            # "passenger" is a SUMO defined vehicle class
-            if current_edge.allows("passenger"):
-                self.edge_list.append(current_edge_id)
-
-            if current_edge_id in self.edge_index_dict.keys():
-                print(current_edge_id + "already exists!")
-            else:
-                self.edge_index_dict[current_edge_id] = edge_index
-                edge_index += 1
-            if current_edge_id in self.outgoing_edges_dict.keys():
-                print(current_edge_id + "already exists!")
-            else:
-                self.outgoing_edges_dict[current_edge_id] = {}
-            if current_edge_id in self.edge_length_dict.keys():
-                print(current_edge_id + "already exists!")
-            else:
-                self.edge_length_dict[current_edge_id] = current_edge.getLength()
-
-            # collect outgoing edges by direction
-            outgoing_edges = current_edge.getOutgoing()
-            for current_outgoing_edge in outgoing_edges:
-                if not current_outgoing_edge.allows("passenger"):
-                    continue
-                connections = current_edge.getConnections(current_outgoing_edge)
-                for connection in connections:
-                    direction = connection.getDirection()
-                    self.outgoing_edges_dict[current_edge_id][direction] = current_outgoing_edge.getID()
+        self.network_state = None
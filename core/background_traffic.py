@@ -0,0 +1,49 @@
+"""
+    This file contains the in-process generator of the uncontrolled
+    (background) vehicles, replacing the randomTrips.py subprocess.
+"""
+
+import numpy as np
+from core import route_files
+from core.shortest_path import ShortestPathTreeCache
+
+MIN_SPEED = 0.1 # m/s, keeps the free-flow travel time of edges without speed limit finite
+
+
+def generate_background_routes(graph, reachability, num_vehicles, route_file, end_time=50.0, seed=None):
+    """
+        param @graph <CompiledGraph>: the compiled map.
+        param @reachability <ReachabilityIndex>: the reachability index of @graph.
+        param @num_vehicles <int>: the exact number of background vehicles to generate.
+        param @route_file <str>: the route file to write, compressed if the name ends with '.gz'.
+        param @end_time <float>: the vehicles depart evenly spaced in [0, @end_time).
+        param @seed <int>: seed of the NumPy random generator, None for an unseeded one.
+
+        Samples @num_vehicles origin-destination pairs of distinct, connected passenger edges
+        (uniformly among all such pairs, vectorized with NumPy), routes each vehicle along the
+        free-flow fastest path like duarouter does, and writes the vehicles sorted by departure
+        time into @route_file. The vehicles are numbered 0 to @num_vehicles - 1.
+        Returns the number of vehicles written, 0 if the map has no connected pair of edges.
+    """
+    if num_vehicles <= 0:
+        route_files.write_route_file(route_file, [])
+        return 0
+    rng = np.random.default_rng(seed)
+    sampled = reachability.sample_pairs(num_vehicles, rng)
+    if sampled is None:
+        route_files.write_route_file(route_file, [])
+        return 0
+    starts, destinations = sampled
+    departs = np.arange(num_vehicles) * (end_time / float(num_vehicles))
+
+    # one reverse tree per destination answers every vehicle heading there
+    trees = ShortestPathTreeCache(graph)
+    trees.set_weights(graph.lengths / np.maximum(graph.speeds, MIN_SPEED))
+    routes = [None] * num_vehicles
+    for i in np.argsort(destinations, kind="stable").tolist():
+        _, path, _ = trees.tree(int(destinations[i])).search(int(starts[i]))
+        routes[i] = [graph.edge_ids[index] for index in path]
+
+    route_files.write_route_file(route_file, (route_files.routed_vehicle_element(i, departs[i], routes[i])
+                                              for i in range(num_vehicles)))
+    return num_vehicles
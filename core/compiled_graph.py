@@ -0,0 +1,175 @@
+"""
+    This file contains the compiled, integer-indexed representation of a
+    traffic network that routing engines use instead of the string-keyed
+    dictionaries of ConnectionInfo.
+"""
+
+import numpy as np
+
+STRAIGHT = "s"
+TURN_AROUND = "t"
+LEFT = "l"
+RIGHT = "r"
+SLIGHT_LEFT = "L"
+SLIGHT_RIGHT = "R"
+
+# direction codes stored in CompiledGraph.succ_dir index into this list.
+# The order matches RouteController.direction_choices.
+DIRECTION_NAMES = [STRAIGHT, TURN_AROUND, SLIGHT_RIGHT, RIGHT, SLIGHT_LEFT, LEFT]
+
+
+class CompiledGraph:
+    """
+    Stores the map as dense arrays indexed by an integer edge index.
+    Available collections:
+        - edge_ids [edge_id] edge id of every edge index
+        - edge_index {edge_id: edge_index}
+        - lengths float64[n] length of every edge
+        - speeds float64[n] speed limit of every edge
+        - lane_counts int32[n] number of lanes of every edge
+        - passenger bool[n] whether the edge allows passenger vehicles
+        - passenger_edges int32[p] indices of the edges allowing passenger vehicles
+        - succ_ptr int32[n+1], succ_edge int32[m], succ_dir int8[m]
+            CSR successor lists: the successors of edge i are succ_edge[succ_ptr[i]:succ_ptr[i+1]],
+            reached by taking the direction direction_names[succ_dir[k]]
+    Only successors allowing passenger vehicles are stored, one per direction.
+    """
+    def __init__(self, edge_ids, lengths, speeds, lane_counts, passenger, succ_ptr, succ_edge, succ_dir,
+                 direction_names=None):
+        self.edge_ids = list(edge_ids)
+        self.edge_index = {edge_id: index for index, edge_id in enumerate(self.edge_ids)}
+        self.lengths = np.asarray(lengths, dtype=np.float64)
+        self.speeds = np.asarray(speeds, dtype=np.float64)
+        self.lane_counts = np.asarray(lane_counts, dtype=np.int32)
+        self.passenger = np.asarray(passenger, dtype=bool)
+        self.passenger_edges = np.flatnonzero(self.passenger).astype(np.int32)
+        self.succ_ptr = np.asarray(succ_ptr, dtype=np.int32)
+        self.succ_edge = np.asarray(succ_edge, dtype=np.int32)
+        self.succ_dir = np.asarray(succ_dir, dtype=np.int8)
+        self.direction_names = list(direction_names if direction_names is not None else DIRECTION_NAMES)
+        self.direction_codes = {name: code for code, name in enumerate(self.direction_names)}
+        self._adjacency_lists = None
+        self._reverse_adjacency_lists = None
+
+    @classmethod
+    def from_net(cls, net):
+        """
+        Compiles a sumolib.net.Net into a CompiledGraph.
+        :param net: the sumolib.net.Net read from a SUMO network file
+        :return: the compiled graph
+        """
+        edges = net.getEdges()
+        edge_ids = []
+        edge_index = {}
+        for current_edge in edges:
+            current_edge_id = current_edge.getID()
+            if current_edge_id in edge_index:
+                print(current_edge_id + " already exists!")
+                continue
+            edge_index[current_edge_id] = len(edge_ids)
+            edge_ids.append(current_edge_id)
+
+        n = len(edge_ids)
+        lengths = np.zeros(n, dtype=np.float64)
+        speeds = np.zeros(n, dtype=np.float64)
+        lane_counts = np.zeros(n, dtype=np.int32)
+        passenger = np.zeros(n, dtype=bool)
+        direction_names = list(DIRECTION_NAMES)
+        direction_codes = {name: code for code, name in enumerate(direction_names)}
+        successors = [None] * n
+
+        for current_edge in edges:
+            index = edge_index[current_edge.getID()]
+            if successors[index] is not None:
+                continue
+            lengths[index] = current_edge.getLength()
+            speeds[index] = current_edge.getSpeed()
+            lane_counts[index] = current_edge.getLaneNumber()
+            # "passenger" is a SUMO defined vehicle class
+            passenger[index] = current_edge.allows("passenger")
+
+            # collect outgoing edges by direction, a later connection overrides an earlier one
+            outgoing_by_direction = {}
+            for current_outgoing_edge in current_edge.getOutgoing():
+                if not current_outgoing_edge.allows("passenger"):
+                    continue
+                for connection in current_edge.getConnections(current_outgoing_edge):
+                    direction = connection.getDirection()
+                    if direction not in direction_codes:
+                        direction_codes[direction] = len(direction_names)
+                        direction_names.append(direction)
+                    outgoing_by_direction[direction] = edge_index[current_outgoing_edge.getID()]
+            successors[index] = outgoing_by_direction
+
+        succ_ptr = np.zeros(n + 1, dtype=np.int32)
+        succ_edge = []
+        succ_dir = []
+        for index in range(n):
+            for direction, outgoing_index in successors[index].items():
+                succ_edge.append(outgoing_index)
+                succ_dir.append(direction_codes[direction])
+            succ_ptr[index + 1] = len(succ_edge)
+
+        return cls(edge_ids, lengths, speeds, lane_counts, passenger, succ_ptr,
+                   np.array(succ_edge, dtype=np.int32), np.array(succ_dir, dtype=np.int8), direction_names)
+
+    @property
+    def num_edges(self):
+        return len(self.edge_ids)
+
+    def successors(self, index):
+        """
+        :param index: edge index
+        :return: list of (direction_code, successor_index) pairs of the edge
+        """
+        start, end = self.succ_ptr[index], self.succ_ptr[index + 1]
+        return list(zip(self.succ_dir[start:end].tolist(), self.succ_edge[start:end].tolist()))
+
+    def adjacency_lists(self):
+        """
+        Returns the CSR arrays and the lengths as plain Python lists.
+        Indexing lists is much cheaper than indexing NumPy arrays from pure-Python search loops.
+        :return: (succ_ptr, succ_edge, succ_dir, lengths)
+        """
+        if self._adjacency_lists is None:
+            self._adjacency_lists = (self.succ_ptr.tolist(), self.succ_edge.tolist(),
+                                     self.succ_dir.tolist(), self.lengths.tolist())
+        return self._adjacency_lists
+
+    def reverse_adjacency_lists(self):
+        """
+        Returns the predecessor lists (the transposed CSR arrays) as plain Python lists.
+        The predecessors of edge i are pred_edge[pred_ptr[i]:pred_ptr[i+1]], entering i by direction pred_dir[k].
+        :return: (pred_ptr, pred_edge, pred_dir)
+        """
+        if self._reverse_adjacency_lists is None:
+            sources = np.repeat(np.arange(self.num_edges, dtype=np.int32), np.diff(self.succ_ptr))
+            order = np.argsort(self.succ_edge, kind="stable")
+            pred_ptr = np.zeros(self.num_edges + 1, dtype=np.int32)
+            np.cumsum(np.bincount(self.succ_edge, minlength=self.num_edges), out=pred_ptr[1:])
+            self._reverse_adjacency_lists = (pred_ptr.tolist(), sources[order].tolist(),
+                                             self.succ_dir[order].tolist())
+        return self._reverse_adjacency_lists
+
+    def outgoing_edges_dict(self):
+        """
+        :return: {edge_id: {direction: out_edge}} built from the CSR arrays
+        """
+        succ_ptr, succ_edge, succ_dir, _ = self.adjacency_lists()
+        outgoing_edges = {}
+        for index, edge_id in enumerate(self.edge_ids):
+            outgoing_edges[edge_id] = {self.direction_names[succ_dir[k]]: self.edge_ids[succ_edge[k]]
+                                       for k in range(succ_ptr[index], succ_ptr[index + 1])}
+        return outgoing_edges
+
+    def edge_length_dict(self):
+        """
+        :return: {edge_id: edge_length} built from the length vector
+        """
+        return dict(zip(self.edge_ids, self.lengths.tolist()))
+
+    def passenger_edge_ids(self):
+        """
+        :return: [edge_id] of the edges allowing passenger vehicles, in index order
+        """
+        return [self.edge_ids[index] for index in self.passenger_edges.tolist()]
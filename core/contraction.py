@@ -0,0 +1,324 @@
+"""
+    This file contains the contraction hierarchy of a map and its bidirectional
+    query. The hierarchy is built on the turn graph of the CompiledGraph (one
+    node per edge, one arc per direction-labelled connection), so turn
+    restrictions are respected and every original arc keeps the direction code
+    compute_local_target expects.
+
+    Edges are contracted one by one in the order of their importance; when an
+    edge is contracted, a shortcut arc replaces every shortest path through it
+    between two of its remaining neighbours. A query only has to search upwards
+    in this order from both ends, which settles far fewer edges than a search
+    over the whole map. The hierarchy only holds for the edge lengths, it is
+    built once per map and stored with the map bundle (see
+    MapBundle.contraction_hierarchy).
+"""
+
+import heapq
+import numpy as np
+from core.shortest_path import ShortestPathEngine, INFINITY
+
+# settled edges after which a witness search gives up; a missed witness only costs a superfluous shortcut
+WITNESS_SETTLE_LIMIT = 60
+
+NO_MIDDLE = -1 # middle of an original arc, i.e. not a shortcut
+
+
+def _witness_costs(out_arcs, contracted, source, skipped, max_cost):
+    # bounded Dijkstra from source over the remaining edges without skipped
+    distance = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = 0
+    while heap and settled < WITNESS_SETTLE_LIMIT:
+        current_distance, current = heapq.heappop(heap)
+        if current_distance > distance[current]:
+            continue
+        if current_distance > max_cost:
+            break
+        settled += 1
+        for neighbor, (cost, _) in out_arcs[current].items():
+            if neighbor == skipped or contracted[neighbor]:
+                continue
+            new_distance = current_distance + cost
+            if new_distance < distance.get(neighbor, INFINITY):
+                distance[neighbor] = new_distance
+                heapq.heappush(heap, (new_distance, neighbor))
+    return distance
+
+
+def _shortcuts(out_arcs, in_arcs, contracted, node):
+    # the shortcuts needed to contract node: [(tail, head, cost)]
+    shortcuts = []
+    outgoing = [(head, cost) for head, (cost, _) in out_arcs[node].items() if not contracted[head] and head != node]
+    if not outgoing:
+        return shortcuts
+    max_out = max(cost for _, cost in outgoing)
+    for tail, (in_cost, _) in in_arcs[node].items():
+        if contracted[tail] or tail == node:
+            continue
+        distance = _witness_costs(out_arcs, contracted, tail, node, in_cost + max_out)
+        for head, out_cost in outgoing:
+            if head == tail:
+                continue
+            cost = in_cost + out_cost
+            if distance.get(head, INFINITY) > cost:
+                shortcuts.append((tail, head, cost))
+    return shortcuts
+
+
+def _row_of(ptr, k):
+    # the row of CSR entry k, i.e. the largest i with ptr[i] <= k
+    low, high = 0, len(ptr) - 1
+    while high - low > 1:
+        mid = (low + high) // 2
+        if ptr[mid] <= k:
+            low = mid
+        else:
+            high = mid
+    return low
+
+
+class ContractionHierarchy:
+    """
+    The arcs of a contraction hierarchy, split by the rank of their ends into two CSR arrays.
+    Available arrays:
+        - rank int32[n] contraction order of every edge
+        - up_ptr int32[n+1], up_head int32[a], up_cost float64[a], up_middle int32[a], up_dir int8[a]
+            arcs u -> up_head[k] to higher ranked edges, for k in up_ptr[u]:up_ptr[u+1]
+        - down_ptr int32[n+1], down_tail int32[b], down_cost float64[b], down_middle int32[b], down_dir int8[b]
+            arcs down_tail[k] -> w from higher ranked edges, stored at w for k in down_ptr[w]:down_ptr[w+1]
+    The middle of a shortcut is the edge it was added for, NO_MIDDLE for original arcs;
+    the direction is the direction code of an original arc, -1 for shortcuts.
+    """
+    ARRAYS = ("rank", "up_ptr", "up_head", "up_cost", "up_middle", "up_dir",
+              "down_ptr", "down_tail", "down_cost", "down_middle", "down_dir")
+
+    def __init__(self, **arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def build(cls, graph):
+        """
+        Contracts the edges in the order of their edge difference (shortcuts added minus arcs removed), the number
+        of contracted neighbours and their depth in the hierarchy, updated lazily.
+        :param graph: the CompiledGraph of the map
+        """
+        succ_ptr, succ_edge, succ_dir, lengths = graph.adjacency_lists()
+        n = graph.num_edges
+        # {head: (cost, middle or direction code)} per tail and {tail: ...} per head; entering an edge costs its length
+        out_arcs = [dict() for _ in range(n)]
+        in_arcs = [dict() for _ in range(n)]
+        for tail in range(n):
+            for k in range(succ_ptr[tail], succ_ptr[tail + 1]):
+                head = succ_edge[k]
+                if head not in out_arcs[tail]:
+                    out_arcs[tail][head] = in_arcs[head][tail] = (lengths[head], ~succ_dir[k])
+        contracted = [False] * n
+        contracted_neighbors = [0] * n
+        level = [0] * n # depth of the edge in the hierarchy so far
+
+        def priority(node, shortcuts):
+            removed = sum(1 for head in out_arcs[node] if not contracted[head]) + \
+                      sum(1 for tail in in_arcs[node] if not contracted[tail])
+            return 2 * len(shortcuts) - removed + contracted_neighbors[node] + level[node]
+
+        heap = [(priority(node, _shortcuts(out_arcs, in_arcs, contracted, node)), node) for node in range(n)]
+        heapq.heapify(heap)
+        rank = [0] * n
+        next_rank = 0
+        while heap:
+            _, node = heapq.heappop(heap)
+            if contracted[node]:
+                continue
+            shortcuts = _shortcuts(out_arcs, in_arcs, contracted, node)
+            current = priority(node, shortcuts)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, node))
+                continue
+            for tail, head, cost in shortcuts:
+                existing = out_arcs[tail].get(head)
+                if existing is None or cost < existing[0]:
+                    out_arcs[tail][head] = in_arcs[head][tail] = (cost, node)
+            contracted[node] = True
+            rank[node] = next_rank
+            next_rank += 1
+            for neighbor in set(out_arcs[node]) | set(in_arcs[node]):
+                contracted_neighbors[neighbor] += 1
+                level[neighbor] = max(level[neighbor], level[node] + 1)
+
+        # an arc is kept at its lower ranked end, in the up arrays if it leads upwards
+        up = [[] for _ in range(n)]
+        down = [[] for _ in range(n)]
+        for tail in range(n):
+            for head, (cost, label) in out_arcs[tail].items():
+                middle, direction = (label, -1) if label >= 0 else (NO_MIDDLE, ~label)
+                if rank[head] > rank[tail]:
+                    up[tail].append((head, cost, middle, direction))
+                elif rank[head] < rank[tail]:
+                    down[head].append((tail, cost, middle, direction))
+        arrays = {"rank": np.array(rank, dtype=np.int32)}
+        for prefix, other, arcs in (("up", "head", up), ("down", "tail", down)):
+            arrays[prefix + "_ptr"] = np.cumsum([0] + [len(row) for row in arcs]).astype(np.int32)
+            flat = [arc for row in arcs for arc in row]
+            arrays[prefix + "_" + other] = np.array([arc[0] for arc in flat], dtype=np.int32)
+            arrays[prefix + "_cost"] = np.array([arc[1] for arc in flat], dtype=np.float64)
+            arrays[prefix + "_middle"] = np.array([arc[2] for arc in flat], dtype=np.int32)
+            arrays[prefix + "_dir"] = np.array([arc[3] for arc in flat], dtype=np.int8)
+        return cls(**arrays)
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(**{name: arrays[name] for name in cls.ARRAYS})
+
+    @property
+    def num_shortcuts(self):
+        return int(np.count_nonzero(np.asarray(self.up_middle) >= 0) +
+                   np.count_nonzero(np.asarray(self.down_middle) >= 0))
+
+
+class ContractionHierarchyEngine(ShortestPathEngine):
+    """
+    Bidirectional query over a ContractionHierarchy, a drop-in replacement of ShortestPathEngine for the edge
+    lengths: the forward search from the start edge and the backward search from the destination only follow
+    arcs to higher ranked edges, the shortcuts of the best meeting point are unpacked into the original edges.
+    With other weights the search falls back to Dijkstra's algorithm.
+    :param graph: the CompiledGraph of the map, e.g. connection_info.graph
+    :param hierarchy: the ContractionHierarchy of the map, e.g. MapBundle.contraction_hierarchy()
+    """
+    def __init__(self, graph, hierarchy):
+        super().__init__(graph)
+        self.hierarchy = hierarchy
+        self._rank = np.asarray(hierarchy.rank).tolist()
+        self._up = [np.asarray(getattr(hierarchy, "up_" + name)).tolist()
+                    for name in ("ptr", "head", "cost", "middle", "dir")]
+        self._down = [np.asarray(getattr(hierarchy, "down_" + name)).tolist()
+                      for name in ("ptr", "tail", "cost", "middle", "dir")]
+        n = graph.num_edges
+        self._back_dist = [INFINITY] * n
+        self._back_pred = [-1] * n # arc index into the down arrays leading towards the destination
+        self._back_visited_in = [0] * n
+        self.settled = 0 # edges settled by the last query, both directions
+
+    def search(self, source, target, weights=None):
+        """
+        Runs the bidirectional upward searches from source and target.
+        :param source: edge index of the start edge
+        :param target: edge index of the destination edge
+        :param weights: optional per-edge costs; the hierarchy only holds for the edge lengths,
+                        so any other weights are searched with Dijkstra's algorithm
+        :return: (cost, edge index path from source to target, direction code list), or None if unreachable
+        """
+        if weights is not None and weights is not self._lengths:
+            return super().search(source, target, weights)
+        if source == target:
+            self.settled = 0
+            return 0.0, [source], []
+        up_ptr, up_head, up_cost = self._up[0], self._up[1], self._up[2]
+        down_ptr, down_tail, down_cost = self._down[0], self._down[1], self._down[2]
+        # the forward search keeps the arc it came by in _pred
+        dist, pred, visited_in = self._dist, self._pred, self._visited_in
+        back_dist, back_pred, back_visited_in = self._back_dist, self._back_pred, self._back_visited_in
+        self._query += 1
+        query = self._query
+
+        visited_in[source] = back_visited_in[target] = query
+        dist[source] = back_dist[target] = 0.0
+        pred[source] = back_pred[target] = -1
+        forward_heap = [(0.0, source)]
+        backward_heap = [(0.0, target)]
+        best, meeting = INFINITY, -1
+        settled = 0
+        while forward_heap or backward_heap:
+            forward = bool(forward_heap) and (not backward_heap or forward_heap[0][0] <= backward_heap[0][0])
+            if forward:
+                current_distance, current = heapq.heappop(forward_heap)
+                if current_distance >= best:
+                    forward_heap = []
+                    continue
+                if current_distance > dist[current]:
+                    continue
+                settled += 1
+                if back_visited_in[current] == query and current_distance + back_dist[current] < best:
+                    best, meeting = current_distance + back_dist[current], current
+                for k in range(up_ptr[current], up_ptr[current + 1]):
+                    head = up_head[k]
+                    new_distance = current_distance + up_cost[k]
+                    if visited_in[head] != query or new_distance < dist[head]:
+                        visited_in[head] = query
+                        dist[head] = new_distance
+                        pred[head] = k
+                        heapq.heappush(forward_heap, (new_distance, head))
+            else:
+                current_distance, current = heapq.heappop(backward_heap)
+                if current_distance >= best:
+                    backward_heap = []
+                    continue
+                if current_distance > back_dist[current]:
+                    continue
+                settled += 1
+                if visited_in[current] == query and current_distance + dist[current] < best:
+                    best, meeting = current_distance + dist[current], current
+                for k in range(down_ptr[current], down_ptr[current + 1]):
+                    tail = down_tail[k]
+                    new_distance = current_distance + down_cost[k]
+                    if back_visited_in[tail] != query or new_distance < back_dist[tail]:
+                        back_visited_in[tail] = query
+                        back_dist[tail] = new_distance
+                        back_pred[tail] = k
+                        heapq.heappush(backward_heap, (new_distance, tail))
+
+        self.settled = settled
+        if meeting < 0:
+            return None
+        return (best,) + self._unpack_path(source, target, meeting)
+
+    def _unpack_path(self, source, target, meeting):
+        # hierarchy arcs from source to meeting and from meeting to target, as (tail, head, middle, direction)
+        up_ptr, up_middle, up_dir = self._up[0], self._up[3], self._up[4]
+        down_ptr, down_middle, down_dir = self._down[0], self._down[3], self._down[4]
+        arcs = []
+        current = meeting
+        while current != source:
+            k = self._pred[current]
+            tail = _row_of(up_ptr, k)
+            arcs.append((tail, current, up_middle[k], up_dir[k]))
+            current = tail
+        arcs.reverse()
+        current = meeting
+        while current != target:
+            k = self._back_pred[current]
+            head = _row_of(down_ptr, k)
+            arcs.append((current, head, down_middle[k], down_dir[k]))
+            current = head
+
+        path = [source]
+        directions = []
+        stack = arcs[::-1]
+        while stack:
+            tail, head, middle, direction = stack.pop()
+            if middle == NO_MIDDLE:
+                path.append(head)
+                directions.append(direction)
+            else:
+                # the shortcut stands for tail -> middle -> head, middle ranks below both ends
+                stack.append(self._arc(middle, head))
+                stack.append(self._arc(tail, middle))
+        return path, directions
+
+    def _arc(self, tail, head):
+        # the hierarchy arc tail -> head as (tail, head, middle, direction)
+        if self._rank[head] > self._rank[tail]:
+            up_ptr, up_head, _, up_middle, up_dir = self._up
+            for k in range(up_ptr[tail], up_ptr[tail + 1]):
+                if up_head[k] == head:
+                    return tail, head, up_middle[k], up_dir[k]
+        else:
+            down_ptr, down_tail, _, down_middle, down_dir = self._down
+            for k in range(down_ptr[head], down_ptr[head + 1]):
+                if down_tail[k] == tail:
+                    return tail, head, down_middle[k], down_dir[k]
+        raise ValueError("No arc from edge %d to edge %d in the contraction hierarchy" % (tail, head))
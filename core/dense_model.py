@@ -0,0 +1,213 @@
+"""
+    This file contains a NumPy implementation of the forward pass of the
+    fully connected Keras models used by the learned routing policies, so that
+    a trained .h5 model can make decisions without importing TensorFlow.
+
+    The weights are read from the .h5 file once with h5py and stored next to it
+    in a compact .npz file (<model>.<precision>.npz), which later runs load
+    instead of the .h5 file as long as the .h5 file does not change.
+"""
+
+import json
+import os
+import numpy as np
+from core import sim_log
+
+logger = sim_log.get_logger("dense_model")
+
+PRECISIONS = ("float32", "int8")
+CONVERTED_FORMAT_VERSION = 1
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "sigmoid": lambda x: 0.5 * (np.tanh(0.5 * x) + 1),
+    "tanh": np.tanh,
+    "softmax": lambda x: _softmax(x),
+}
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def _text(value):
+    # h5py gives attributes as bytes or str depending on its version and the Keras version that wrote them
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class DenseModel:
+    """
+    Feed-forward stack of dense layers, each followed by an activation.
+    predict() accepts the same input as keras.Model.predict for a 2-d input, so it can replace a Keras model.
+    :param kernels: list of float32[in, out] weight matrices
+    :param biases: list of float32[out] bias vectors
+    :param activations: list of activation names, see ACTIVATIONS, or ("leaky_relu", alpha) tuples
+    """
+    def __init__(self, kernels, biases, activations):
+        self.kernels = [np.asarray(kernel, dtype=np.float32) for kernel in kernels]
+        self.biases = [np.asarray(bias, dtype=np.float32) for bias in biases]
+        self.activations = list(activations)
+        self._layers = [(kernel, bias, _activation_function(activation))
+                        for kernel, bias, activation in zip(self.kernels, self.biases, self.activations)]
+
+    @property
+    def input_size(self):
+        return self.kernels[0].shape[0]
+
+    @property
+    def output_size(self):
+        return self.kernels[-1].shape[1]
+
+    def predict(self, x, batch_size=None):
+        """
+        :param x: [k, input_size] array of inputs
+        :param batch_size: ignored, kept for compatibility with keras.Model.predict
+        :return: float32[k, output_size] outputs
+        """
+        values = np.asarray(x, dtype=np.float32)
+        for kernel, bias, activation in self._layers:
+            values = activation(np.dot(values, kernel) + bias)
+        return values
+
+
+def _activation_function(activation):
+    if isinstance(activation, (tuple, list)):
+        alpha = np.float32(activation[1])
+        return lambda x: np.where(x > 0, x, alpha * x)
+    if activation not in ACTIVATIONS:
+        raise ValueError("Unsupported activation: " + str(activation))
+    return ACTIVATIONS[activation]
+
+
+def read_h5_model(model_file):
+    """
+    Reads the dense layers of a Sequential Keras model saved with model.save().
+    Activation and LeakyReLU layers are folded into the preceding dense layer, Dropout layers are skipped.
+    :param model_file: file name of the .h5 model
+    :return: the DenseModel with the weights of the model
+    """
+    import h5py
+    with h5py.File(model_file, "r") as f:
+        config = json.loads(_text(f.attrs["model_config"]))
+        layers = config["config"]
+        # Keras >= 2.2.5 wraps the layer list of a Sequential model in a dict
+        if isinstance(layers, dict):
+            layers = layers["layers"]
+        weight_root = f["model_weights"] if "model_weights" in f else f
+
+        kernels, biases, activations = [], [], []
+        for layer in layers:
+            class_name = layer["class_name"]
+            layer_config = layer["config"]
+            if class_name == "Dense":
+                group = weight_root[layer_config["name"]]
+                weights = {_text(name).split("/")[-1]: np.array(group[_text(name)])
+                           for name in group.attrs["weight_names"]}
+                kernel = weights["kernel:0"]
+                kernels.append(kernel)
+                biases.append(weights.get("bias:0", np.zeros(kernel.shape[1], dtype=kernel.dtype)))
+                activations.append(layer_config.get("activation", "linear"))
+            elif class_name in ("LeakyReLU", "Activation"):
+                if not kernels or activations[-1] != "linear":
+                    raise ValueError("Cannot fold layer " + layer_config["name"] + " into a dense layer")
+                if class_name == "LeakyReLU":
+                    activations[-1] = ("leaky_relu", float(layer_config.get("alpha", 0.3)))
+                else:
+                    activations[-1] = layer_config["activation"]
+            elif class_name not in ("Dropout", "InputLayer"):
+                raise ValueError("Unsupported layer " + class_name + " in " + model_file)
+    return DenseModel(kernels, biases, activations)
+
+
+def quantize_int8(kernel):
+    """
+    Symmetric per-output-channel int8 quantization.
+    :param kernel: float[in, out] weight matrix
+    :return: (int8[in, out] quantized weights, float32[out] scales), kernel ~ quantized * scales
+    """
+    scales = np.abs(kernel).max(axis=0) / 127
+    scales[scales == 0] = 1
+    quantized = np.clip(np.round(kernel / scales), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def save_converted_model(model, file_name, precision="float32", source_stamp=None):
+    """
+    :param model: the DenseModel
+    :param file_name: .npz file to write
+    :param precision: "float32", or "int8" to store the kernels as int8 with one float32 scale per output
+    :param source_stamp: [size, mtime_ns] of the .h5 file the model was read from
+    """
+    arrays = {"version": np.array(CONVERTED_FORMAT_VERSION),
+              "activations": np.array(json.dumps(model.activations)),
+              "precision": np.array(precision),
+              "source_stamp": np.array(source_stamp if source_stamp is not None else [-1, -1], dtype=np.int64)}
+    for layer, (kernel, bias) in enumerate(zip(model.kernels, model.biases)):
+        if precision == "int8":
+            arrays["kernel_%d" % layer], arrays["scale_%d" % layer] = quantize_int8(kernel)
+        else:
+            arrays["kernel_%d" % layer] = kernel
+        arrays["bias_%d" % layer] = bias
+    temp_file = file_name + ".tmp" + str(os.getpid()) + ".npz"
+    np.savez(temp_file, **arrays)
+    os.replace(temp_file, file_name)
+
+
+def load_converted_model(file_name):
+    """
+    :param file_name: .npz file written by save_converted_model
+    :return: (DenseModel, precision, source_stamp), int8 kernels are expanded to float32 once here
+    """
+    with np.load(file_name) as data:
+        if int(data["version"]) != CONVERTED_FORMAT_VERSION:
+            raise ValueError("Unknown format version of " + file_name)
+        activations = json.loads(str(data["activations"]))
+        kernels, biases = [], []
+        for layer in range(len(activations)):
+            kernel = data["kernel_%d" % layer]
+            if kernel.dtype == np.int8:
+                kernel = kernel.astype(np.float32) * data["scale_%d" % layer]
+            kernels.append(kernel)
+            biases.append(data["bias_%d" % layer])
+        return DenseModel(kernels, biases, activations), str(data["precision"]), data["source_stamp"].tolist()
+
+
+def converted_model_file(model_file, precision="float32"):
+    return os.path.splitext(model_file)[0] + "." + precision + ".npz"
+
+
+def load_model(model_file, precision="float32"):
+    """
+    Loads a Keras .h5 model for NumPy inference, from its converted .npz file if that is up to date,
+    otherwise from the .h5 file, storing the converted .npz file for the next run.
+    :param model_file: file name of the .h5 model
+    :param precision: "float32", or "int8" for int8 weights with one scale per output (about 4 times smaller)
+    :return: the DenseModel
+    """
+    if precision not in PRECISIONS:
+        raise ValueError("Unknown precision " + str(precision) + ", expected one of " + str(PRECISIONS))
+    info = os.stat(model_file)
+    source_stamp = [info.st_size, info.st_mtime_ns]
+    converted_file = converted_model_file(model_file, precision)
+    if os.path.isfile(converted_file):
+        try:
+            model, stored_precision, stored_stamp = load_converted_model(converted_file)
+            if stored_precision == precision and stored_stamp == source_stamp:
+                return model
+        except (OSError, ValueError, KeyError) as err:
+            logger.warning("Reconverting the damaged model file %s: %s", converted_file, err)
+
+    model = read_h5_model(model_file)
+    try:
+        save_converted_model(model, converted_file, precision, source_stamp)
+        # the model used in this run is the one later runs load, i.e. with the stored precision
+        model = load_converted_model(converted_file)[0]
+    except OSError as err:
+        logger.warning("Cannot store the converted model %s: %s", converted_file, err)
+        if precision == "int8":
+            kernels = [quantized.astype(np.float32) * scales
+                       for quantized, scales in map(quantize_int8, model.kernels)]
+            model = DenseModel(kernels, model.biases, model.activations)
+    return model
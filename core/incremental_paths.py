@@ -0,0 +1,269 @@
+"""
+    This file contains shortest path trees that are repaired instead of rebuilt
+    when the edge weights change (the dynamic shortest path algorithm of
+    Ramalingam and Reps, searching backward from the destination).
+
+    Every tree keeps, for each edge, its cost to the destination g and the next
+    edge of its path. A weight that rises only matters to the edges whose path
+    enters the changed edge: these are cut out of the tree and reattached to the
+    rest of it. A weight that drops only matters where it makes a path cheaper.
+    The edges concerned are put back on the queue of the tree's Dijkstra search,
+    which only runs as far as the queries need: a query settles the edges closer
+    to the destination than its start edge and leaves the rest for later, so a
+    destination whose vehicles are close to it never pays for the whole map.
+"""
+
+import heapq
+from collections import OrderedDict
+import numpy as np
+from core.shortest_path import INFINITY
+
+
+class IncrementalPathTree:
+    """
+    Reverse shortest path tree towards one destination edge that can be repaired after weight changes.
+    The cost of an edge is the summed weight of the edges entered after it up to the destination,
+    like ShortestPathTree.distance. The tree is grown lazily: a query only settles the edges closer to the
+    destination than its start edge, the rest stays on the queue of the tree until a later query needs it.
+    :param cache: the IncrementalTreeCache holding the tree, which provides the graph and the weights
+    :param destination: edge index of the destination edge
+    """
+    def __init__(self, cache, destination):
+        self.cache = cache
+        self.destination = destination
+        self.processed = 0 # edges settled since the last repair or rebuild
+        self.rebuild()
+
+    def rebuild(self):
+        """
+        Restarts the tree from the destination on the weights of the cache.
+        """
+        n = self.cache.graph.num_edges
+        self.g = [INFINITY] * n # cost to the destination, final for the settled edges
+        self.next_edge = [-1] * n
+        self.g[self.destination] = 0.0
+        self._queue = [(0.0, self.destination)]
+        self.position = self.cache.log_end # changes of the cache log the tree is up to date with
+        self.processed = 0
+
+    def _settle(self, source):
+        # Dijkstra search until the cost of source is final; entries whose key is no longer the cost are stale
+        pred_ptr, pred_edge = self.cache.pred_ptr, self.cache.pred_edge
+        weights, g, next_edge, queue = self.cache.weights, self.g, self.next_edge, self._queue
+        processed = 0
+        while queue and queue[0][0] < g[source]:
+            distance, current = heapq.heappop(queue)
+            if distance != g[current]:
+                continue
+            processed += 1
+            new_distance = distance + weights[current]
+            for k in range(pred_ptr[current], pred_ptr[current + 1]):
+                predecessor = pred_edge[k]
+                if new_distance < g[predecessor]:
+                    g[predecessor] = new_distance
+                    next_edge[predecessor] = current
+                    heapq.heappush(queue, (new_distance, predecessor))
+        self.processed += processed
+
+    def repair(self):
+        """
+        Brings the tree up to date with the weights of the cache. Trees that missed more changes than the
+        cache keeps, or whose repair would reach a large part of the map, are rebuilt instead.
+        """
+        cache = self.cache
+        pending = cache.changes_since(self.position)
+        if pending is None or len(self._queue) > 2 * cache.graph.num_edges:
+            self.rebuild()
+            return
+        self.position = cache.log_end
+        self.processed = 0
+        pred_ptr, pred_edge = cache.pred_ptr, cache.pred_edge
+        succ_ptr, succ_edge = cache.succ_ptr, cache.succ_edge
+        weights, g, next_edge, queue = cache.weights, self.g, self.next_edge, self._queue
+
+        # the edges whose path enters a more expensive edge lose their cost, the cheaper edges are kept aside
+        affected = set()
+        decreased = []
+        for edge, old_weight in pending.items():
+            weight = weights[edge]
+            if weight == old_weight or g[edge] == INFINITY:
+                continue
+            if weight < old_weight:
+                decreased.append(edge)
+                continue
+            stack = [edge]
+            while stack:
+                current = stack.pop()
+                for k in range(pred_ptr[current], pred_ptr[current + 1]):
+                    predecessor = pred_edge[k]
+                    if next_edge[predecessor] != current or predecessor in affected:
+                        continue
+                    # a predecessor with another successor as cheap as its cost before the change keeps its cost
+                    cost = g[predecessor]
+                    for j in range(succ_ptr[predecessor], succ_ptr[predecessor + 1]):
+                        successor = succ_edge[j]
+                        if successor != current and successor not in affected \
+                                and weights[successor] + g[successor] == cost:
+                            next_edge[predecessor] = successor
+                            break
+                    else:
+                        affected.add(predecessor)
+                        stack.append(predecessor)
+        if len(affected) > cache.max_affected:
+            self.rebuild()
+            return
+
+        for edge in affected:
+            g[edge] = INFINITY
+        # every affected edge starts from its cheapest successor that kept its cost
+        for edge in affected:
+            best, best_next = INFINITY, -1
+            for k in range(succ_ptr[edge], succ_ptr[edge + 1]):
+                successor = succ_edge[k]
+                cost = weights[successor] + g[successor]
+                if cost < best:
+                    best, best_next = cost, successor
+            g[edge], next_edge[edge] = best, best_next
+            if best < INFINITY:
+                heapq.heappush(queue, (best, edge))
+        # a cheaper edge lowers the cost of the edges leading into it
+        for edge in decreased:
+            cost = weights[edge] + g[edge]
+            for k in range(pred_ptr[edge], pred_ptr[edge + 1]):
+                predecessor = pred_edge[k]
+                if cost < g[predecessor]:
+                    g[predecessor], next_edge[predecessor] = cost, edge
+                    heapq.heappush(queue, (cost, predecessor))
+
+    def reaches(self, source):
+        self._settle(source)
+        return self.g[source] < INFINITY
+
+    def search(self, source):
+        """
+        Follows the tree from source to the destination.
+        :param source: edge index of the start edge
+        :return: (cost, edge index path, direction code list) like ShortestPathEngine.search, or None if unreachable
+        """
+        if not self.reaches(source):
+            return None
+        succ_ptr, succ_edge, succ_dir = self.cache.succ_ptr, self.cache.succ_edge, self.cache.succ_dir
+        next_edge = self.next_edge
+        path = [source]
+        directions = []
+        current = source
+        while current != self.destination:
+            following = next_edge[current]
+            for k in range(succ_ptr[current], succ_ptr[current + 1]):
+                if succ_edge[k] == following:
+                    directions.append(succ_dir[k])
+                    break
+            current = following
+            path.append(current)
+        return self.g[source], path, directions
+
+
+class IncrementalTreeCache:
+    """
+    Incremental shortest path trees keyed by destination edge, the counterpart of ShortestPathTreeCache for
+    weights that change every step: set_weights logs which edges changed, and a tree is repaired for the
+    changes it missed the next time it is used. The least recently used trees beyond max_trees are dropped.
+    :param graph: the CompiledGraph of the map, e.g. connection_info.graph
+    :param max_trees: maximum number of destinations whose trees are kept
+    :param max_changes: a tree that missed more weight changes is rebuilt, num_edges / 10 if None
+    :param max_affected: a tree whose repair would recompute the cost of more edges is rebuilt, num_edges / 4 if None
+    """
+    def __init__(self, graph, max_trees=256, max_changes=None, max_affected=None):
+        self.graph = graph
+        self.max_trees = max_trees
+        self.max_changes = max(1, graph.num_edges // 10) if max_changes is None else max_changes
+        self.max_affected = graph.num_edges // 4 if max_affected is None else max_affected
+        self.succ_ptr, self.succ_edge, self.succ_dir, lengths = graph.adjacency_lists()
+        self.pred_ptr, self.pred_edge, _ = graph.reverse_adjacency_lists()
+        self.weights = list(lengths)
+        self._weight_array = graph.lengths.copy()
+        self._log = [] # (edge, weight before the change) of the last weight changes
+        self._log_start = 0 # number of changes dropped from the front of the log
+        self._trees = OrderedDict()
+
+    def __len__(self):
+        return len(self._trees)
+
+    @property
+    def log_end(self):
+        """
+        :return: number of weight changes logged so far
+        """
+        return self._log_start + len(self._log)
+
+    def changes_since(self, position):
+        """
+        :param position: log_end at the time a tree was last brought up to date
+        :return: {edge: weight the tree was built on} of the edges changed since, None if there are more than
+                 max_changes of them
+        """
+        if self.log_end - position > self.max_changes or position < self._log_start:
+            return None
+        pending = {}
+        for edge, old_weight in self._log[position - self._log_start:]:
+            # an edge changed several times keeps the weight the tree was built on
+            pending.setdefault(edge, old_weight)
+        return pending
+
+    def set_weights(self, weights=None):
+        """
+        Sets the per-edge costs of the trees; the trees are repaired for the changed edges when used next.
+        :param weights: sequence of per-edge costs indexed by edge index, None for the edge lengths
+        :return: number of edges whose weight changed
+        """
+        weight_array = self.graph.lengths if weights is None else np.asarray(weights, dtype=np.float64)
+        changed = np.flatnonzero(weight_array != self._weight_array)
+        if len(changed) == 0:
+            return 0
+        old_weights = self.weights
+        self._weight_array = weight_array.copy()
+        self.weights = self._weight_array.tolist()
+        self._log.extend((edge, old_weights[edge]) for edge in changed.tolist())
+        if len(self._log) > 2 * self.max_changes:
+            # older changes are only of use to trees that are rebuilt anyway
+            dropped = len(self._log) - self.max_changes
+            del self._log[:dropped]
+            self._log_start += dropped
+        return len(changed)
+
+    def tree(self, destination):
+        """
+        :param destination: edge index of the destination edge
+        :return: the up-to-date IncrementalPathTree towards destination, built on a cache miss
+        """
+        tree = self._trees.get(destination)
+        if tree is None:
+            tree = IncrementalPathTree(self, destination)
+            self._trees[destination] = tree
+            while len(self._trees) > self.max_trees:
+                self._trees.popitem(last=False)
+        else:
+            self._trees.move_to_end(destination)
+            if tree.position != self.log_end:
+                tree.repair()
+        return tree
+
+    def shortest_path(self, start_edge, destination):
+        """
+        :param start_edge: id of the start edge
+        :param destination: id of the destination edge
+        :return: (list of edge ids, list of directions) of the shortest path, ([], []) if there is none
+        """
+        edge_index = self.graph.edge_index
+        result = self.tree(edge_index[destination]).search(edge_index[start_edge])
+        if result is None:
+            return [], []
+        _, path, directions = result
+        edge_ids, direction_names = self.graph.edge_ids, self.graph.direction_names
+        return [edge_ids[index] for index in path], [direction_names[code] for code in directions]
+
+    def directions(self, start_edge, destination):
+        """
+        :return: the list of directions leading from start_edge to destination, [] if there is none
+        """
+        return self.shortest_path(start_edge, destination)[1]
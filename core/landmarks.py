@@ -0,0 +1,200 @@
+"""
+    This file contains the A* search with ALT lower bounds (A*, landmarks and the
+    triangle inequality). The distances from and to a few landmark edges are
+    computed once per map and stored with the map bundle (see
+    MapBundle.landmarks); for every query they bound the remaining cost to the
+    destination from below, so the search settles far fewer edges than
+    Dijkstra's algorithm and still returns shortest paths.
+"""
+
+import heapq
+import numpy as np
+from core.shortest_path import ShortestPathEngine, INFINITY
+
+DEFAULT_NUM_LANDMARKS = 8
+
+# landmarks used per query, the ones giving the best bound at the start edge
+ACTIVE_LANDMARKS = 4
+
+
+def _distances(ptr, neighbors, lengths, source, forward):
+    # Dijkstra over all edges from source, forward along the successors or backward along the predecessors;
+    # entering an edge costs its length, like in ShortestPathEngine
+    distance = [INFINITY] * (len(ptr) - 1)
+    distance[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        current_distance, current = heapq.heappop(heap)
+        if current_distance > distance[current]:
+            continue
+        if not forward:
+            current_distance += lengths[current]
+        for k in range(ptr[current], ptr[current + 1]):
+            neighbor = neighbors[k]
+            new_distance = current_distance + lengths[neighbor] if forward else current_distance
+            if new_distance < distance[neighbor]:
+                distance[neighbor] = new_distance
+                heapq.heappush(heap, (new_distance, neighbor))
+    return distance
+
+
+class LandmarkTable:
+    """
+    Distances between every edge and a few landmark edges, on the edge lengths.
+    Available arrays:
+        - landmarks int64[k] edge indices of the landmarks
+        - from_landmark float64[k, n] cost from each landmark to each edge, inf if unreachable
+        - to_landmark float64[k, n] cost from each edge to each landmark, inf if unreachable
+    """
+    def __init__(self, landmarks, from_landmark, to_landmark):
+        self.landmarks = landmarks
+        self.from_landmark = from_landmark
+        self.to_landmark = to_landmark
+
+    @classmethod
+    def build(cls, graph, num_landmarks=DEFAULT_NUM_LANDMARKS):
+        """
+        Selects the landmarks among the passenger edges by the farthest heuristic: every new landmark is the edge
+        farthest (round trip) from the landmarks selected so far, edges they cannot reach or be reached from first.
+        :param graph: the CompiledGraph of the map
+        """
+        succ_ptr, succ_edge, _, lengths = graph.adjacency_lists()
+        pred_ptr, pred_edge, _ = graph.reverse_adjacency_lists()
+        candidates = graph.passenger_edges
+        num_landmarks = min(num_landmarks, len(candidates))
+        landmarks, from_landmark, to_landmark = [], [], []
+        # round trip cost from the nearest landmark to every candidate
+        nearest = np.full(len(candidates), INFINITY)
+        start = int(candidates[0]) if len(candidates) else 0
+        for _ in range(num_landmarks):
+            if landmarks:
+                start = int(candidates[int(np.argmax(nearest))])
+            else:
+                # the first landmark is the edge farthest from an arbitrary edge
+                outgoing = np.array(_distances(succ_ptr, succ_edge, lengths, start, True))[candidates]
+                finite = np.isfinite(outgoing)
+                if finite.any():
+                    start = int(candidates[np.flatnonzero(finite)[np.argmax(outgoing[finite])]])
+            landmarks.append(start)
+            from_landmark.append(_distances(succ_ptr, succ_edge, lengths, start, True))
+            to_landmark.append(_distances(pred_ptr, pred_edge, lengths, start, False))
+            round_trip = np.array(from_landmark[-1])[candidates] + np.array(to_landmark[-1])[candidates]
+            nearest = np.minimum(nearest, round_trip)
+            nearest[candidates == start] = -1.0
+        shape = (len(landmarks), graph.num_edges)
+        return cls(np.array(landmarks, dtype=np.int64), np.array(from_landmark, dtype=np.float64).reshape(shape),
+                   np.array(to_landmark, dtype=np.float64).reshape(shape))
+
+    def to_arrays(self):
+        return {"landmarks": self.landmarks, "from_landmark": self.from_landmark, "to_landmark": self.to_landmark}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays["landmarks"], arrays["from_landmark"], arrays["to_landmark"])
+
+    def lower_bound(self, source, target):
+        """
+        :return: the largest lower bound of the cost from source to target given by the landmarks
+        """
+        # terms of landmarks the target cannot be reached from or cannot reach (inf - inf) are left out
+        with np.errstate(invalid="ignore"):
+            forward = self.from_landmark[:, target] - self.from_landmark[:, source]
+            backward = self.to_landmark[:, source] - self.to_landmark[:, target]
+        bounds = np.concatenate([forward[np.isfinite(self.from_landmark[:, target])],
+                                 backward[np.isfinite(self.to_landmark[:, target])]])
+        return max(0.0, float(bounds.max())) if len(bounds) else 0.0
+
+
+class AltEngine(ShortestPathEngine):
+    """
+    A* search with landmark lower bounds over the successor arrays of a CompiledGraph, a drop-in replacement
+    of ShortestPathEngine for the edge lengths. The bounds are consistent, so the paths are shortest paths;
+    with other weights the search falls back to Dijkstra's algorithm.
+    :param graph: the CompiledGraph of the map, e.g. connection_info.graph
+    :param landmarks: the LandmarkTable of the map, e.g. MapBundle.landmarks()
+    """
+    def __init__(self, graph, landmarks):
+        super().__init__(graph)
+        self.landmarks = landmarks
+        # per landmark rows as lists, indexed from the search loop
+        self._from_landmark = [row.tolist() for row in np.asarray(landmarks.from_landmark)]
+        self._to_landmark = [row.tolist() for row in np.asarray(landmarks.to_landmark)]
+        self._bound = [0.0] * graph.num_edges
+        self._bound_in = [0] * graph.num_edges
+        self.settled = 0 # edges settled by the last query
+
+    def _active_landmarks(self, source, target):
+        # the landmarks with the best bounds at the start edge; terms of landmarks the target cannot be
+        # reached from or cannot reach give no bound and are left out
+        scored = []
+        for i in range(len(self._from_landmark)):
+            from_row, to_row = self._from_landmark[i], self._to_landmark[i]
+            if from_row[target] < INFINITY:
+                scored.append((from_row[target] - from_row[source], from_row, from_row[target], True))
+            if to_row[target] < INFINITY:
+                scored.append((to_row[source] - to_row[target], to_row, to_row[target], False))
+        scored.sort(key=lambda term: -term[0])
+        return [(row, target_distance, forward) for _, row, target_distance, forward in scored[:ACTIVE_LANDMARKS]]
+
+    def search(self, source, target, weights=None):
+        """
+        Runs A* from source until target is settled.
+        :param source: edge index of the start edge
+        :param target: edge index of the destination edge
+        :param weights: optional per-edge costs; the landmark bounds only hold for the edge lengths,
+                        so any other weights are searched with Dijkstra's algorithm
+        :return: (cost, edge index path from source to target, direction code list), or None if unreachable
+        """
+        if weights is not None and weights is not self._lengths:
+            return super().search(source, target, weights)
+        weights = self._lengths
+        succ_ptr, succ_edge, succ_dir = self._succ_ptr, self._succ_edge, self._succ_dir
+        dist, pred, pred_dir = self._dist, self._pred, self._pred_dir
+        visited_in, settled_in = self._visited_in, self._settled_in
+        bound, bound_in = self._bound, self._bound_in
+        self._query += 1
+        query = self._query
+        terms = self._active_landmarks(source, target)
+
+        visited_in[source] = query
+        dist[source] = 0.0
+        pred[source] = -1
+        heap = [(0.0, source)]
+        settled = 0
+        found = False
+        while heap:
+            _, current = heapq.heappop(heap)
+            if settled_in[current] == query:
+                continue
+            settled_in[current] = query
+            settled += 1
+            if current == target:
+                found = True
+                break
+            current_distance = dist[current]
+            for k in range(succ_ptr[current], succ_ptr[current + 1]):
+                outgoing = succ_edge[k]
+                new_distance = current_distance + weights[outgoing]
+                if visited_in[outgoing] != query or new_distance < dist[outgoing]:
+                    if bound_in[outgoing] != query:
+                        # max(d(L, t) - d(L, v), d(v, L) - d(t, L)) over the active landmarks
+                        estimate = 0.0
+                        for row, target_distance, forward in terms:
+                            term = target_distance - row[outgoing] if forward else row[outgoing] - target_distance
+                            if term > estimate:
+                                estimate = term
+                        bound[outgoing] = estimate
+                        bound_in[outgoing] = query
+                    if bound[outgoing] == INFINITY:
+                        # the target cannot be reached from this edge
+                        continue
+                    visited_in[outgoing] = query
+                    dist[outgoing] = new_distance
+                    pred[outgoing] = current
+                    pred_dir[outgoing] = succ_dir[k]
+                    heapq.heappush(heap, (new_distance + bound[outgoing], outgoing))
+
+        self.settled = settled
+        if not found:
+            return None
+        return (dist[target],) + self._reconstruct(source, target)
@@ -0,0 +1,230 @@
+"""
+    This file contains the preprocessed map bundle: the compiled arrays of a
+    SUMO network file and the tables derived from them, stored on disk next to
+    the network file and loaded memory-mapped, so that a map is only parsed
+    once for as long as the network file does not change.
+
+    Layout: <net file directory>/.map_cache/<net file name>-<content hash>/
+        meta.json       edge ids, direction names, format version
+        <array>.npy     one file per array of the CompiledGraph, plus the
+                        component labels of the reachability index
+        <table>/*.npy   derived tables saved by other modules (see save_table)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import numpy as np
+
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("No environment variable SUMO_HOME!")
+
+import sumolib
+from core.compiled_graph import CompiledGraph
+from core.reachability import ReachabilityIndex
+from core.landmarks import LandmarkTable
+from core.contraction import ContractionHierarchy
+from core import sim_log
+
+logger = sim_log.get_logger("map_bundle")
+
+BUNDLE_VERSION = 1
+CACHE_DIRECTORY_NAME = ".map_cache"
+GRAPH_ARRAYS = ["lengths", "speeds", "lane_counts", "passenger", "succ_ptr", "succ_edge", "succ_dir"]
+
+# bundles already loaded by this process, by (absolute net file name, content hash)
+_loaded_bundles = {}
+
+
+def net_file_hash(net_file):
+    """
+    :param net_file: file name of a SUMO network file
+    :return: hex SHA-1 digest of the file content
+    """
+    digest = hashlib.sha1()
+    with open(net_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MapBundle:
+    """
+    The compiled arrays of one network file, as stored on disk.
+    :param net_file: file name of the SUMO network file
+    :param content_hash: hash of the network file content the bundle was built from
+    :param directory: directory of the bundle on disk, None if it could not be stored
+    :param arrays: {name: array} of the CompiledGraph arrays and the component labels
+    :param meta: content of meta.json
+    """
+    def __init__(self, net_file, content_hash, directory, arrays, meta):
+        self.net_file = net_file
+        self.content_hash = content_hash
+        self.directory = directory
+        self.arrays = arrays
+        self.meta = meta
+        self._graph = None
+        self._reachability = None
+        self._landmarks = None
+        self._contraction_hierarchy = None
+
+    def graph(self):
+        """
+        :return: the CompiledGraph of the map, shared by every user of this bundle
+        """
+        if self._graph is None:
+            self._graph = CompiledGraph(self.meta["edge_ids"], *[self.arrays[name] for name in GRAPH_ARRAYS],
+                                        direction_names=self.meta["direction_names"])
+        return self._graph
+
+    def reachability(self):
+        """
+        :return: the ReachabilityIndex of the map, built from the stored component labels
+        """
+        if self._reachability is None:
+            self._reachability = ReachabilityIndex(self.graph(), self.arrays["component"])
+        return self._reachability
+
+    def landmarks(self):
+        """
+        :return: the LandmarkTable of the map for A* searches (see landmarks.py), computed and saved as the
+                 table "landmarks" the first time it is used
+        """
+        if self._landmarks is None:
+            arrays = self.load_table("landmarks")
+            if arrays is not None:
+                self._landmarks = LandmarkTable.from_arrays(arrays)
+            else:
+                self._landmarks = LandmarkTable.build(self.graph())
+                self.save_table("landmarks", self._landmarks.to_arrays())
+        return self._landmarks
+
+    def contraction_hierarchy(self):
+        """
+        :return: the ContractionHierarchy of the map for bidirectional queries (see contraction.py), computed and
+                 saved as the table "contraction_hierarchy" the first time it is used
+        """
+        if self._contraction_hierarchy is None:
+            arrays = self.load_table("contraction_hierarchy")
+            if arrays is not None:
+                self._contraction_hierarchy = ContractionHierarchy.from_arrays(arrays)
+            else:
+                self._contraction_hierarchy = ContractionHierarchy.build(self.graph())
+                self.save_table("contraction_hierarchy", self._contraction_hierarchy.to_arrays())
+        return self._contraction_hierarchy
+
+    def load_table(self, name):
+        """
+        :param name: name of a derived table, e.g. "landmarks"
+        :return: {array name: memory-mapped array} of the table, None if it has not been saved yet
+        """
+        if self.directory is None:
+            return None
+        table_directory = os.path.join(self.directory, name)
+        if not os.path.isdir(table_directory):
+            return None
+        return {file_name[:-4]: np.load(os.path.join(table_directory, file_name), mmap_mode="r")
+                for file_name in os.listdir(table_directory) if file_name.endswith(".npy")}
+
+    def save_table(self, name, arrays):
+        """
+        Stores a derived table next to the bundle, so that it is rebuilt together with the bundle
+        when the network file changes. Does nothing if the bundle could not be stored.
+        :param name: name of the table
+        :param arrays: {array name: numpy array}
+        """
+        if self.directory is None:
+            return
+        table_directory = os.path.join(self.directory, name)
+        temp_directory = table_directory + ".tmp" + str(os.getpid())
+        try:
+            _write_arrays(temp_directory, arrays)
+            if os.path.isdir(table_directory):
+                shutil.rmtree(table_directory)
+            os.replace(temp_directory, table_directory)
+        except OSError as err:
+            logger.warning("Cannot store the table %s of %s: %s", name, self.net_file, err)
+            shutil.rmtree(temp_directory, ignore_errors=True)
+
+
+def _write_arrays(directory, arrays):
+    os.makedirs(directory)
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, name + ".npy"), np.ascontiguousarray(array))
+
+
+def _build_arrays(net_file):
+    graph = CompiledGraph.from_net(sumolib.net.readNet(net_file))
+    arrays = {name: getattr(graph, name) for name in GRAPH_ARRAYS}
+    arrays["component"] = ReachabilityIndex(graph).component
+    meta = {"version": BUNDLE_VERSION, "net_file": os.path.basename(net_file),
+            "edge_ids": graph.edge_ids, "direction_names": graph.direction_names}
+    return arrays, meta
+
+
+def _read_bundle(directory):
+    with open(os.path.join(directory, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("version") != BUNDLE_VERSION:
+        return None
+    arrays = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+              for name in GRAPH_ARRAYS + ["component"]}
+    return arrays, meta
+
+
+def load_map_bundle(net_file, cache_dir=None):
+    """
+    Loads the bundle of net_file from the cache, building and storing it first if the cache holds no bundle
+    for the current content of net_file. Bundles of earlier versions of the same file are removed.
+    :param net_file: file name of a SUMO network file
+    :param cache_dir: directory holding the bundles, defaults to .map_cache next to net_file
+    :return: the MapBundle
+    """
+    content_hash = net_file_hash(net_file)
+    key = (os.path.abspath(net_file), content_hash)
+    if key in _loaded_bundles:
+        return _loaded_bundles[key]
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(net_file)), CACHE_DIRECTORY_NAME)
+    prefix = os.path.basename(net_file) + "-"
+    directory = os.path.join(cache_dir, prefix + content_hash)
+
+    loaded = None
+    if os.path.isfile(os.path.join(directory, "meta.json")):
+        try:
+            loaded = _read_bundle(directory)
+        except (OSError, ValueError) as err:
+            logger.warning("Rebuilding the damaged map bundle %s: %s", directory, err)
+    if loaded is None:
+        arrays, meta = _build_arrays(net_file)
+        temp_directory = directory + ".tmp" + str(os.getpid())
+        try:
+            # drop the bundles of earlier versions of the file, then store the new one atomically
+            if os.path.isdir(cache_dir):
+                for name in os.listdir(cache_dir):
+                    suffix = name[len(prefix):]
+                    if name.startswith(prefix) and suffix != content_hash and ".tmp" not in suffix:
+                        shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+            shutil.rmtree(temp_directory, ignore_errors=True)
+            _write_arrays(temp_directory, arrays)
+            with open(os.path.join(temp_directory, "meta.json"), "w") as f:
+                json.dump(meta, f)
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+            os.replace(temp_directory, directory)
+            loaded = _read_bundle(directory)
+        except OSError as err:
+            logger.warning("Cannot store the map bundle of %s, using it in memory only: %s", net_file, err)
+            shutil.rmtree(temp_directory, ignore_errors=True)
+            directory = None
+            loaded = (arrays, meta)
+
+    bundle = MapBundle(net_file, content_hash, directory, loaded[0], loaded[1])
+    _loaded_bundles[key] = bundle
+    return bundle
@@ -0,0 +1,534 @@
+"""
+    This file contains a queue-based mesoscopic traffic simulator standing in
+    for SUMO, for screening routing policies quickly and for running the
+    testbed on machines without SUMO.
+
+    Every edge is a queue with a storage capacity (its lanes times its length,
+    divided by the space a vehicle takes in a jam). The vehicles on an edge
+    drive at its speed limit scaled down linearly with its occupancy, and leave
+    it at the end when the next edge of their route has room; a vehicle blocked
+    for longer than the teleport time jumps ahead to the next edge of its route
+    with room, like in SUMO, so the capacities always hold. All moving vehicles
+    are updated with vectorized NumPy operations, only the vehicles reaching the
+    end of an edge are handled one by one.
+
+    The module offers the part of the traci API that StrSumo and the
+    controllers use, and is selected as SUMO backend with
+        select_backend("meso")    (see core/sumo_backend.py)
+    after which traci.start(["sumo", "-c", "myconfig.sumocfg"]) loads the
+    network and route files named in the configuration (or by -n and -r).
+"""
+
+import os
+import pickle
+import sys
+import xml.etree.ElementTree as ET
+import numpy as np
+
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("No environment variable SUMO_HOME!")
+
+import traci.constants as tc
+from traci.exceptions import TraCIException, FatalTraCIError
+from core import map_bundle, route_files
+from core.shortest_path import ShortestPathEngine
+
+VEHICLE_SPACE = 7.5 # m of lane a vehicle takes in a jam, its length and the gap to its leader
+MIN_SPEED_FACTOR = 0.05 # share of the speed limit still driven on a full edge
+MIN_SPEED = 0.1 # m/s, keeps the free-flow travel time of edges without speed limit finite
+TIME_TO_TELEPORT = 300.0 # s a vehicle waits in front of a full edge before jumping past it, as in SUMO
+# attributes of MesoSimulation making up a saved state; the loaded routes are read from the route files again
+STATE_ATTRIBUTES = ("time", "edge_counts", "_size", "edge", "remaining", "speed", "waiting", "route_index", "active",
+                    "routes", "slot_ids", "_slots", "_free_slots", "_next_pending", "_delayed")
+
+
+class MesoSimulation:
+    """
+    State of one simulation run.
+    :param graph: the CompiledGraph of the map, e.g. connection_info.graph
+    :param route_file_names: list of route files; vehicles with a <route> child or a route attribute
+                             referring to a <route> element, and trips with from/to edges are loaded
+    :param step_length: simulated seconds per simulationStep
+    :param time_to_teleport: seconds a blocked vehicle waits before jumping to the next edge of its route with
+                             room (leaving the network if there is none), < 0 disables
+    """
+    def __init__(self, graph, route_file_names, step_length=1.0, time_to_teleport=TIME_TO_TELEPORT):
+        self.graph = graph
+        self.step_length = float(step_length)
+        self.time_to_teleport = time_to_teleport
+        self.time = 0.0
+        self.lengths = np.asarray(graph.lengths, dtype=np.float64)
+        lane_space = self.lengths * np.maximum(np.asarray(graph.lane_counts, dtype=np.float64), 1)
+        self.lane_space = lane_space
+        self.capacity = np.maximum(1, np.floor(lane_space / VEHICLE_SPACE)).astype(np.int64)
+        self.free_speed = np.maximum(np.asarray(graph.speeds, dtype=np.float64), MIN_SPEED)
+        self.edge_counts = np.zeros(graph.num_edges, dtype=np.int64)
+        self._engine = ShortestPathEngine(graph)
+        self._travel_times = self.lengths / self.free_speed
+
+        # per slot state of the vehicles in the network; slots of arrived vehicles are reused
+        self._size = 0
+        self.edge = np.zeros(0, dtype=np.int64)
+        self.remaining = np.zeros(0, dtype=np.float64) # distance to the end of the current edge
+        self.speed = np.zeros(0, dtype=np.float64)
+        self.waiting = np.zeros(0, dtype=np.float64) # time spent blocked at the end of the current edge
+        self.route_index = np.zeros(0, dtype=np.int64)
+        self.active = np.zeros(0, dtype=bool)
+        self.routes = []
+        self.slot_ids = []
+        self._slots = {} # {vehicle id: slot} of the vehicles in the network, in insertion order
+        self._free_slots = []
+
+        self._pending = self._load_routes(route_file_names) # (depart, vehicle id, edge index list)
+        self._next_pending = 0
+        self._delayed = [] # vehicles due to depart whose first edge was full
+        self.departed = []
+        self.arrived = []
+        self.teleports = 0 # number of jumps of blocked vehicles so far
+        self.vehicle_subscriptions = {}
+        self.edge_subscriptions = {}
+        self._edge_values = None
+
+    def _route_indices(self, edges, vehicle_id):
+        try:
+            return [self.graph.edge_index[edge] for edge in edges.split()]
+        except KeyError as err:
+            raise TraCIException("Vehicle " + vehicle_id + " uses the unknown edge " + str(err))
+
+    def _load_routes(self, route_file_names):
+        pending = []
+        named_routes = {}
+        for file_name in route_file_names:
+            for element in route_files.iter_route_elements(file_name):
+                if element.tag == "route" and element.get("id") is not None:
+                    named_routes[element.get("id")] = self._route_indices(element.get("edges"), element.get("id"))
+                if element.tag not in ("vehicle", "trip"):
+                    continue
+                vehicle_id = element.get("id")
+                route = element.find("route")
+                if route is not None:
+                    indices = self._route_indices(route.get("edges"), vehicle_id)
+                elif element.get("route") is not None:
+                    indices = named_routes[element.get("route")]
+                else:
+                    source = self._route_indices(element.get("from"), vehicle_id)[0]
+                    target = self._route_indices(element.get("to"), vehicle_id)[0]
+                    indices = self._find_route(source, target, vehicle_id)
+                pending.append((float(element.get("depart")), vehicle_id, indices))
+        # stable, so vehicles departing at the same time keep the order of the files
+        pending.sort(key=lambda item: item[0])
+        return pending
+
+    def _find_route(self, source, target, vehicle_id):
+        if source == target:
+            return [source]
+        result = self._engine.search(source, target, self._travel_times)
+        if result is None:
+            raise TraCIException("No connection between edge '" + self.graph.edge_ids[source] + "' and edge '"
+                                 + self.graph.edge_ids[target] + "' found for vehicle '" + vehicle_id + "'")
+        return result[1]
+
+    def _allocate_slot(self):
+        if self._free_slots:
+            return self._free_slots.pop()
+        if self._size == len(self.active):
+            capacity = max(64, 2 * len(self.active))
+            for name in ("edge", "remaining", "speed", "waiting", "route_index", "active"):
+                array = getattr(self, name)
+                grown = np.zeros(capacity, dtype=array.dtype)
+                grown[:len(array)] = array
+                setattr(self, name, grown)
+            self.routes.extend([None] * (capacity - len(self.routes)))
+            self.slot_ids.extend([None] * (capacity - len(self.slot_ids)))
+        self._size += 1
+        return self._size - 1
+
+    def _insert(self, vehicle_id, route):
+        first = route[0]
+        if self.edge_counts[first] >= self.capacity[first]:
+            return False
+        slot = self._allocate_slot()
+        self.edge[slot] = first
+        self.remaining[slot] = self.lengths[first]
+        self.speed[slot] = 0.0
+        self.waiting[slot] = 0.0
+        self.route_index[slot] = 0
+        self.active[slot] = True
+        self.routes[slot] = list(route)
+        self.slot_ids[slot] = vehicle_id
+        self._slots[vehicle_id] = slot
+        self.edge_counts[first] += 1
+        self.departed.append(vehicle_id)
+        return True
+
+    def _arrive(self, slot):
+        vehicle_id = self.slot_ids[slot]
+        self.active[slot] = False
+        self.edge_counts[self.edge[slot]] -= 1
+        self.routes[slot] = None
+        self.slot_ids[slot] = None
+        del self._slots[vehicle_id]
+        self._free_slots.append(slot)
+        self.vehicle_subscriptions.pop(vehicle_id, None)
+        self.arrived.append(vehicle_id)
+
+    def _leave_edge(self, slot):
+        route = self.routes[slot]
+        position = self.route_index[slot]
+        if position + 1 >= len(route):
+            self._arrive(slot)
+            return
+        current = self.edge[slot]
+        following = route[position + 1]
+        if self.edge_counts[following] >= self.capacity[following]:
+            if self.time_to_teleport < 0 or self.waiting[slot] < self.time_to_teleport:
+                self.remaining[slot] = 0.0
+                self.speed[slot] = 0.0
+                self.waiting[slot] += self.step_length
+                return
+            self._teleport(slot, position)
+            return
+        self.edge_counts[current] -= 1
+        self.edge_counts[following] += 1
+        self.edge[slot] = following
+        self.route_index[slot] = position + 1
+        # the distance driven past the end of the edge counts on the next one
+        self.remaining[slot] += self.lengths[following]
+        self.waiting[slot] = 0.0
+
+    def _teleport(self, slot, position):
+        # like SUMO, a vehicle blocked for too long jumps to the start of the next edge of its route that has
+        # room, so no edge ever holds more vehicles than its capacity; without room up to the end of its route
+        # it leaves the network there
+        route = self.routes[slot]
+        self.teleports += 1
+        for index in range(position + 2, len(route)):
+            edge = route[index]
+            if self.edge_counts[edge] < self.capacity[edge]:
+                self.edge_counts[self.edge[slot]] -= 1
+                self.edge_counts[edge] += 1
+                self.edge[slot] = edge
+                self.route_index[slot] = index
+                self.remaining[slot] = self.lengths[edge]
+                self.waiting[slot] = 0.0
+                return
+        self._arrive(slot)
+
+    def step(self):
+        """
+        Advances the simulation by one step: moves the vehicles in the network, then inserts the due ones.
+        """
+        self.time += self.step_length
+        self.departed = []
+        self.arrived = []
+        self._edge_values = None
+
+        slots = np.flatnonzero(self.active[:self._size])
+        if len(slots) > 0:
+            edges = self.edge[slots]
+            factor = np.maximum(MIN_SPEED_FACTOR, 1.0 - self.edge_counts[edges] / self.capacity[edges])
+            speeds = self.free_speed[edges] * factor
+            self.speed[slots] = speeds
+            self.remaining[slots] -= speeds * self.step_length
+            done = slots[self.remaining[slots] <= 0]
+            # the vehicles that reached the end of their edge first leave first
+            for slot in done[np.argsort(self.remaining[done], kind="stable")].tolist():
+                self._leave_edge(slot)
+
+        still_delayed = []
+        for vehicle_id, route in self._delayed:
+            if not self._insert(vehicle_id, route):
+                still_delayed.append((vehicle_id, route))
+        while self._next_pending < len(self._pending) and self._pending[self._next_pending][0] <= self.time:
+            _, vehicle_id, route = self._pending[self._next_pending]
+            self._next_pending += 1
+            if not self._insert(vehicle_id, route):
+                still_delayed.append((vehicle_id, route))
+        self._delayed = still_delayed
+
+    def slot(self, vehicle_id):
+        if vehicle_id not in self._slots:
+            raise TraCIException("Vehicle '" + str(vehicle_id) + "' is not known.")
+        return self._slots[vehicle_id]
+
+    def vehicle_ids(self):
+        return tuple(self._slots)
+
+    def expected_number(self):
+        return len(self._slots) + len(self._delayed) + len(self._pending) - self._next_pending
+
+    def change_target(self, vehicle_id, edge_id):
+        slot = self.slot(vehicle_id)
+        if edge_id not in self.graph.edge_index:
+            raise TraCIException("Can not retrieve road '" + str(edge_id) + "'.")
+        current = self.edge[slot]
+        self.routes[slot] = self._find_route(current, self.graph.edge_index[edge_id], vehicle_id)
+        self.route_index[slot] = 0
+
+    def set_route(self, vehicle_id, edge_ids):
+        slot = self.slot(vehicle_id)
+        route = self._route_indices(" ".join(edge_ids), vehicle_id)
+        if not route or route[0] != self.edge[slot]:
+            raise TraCIException("Route replacement for vehicle '" + vehicle_id + "' must start at its current edge.")
+        self.routes[slot] = route
+        self.route_index[slot] = 0
+
+    def save_state(self, file_name):
+        with open(file_name, "wb") as f:
+            pickle.dump({name: getattr(self, name) for name in STATE_ATTRIBUTES}, f, pickle.HIGHEST_PROTOCOL)
+
+    def load_state(self, file_name):
+        """
+        Restores a state saved by save_state of a simulation of the same map and route files.
+        Like SUMO, loading a state drops the subscriptions of the vehicles.
+        """
+        with open(file_name, "rb") as f:
+            state = pickle.load(f)
+        if state["_next_pending"] > len(self._pending):
+            raise TraCIException("The state " + file_name + " does not belong to the loaded route files")
+        for name in STATE_ATTRIBUTES:
+            setattr(self, name, state[name])
+        self.departed = []
+        self.arrived = []
+        self.vehicle_subscriptions = {}
+        self._edge_values = None
+
+    def edge_values(self):
+        """
+        :return: {variable: float64[n]} of the edge variables of the last step, computed once per step
+        """
+        if self._edge_values is None:
+            slots = np.flatnonzero(self.active[:self._size])
+            counts = self.edge_counts.astype(np.float64)
+            speed_sums = np.bincount(self.edge[slots], weights=self.speed[slots], minlength=self.graph.num_edges)
+            # like SUMO, an empty edge reports its speed limit
+            mean_speed = np.where(counts > 0, speed_sums / np.maximum(counts, 1), self.free_speed)
+            self._edge_values = {
+                tc.LAST_STEP_VEHICLE_NUMBER: counts,
+                tc.LAST_STEP_MEAN_SPEED: mean_speed,
+                tc.LAST_STEP_OCCUPANCY: np.minimum(100.0, 100.0 * counts * VEHICLE_SPACE / self.lane_space),
+                tc.VAR_CURRENT_TRAVELTIME: self.lengths / np.maximum(mean_speed, MIN_SPEED),
+            }
+        return self._edge_values
+
+
+_simulation = None
+
+
+def _current():
+    if _simulation is None:
+        raise FatalTraCIError("Not connected.")
+    return _simulation
+
+
+def _read_configuration(config_file):
+    # net file, route files and end time named in a .sumocfg file, relative to its directory
+    directory = os.path.dirname(os.path.abspath(config_file))
+    root = ET.parse(config_file).getroot()
+    values = {}
+    for option in ("net-file", "route-files", "step-length", "time-to-teleport"):
+        node = root.find(".//" + option)
+        if node is not None:
+            values[option] = node.get("value")
+    for option in ("net-file", "route-files"):
+        if option in values:
+            values[option] = ",".join(os.path.join(directory, name.strip()) for name in values[option].split(","))
+    return values
+
+
+def _parse_command(cmd):
+    values = {}
+    aliases = {"-c": "configuration-file", "-n": "net-file", "-r": "route-files"}
+    arguments = list(cmd[1:])
+    for i, argument in enumerate(arguments[:-1]):
+        option = aliases.get(argument, argument.lstrip("-"))
+        if option == "configuration-file":
+            values.update(_read_configuration(arguments[i + 1]))
+    for i, argument in enumerate(arguments[:-1]):
+        option = aliases.get(argument, argument.lstrip("-"))
+        if option in ("net-file", "route-files", "step-length", "time-to-teleport"):
+            values[option] = arguments[i + 1]
+    return values
+
+
+def start_simulation(graph, route_file_names, step_length=1.0, time_to_teleport=TIME_TO_TELEPORT):
+    """
+    Starts a simulation of the given compiled map without parsing any SUMO command line.
+    :return: the MesoSimulation
+    """
+    global _simulation
+    _simulation = MesoSimulation(graph, route_file_names, step_length, time_to_teleport)
+    return _simulation
+
+
+def start(cmd, port=None, numRetries=None, label="default", verbose=False, traceFile=None, traceGetters=True,
+          stdout=None, doSwitch=True):
+    """
+    Like traci.start: cmd is a SUMO command line, of which -c, -n, -r, --step-length and --time-to-teleport
+    are used, every other option is ignored. The remaining parameters are accepted for compatibility only.
+    """
+    values = _parse_command(cmd)
+    if "net-file" not in values:
+        raise FatalTraCIError("No network file given in " + " ".join(cmd))
+    graph = map_bundle.load_map_bundle(values["net-file"]).graph()
+    route_file_names = [name for name in values.get("route-files", "").split(",") if name]
+    start_simulation(graph, route_file_names, float(values.get("step-length", 1.0)),
+                     float(values.get("time-to-teleport", TIME_TO_TELEPORT)))
+    return None
+
+
+def isLoaded():
+    return _simulation is not None
+
+
+def close(wait=True):
+    global _simulation
+    _simulation = None
+
+
+def simulationStep(step=0.0):
+    simulation = _current()
+    if step > 0:
+        # like TraCI, the departures and arrivals of all the steps up to the target time are reported,
+        # so a vehicle can depart and arrive within one call
+        departed, arrived = [], []
+        while simulation.time + simulation.step_length <= step + 1e-9:
+            simulation.step()
+            departed.extend(simulation.departed)
+            arrived.extend(simulation.arrived)
+        simulation.departed, simulation.arrived = departed, arrived
+    else:
+        simulation.step()
+
+
+class _SimulationDomain:
+    def getTime(self):
+        return _current().time
+
+    def getDeltaT(self):
+        return _current().step_length
+
+    def getMinExpectedNumber(self):
+        return _current().expected_number()
+
+    def getDepartedIDList(self):
+        return tuple(_current().departed)
+
+    def getDepartedNumber(self):
+        return len(_current().departed)
+
+    def getArrivedIDList(self):
+        return tuple(_current().arrived)
+
+    def getArrivedNumber(self):
+        return len(_current().arrived)
+
+    def saveState(self, fileName):
+        _current().save_state(fileName)
+
+    def loadState(self, fileName):
+        _current().load_state(fileName)
+
+
+class _VehicleDomain:
+    def __init__(self):
+        self._getters = {tc.VAR_ROAD_ID: self.getRoadID, tc.VAR_SPEED: self.getSpeed,
+                         tc.VAR_LANEPOSITION: self.getLanePosition, tc.VAR_ROUTE_INDEX: self.getRouteIndex}
+
+    def getIDList(self):
+        return _current().vehicle_ids()
+
+    def getIDCount(self):
+        return len(_current().vehicle_ids())
+
+    def getRoadID(self, vehicle_id):
+        simulation = _current()
+        return simulation.graph.edge_ids[simulation.edge[simulation.slot(vehicle_id)]]
+
+    def getSpeed(self, vehicle_id):
+        simulation = _current()
+        return float(simulation.speed[simulation.slot(vehicle_id)])
+
+    def getLanePosition(self, vehicle_id):
+        simulation = _current()
+        slot = simulation.slot(vehicle_id)
+        return float(simulation.lengths[simulation.edge[slot]] - max(simulation.remaining[slot], 0.0))
+
+    def getRoute(self, vehicle_id):
+        simulation = _current()
+        return tuple(simulation.graph.edge_ids[index] for index in simulation.routes[simulation.slot(vehicle_id)])
+
+    def getRouteIndex(self, vehicle_id):
+        simulation = _current()
+        return int(simulation.route_index[simulation.slot(vehicle_id)])
+
+    def changeTarget(self, vehicle_id, edge_id):
+        _current().change_target(vehicle_id, edge_id)
+
+    def setRoute(self, vehicle_id, edge_list):
+        _current().set_route(vehicle_id, list(edge_list))
+
+    def setColor(self, vehicle_id, color):
+        # there is nothing to draw, only check that the vehicle exists
+        _current().slot(vehicle_id)
+
+    def subscribe(self, vehicle_id, varIDs=(tc.VAR_ROAD_ID, tc.VAR_LANEPOSITION), begin=None, end=None):
+        simulation = _current()
+        simulation.slot(vehicle_id)
+        for variable in varIDs:
+            if variable not in self._getters:
+                raise TraCIException("The meso simulation cannot subscribe vehicle variable " + hex(variable))
+        simulation.vehicle_subscriptions[vehicle_id] = tuple(varIDs)
+
+    def getAllSubscriptionResults(self):
+        simulation = _current()
+        return {vehicle_id: {variable: self._getters[variable](vehicle_id) for variable in variables}
+                for vehicle_id, variables in simulation.vehicle_subscriptions.items()}
+
+
+class _EdgeDomain:
+    def getIDList(self):
+        return tuple(_current().graph.edge_ids)
+
+    def _value(self, edge_id, variable):
+        simulation = _current()
+        if edge_id not in simulation.graph.edge_index:
+            raise TraCIException("Edge '" + str(edge_id) + "' is not known.")
+        return simulation.edge_values()[variable][simulation.graph.edge_index[edge_id]]
+
+    def getLastStepVehicleNumber(self, edge_id):
+        return int(self._value(edge_id, tc.LAST_STEP_VEHICLE_NUMBER))
+
+    def getLastStepMeanSpeed(self, edge_id):
+        return float(self._value(edge_id, tc.LAST_STEP_MEAN_SPEED))
+
+    def getLastStepOccupancy(self, edge_id):
+        return float(self._value(edge_id, tc.LAST_STEP_OCCUPANCY))
+
+    def getTraveltime(self, edge_id):
+        return float(self._value(edge_id, tc.VAR_CURRENT_TRAVELTIME))
+
+    def subscribe(self, edge_id, varIDs=(tc.LAST_STEP_VEHICLE_NUMBER,), begin=None, end=None):
+        simulation = _current()
+        if edge_id not in simulation.graph.edge_index:
+            raise TraCIException("Edge '" + str(edge_id) + "' is not known.")
+        for variable in varIDs:
+            if variable not in (tc.LAST_STEP_VEHICLE_NUMBER, tc.LAST_STEP_MEAN_SPEED, tc.LAST_STEP_OCCUPANCY,
+                                tc.VAR_CURRENT_TRAVELTIME):
+                raise TraCIException("The meso simulation cannot subscribe edge variable " + hex(variable))
+        simulation.edge_subscriptions[edge_id] = tuple(varIDs)
+
+    def getAllSubscriptionResults(self):
+        simulation = _current()
+        values = simulation.edge_values()
+        edge_index = simulation.graph.edge_index
+        return {edge_id: {variable: float(values[variable][edge_index[edge_id]]) for variable in variables}
+                for edge_id, variables in simulation.edge_subscriptions.items()}
+
+
+simulation = _SimulationDomain()
+vehicle = _VehicleDomain()
+edge = _EdgeDomain()
@@ -83,3 +83,54 @@ def getEdgesInfo(net):
                 out_dict[current_edge_id][dir_now] = current_out_edge.getID()
 
     return [length_dict, out_dict, index_dict, edge_list]
+
+
+class CompiledEdge:
+    """
+        Lightweight stand-in for sumolib.net.edge.Edge, backed by a row of a CompiledGraph.
+        Offers the part of the sumolib Edge interface used by the vehicle generation protocols,
+        so that maps loaded from a map bundle do not have to be parsed by sumolib.
+        
+        param @graph <CompiledGraph>: the compiled map.
+        param @index <int>: the index of the edge in @graph.
+    """
+    def __init__(self, graph, index):
+        self._graph = graph
+        self._index = index
+
+    def getID(self):
+        return self._graph.edge_ids[self._index]
+
+    def getIndex(self):
+        return self._index
+
+    def getLength(self):
+        return float(self._graph.lengths[self._index])
+
+    def getSpeed(self):
+        return float(self._graph.speeds[self._index])
+
+    def getLaneNumber(self):
+        return int(self._graph.lane_counts[self._index])
+
+    def allows(self, vClass):
+        # the compiled map only records whether passenger vehicles are allowed
+        return vClass == "passenger" and bool(self._graph.passenger[self._index])
+
+    def __repr__(self):
+        return '<edge id="' + self.getID() + '"/>'
+
+
+def getEdgesInfoFromGraph(graph):
+    """
+        param @graph <CompiledGraph>: the compiled map, e.g. from a map bundle.
+        
+        Function to retrieve the data of the edges without parsing the network file.
+        The return value has the format of getEdgesInfo, except that the edges in
+        the list [3] are of type CompiledEdge.
+    """
+    length_dict = graph.edge_length_dict()
+    out_dict = graph.outgoing_edges_dict()
+    index_dict = dict(graph.edge_index)
+    edge_list = [CompiledEdge(graph, index) for index in graph.passenger_edges.tolist()]
+    return [length_dict, out_dict, index_dict, edge_list]
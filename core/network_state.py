@@ -0,0 +1,170 @@
+"""
+    This file contains the per-step snapshot of the traffic state of the
+    passenger edges, stored as NumPy arrays aligned with the compiled edge index.
+"""
+
+import os
+import sys
+import time
+from collections.abc import Mapping
+import numpy as np
+
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("No environment variable SUMO_HOME!")
+
+from core.sumo_backend import traci
+from core import profiling
+import traci.constants as tc
+
+# edge variables delivered by the snapshot subscription, in the order of the snapshot arrays
+SNAPSHOT_VARIABLES = (tc.LAST_STEP_VEHICLE_NUMBER, tc.LAST_STEP_MEAN_SPEED, tc.LAST_STEP_OCCUPANCY,
+                      tc.VAR_CURRENT_TRAVELTIME)
+
+
+class NetworkSnapshot:
+    """
+    Traffic state of the passenger edges at the current step.
+    Available arrays (indexed like connection_info.graph, entries of other edges stay 0):
+        - vehicle_count float64[n] number of vehicles on the edge in the last step
+        - mean_speed float64[n] mean speed on the edge in the last step (m/s)
+        - occupancy float64[n] occupancy of the edge in the last step (%)
+        - travel_time float64[n] current estimated travel time of the edge (s)
+    The arrays are populated lazily: nothing is requested from SUMO until a controller first reads one of them.
+    The first read subscribes the variables of every passenger edge, from then on the values arrive together
+    with every simulation step and a read only unpacks getAllSubscriptionResults once per step.
+    :param graph: the CompiledGraph of the map, e.g. connection_info.graph
+    """
+    def __init__(self, graph):
+        self.graph = graph
+        self.step = -1
+        self._passenger_ids = graph.passenger_edge_ids()
+        self._passenger_rows = graph.passenger_edges
+        self._arrays = np.zeros((len(SNAPSHOT_VARIABLES), graph.num_edges), dtype=np.float64)
+        self._subscribed = False
+        self._fresh = False
+        self.profiler = None # StepProfiler timing the refreshes, set by StrSumo
+
+    def advance(self, step):
+        """
+        Marks the arrays as outdated; called by StrSumo once per simulation step.
+        """
+        self.step = step
+        self._fresh = False
+
+    @property
+    def populated(self):
+        return self._fresh
+
+    def subscribe(self):
+        """
+        Subscribes the snapshot variables of every passenger edge. Called on first read if not called before.
+        """
+        if self._subscribed:
+            return
+        for edge in self._passenger_ids:
+            traci.edge.subscribe(edge, SNAPSHOT_VARIABLES)
+        self._subscribed = True
+
+    def reset_subscription(self):
+        """
+        Forgets the subscription, e.g. after traci.simulation.loadState, which drops all subscriptions.
+        The next read subscribes the edges again.
+        """
+        self._subscribed = False
+        self._fresh = False
+
+    def refresh(self):
+        """
+        Fills the arrays from the subscription results of the current step.
+        """
+        start = time.perf_counter() if self.profiler is not None else 0.0
+        self.subscribe()
+        results = traci.edge.getAllSubscriptionResults()
+        values = [results[edge] for edge in self._passenger_ids]
+        for row, variable in enumerate(SNAPSHOT_VARIABLES):
+            self._arrays[row, self._passenger_rows] = [value[variable] for value in values]
+        self._fresh = True
+        if self.profiler is not None:
+            self.profiler.add_nested(profiling.EDGE_STATES, time.perf_counter() - start)
+
+    @property
+    def arrays(self):
+        """
+        :return: float64[4, n] the rows vehicle_count, mean_speed, occupancy and travel_time, as last refreshed
+        """
+        return self._arrays
+
+    def use_arrays(self, arrays):
+        """
+        Moves the snapshot into arrays of the same shape, e.g. a view of shared memory read by other processes.
+        """
+        arrays[...] = self._arrays
+        self._arrays = arrays
+
+    def _array(self, row):
+        if not self._fresh:
+            self.refresh()
+        return self._arrays[row]
+
+    @property
+    def vehicle_count(self):
+        return self._array(0)
+
+    @property
+    def mean_speed(self):
+        return self._array(1)
+
+    @property
+    def occupancy(self):
+        return self._array(2)
+
+    @property
+    def travel_time(self):
+        return self._array(3)
+
+
+class SharedNetworkSnapshot(NetworkSnapshot):
+    """
+    Read-only NetworkSnapshot over arrays refreshed by another process, e.g. the main process of
+    parallel_decisions.py; it never talks to SUMO.
+    :param graph: the CompiledGraph of the map
+    :param arrays: float64[4, n] view of the NetworkSnapshot.arrays of the other process
+    """
+    def __init__(self, graph, arrays):
+        super().__init__(graph)
+        self._arrays = arrays
+
+    def subscribe(self):
+        pass
+
+    def refresh(self):
+        self._fresh = True
+
+
+class EdgeVehicleCountView(Mapping):
+    """
+    Read-only {edge_id: number of vehicles at edge} view of a NetworkSnapshot over the passenger edges.
+    StrSumo installs it as connection_info.edge_vehicle_count, so policies indexing that dictionary
+    only trigger the snapshot when they actually read it.
+    """
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self._edge_ids = snapshot.graph.passenger_edge_ids()
+        self._edge_set = set(self._edge_ids)
+
+    def __getitem__(self, edge_id):
+        if edge_id not in self._edge_set:
+            raise KeyError(edge_id)
+        return int(self.snapshot.vehicle_count[self.snapshot.graph.edge_index[edge_id]])
+
+    def __iter__(self):
+        return iter(self._edge_ids)
+
+    def __len__(self):
+        return len(self._edge_ids)
+
+    def __contains__(self, edge_id):
+        return edge_id in self._edge_set
@@ -0,0 +1,348 @@
+"""
+    This file contains the parallel execution mode of the route controllers:
+    the vehicles to direct in a step are split into contiguous shards, which
+    a persistent pool of worker processes decides with their own copy of the
+    route controller.
+
+    The compiled map, the arrays of the network snapshot and the columns of
+    the vehicle table are placed in shared memory, so the workers read them
+    without copies and only the vehicle ids of a shard and its decisions are
+    sent between the processes at every step. The decisions are merged in
+    the order of the shards, so the result is the one of the serial mode for
+    every controller whose decision for a vehicle only depends on that
+    vehicle and the network state (RouteController.parallel_safe).
+"""
+
+import multiprocessing
+import os
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+from core import sim_log
+
+logger = sim_log.get_logger("parallel_decisions")
+
+# arrays of the CompiledGraph placed in shared memory
+GRAPH_ARRAYS = ("lengths", "speeds", "lane_counts", "passenger", "succ_ptr", "succ_edge", "succ_dir")
+
+# columns of the VehicleTable placed in shared memory
+VEHICLE_COLUMNS = ("destination", "start_time", "deadline", "current_edge", "current_speed", "local_destination")
+
+# fewer vehicles than this per worker are decided in the main process, where no message has to be sent
+DEFAULT_MIN_SHARD = 4
+
+ALIGNMENT = 64
+
+
+class SharedArrays:
+    """
+    NumPy arrays stored one after another in one block of shared memory.
+    :param block: the multiprocessing.shared_memory.SharedMemory holding the arrays
+    :param layout: [(name, dtype string, shape, offset)] of the arrays in the block
+    :param owner: whether this process created the block and unlinks it on close
+    """
+    def __init__(self, block, layout, owner):
+        self.block = block
+        self.layout = layout
+        self.owner = owner
+        self.arrays = {name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf, offset=offset)
+                       for name, dtype, shape, offset in layout}
+
+    @classmethod
+    def create(cls, arrays):
+        """
+        :param arrays: {name: array}, copied into a new block
+        :return: the SharedArrays owning the block
+        """
+        layout = []
+        size = 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            layout.append((name, array.dtype.str, array.shape, size))
+            size += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        shared = cls(block, layout, True)
+        for name, array in arrays.items():
+            shared.arrays[name][...] = array
+        return shared
+
+    @property
+    def spec(self):
+        """
+        :return: picklable (block name, layout) to attach to the block in another process
+        """
+        return self.block.name, self.layout
+
+    @classmethod
+    def attach(cls, spec):
+        """
+        :param spec: SharedArrays.spec of a block created by another process
+        :return: the SharedArrays viewing the block
+        """
+        name, layout = spec
+        try:
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # before Python 3.13 attaching registers the block again with the resource tracker, which the
+            # workers share with the process that created it; registering twice is harmless
+            block = shared_memory.SharedMemory(name=name)
+        return cls(block, layout, False)
+
+    def close(self):
+        """
+        Releases the block, unlinking it in the process that created it. The arrays must not be used afterwards.
+        """
+        self.arrays = {}
+        try:
+            self.block.close()
+        except BufferError:
+            # views of the arrays are still referenced somewhere; the mapping is released together with them
+            pass
+        if self.owner:
+            self.block.unlink()
+
+
+def _worker(connection, controller_factory, net_filename, use_bundle, edge_ids, direction_names, graph_spec,
+            state_spec):
+    # entry of a worker process: builds the controller on the shared map, then decides the shards it receives
+    # until it receives None
+    from core.Util import ConnectionInfo, Vehicle
+    from core import map_bundle
+    from core.compiled_graph import CompiledGraph
+    from core.network_state import SharedNetworkSnapshot, EdgeVehicleCountView
+    from core.vehicle_table import VehicleTable
+
+    blocks = []
+    try:
+        graph_block = SharedArrays.attach(graph_spec)
+        state_block = SharedArrays.attach(state_spec)
+        blocks = [graph_block, state_block]
+        arrays = graph_block.arrays
+        graph = CompiledGraph(edge_ids, arrays["lengths"], arrays["speeds"], arrays["lane_counts"],
+                              arrays["passenger"], arrays["succ_ptr"], arrays["succ_edge"], arrays["succ_dir"],
+                              direction_names)
+        # the tables derived from the map (landmarks, hierarchy) are read from the cache on first use
+        bundle = map_bundle.load_map_bundle(net_filename) if use_bundle else None
+        connection_info = ConnectionInfo.from_graph(graph, net_filename, bundle)
+        network_state = SharedNetworkSnapshot(graph, state_block.arrays["state"])
+        connection_info.network_state = network_state
+        connection_info.edge_vehicle_count = EdgeVehicleCountView(network_state)
+        controller = controller_factory(connection_info)
+        table = None
+        connection.send(("ready", None))
+    except Exception:
+        connection.send(("error", traceback.format_exc()))
+        return
+
+    vehicle_block = None
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        kind, payload = message
+        try:
+            if kind == "vehicles":
+                # the vehicle table was (re)placed in shared memory
+                vehicle_ids, table_edge_ids, vehicle_spec = payload
+                old_block, vehicles = vehicle_block, None
+                vehicle_block = SharedArrays.attach(vehicle_spec)
+                table = VehicleTable(table_edge_ids)
+                table.use_columns(vehicle_block.arrays, vehicle_ids)
+                if old_block is not None:
+                    old_block.close()
+                connection.send(("ok", None))
+            else:
+                step, vehicle_ids, full_route = payload
+                network_state.advance(step)
+                vehicles = [Vehicle.view(table, table.row_of[vehicle_id]) for vehicle_id in vehicle_ids]
+                if full_route:
+                    decisions = controller.make_route_decisions(vehicles, connection_info)
+                else:
+                    decisions = controller.make_decisions(vehicles, connection_info)
+                connection.send(("ok", decisions))
+        except Exception:
+            connection.send(("error", traceback.format_exc()))
+    if vehicle_block is not None:
+        vehicle_block.close()
+    for block in blocks:
+        block.close()
+
+
+class ParallelDecisions:
+    """
+    Makes the decisions of a route controller on a persistent pool of worker processes, see StrSumo.
+    Each worker builds its own controller with controller_factory(connection_info) on a ConnectionInfo whose
+    graph and network_state are views of shared memory. The controller must be parallel_safe: its decision
+    for a vehicle may only depend on the vehicle and the network state, and it must not modify the vehicles.
+    :param workers: number of worker processes, os.cpu_count() if None
+    :param controller_factory: callable building the controller of a worker from a ConnectionInfo, e.g.
+                               functools.partial(DijkstraPolicy, routing="ch"); type(route_controller) if None
+    :param min_shard: batches with fewer vehicles than min_shard per worker are decided in the main process
+    :param share_network_state: refresh the network snapshot before every parallel batch, so the workers can
+                                read it; None to do so only for controllers with reads_network_state
+    :param start_method: multiprocessing start method of the workers; spawn by default, since forking a process
+                         connected to SUMO (or running libsumo) is not safe
+    """
+    def __init__(self, workers=None, controller_factory=None, min_shard=DEFAULT_MIN_SHARD, share_network_state=None,
+                 start_method="spawn"):
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.controller_factory = controller_factory
+        self.min_shard = min_shard
+        self.share_network_state = share_network_state
+        self.start_method = start_method
+        self.route_controller = None
+        self._connections = []
+        self._processes = []
+        self._graph_block = None
+        self._state_block = None
+        self._vehicle_block = None
+        self._vehicle_table = None
+        self._shared_rows = 0
+        self._network_state = None
+        self._refresh_network_state = False
+
+    @property
+    def started(self):
+        return bool(self._processes)
+
+    def start(self, route_controller, vehicle_table, network_state):
+        """
+        Places the map, the snapshot arrays and the vehicle table in shared memory and starts the workers.
+        Called by StrSumo.run.
+        :param route_controller: the controller of the simulation, which decides the small batches
+        :param vehicle_table: the VehicleTable of the controlled vehicles
+        :param network_state: the NetworkSnapshot of the simulation
+        """
+        if self.started:
+            self.stop()
+        if not getattr(route_controller, "parallel_safe", False):
+            raise ValueError(type(route_controller).__name__ + " does not support parallel decisions")
+        self.route_controller = route_controller
+        self._refresh_network_state = self.share_network_state if self.share_network_state is not None else \
+            getattr(route_controller, "reads_network_state", True)
+        connection_info = route_controller.connection_info
+        graph = connection_info.graph
+        factory = self.controller_factory if self.controller_factory is not None else type(route_controller)
+        self._graph_block = SharedArrays.create({name: getattr(graph, name) for name in GRAPH_ARRAYS})
+        self._state_block = SharedArrays.create({"state": network_state.arrays})
+        network_state.use_arrays(self._state_block.arrays["state"])
+        self._network_state = network_state
+        self._vehicle_table = vehicle_table
+
+        context = multiprocessing.get_context(self.start_method)
+        for _ in range(self.workers):
+            parent_end, child_end = context.Pipe()
+            process = context.Process(target=_worker, daemon=True,
+                                      args=(child_end, factory, connection_info.net_filename,
+                                            getattr(connection_info, "map_bundle", None) is not None, graph.edge_ids,
+                                            graph.direction_names, self._graph_block.spec, self._state_block.spec))
+            process.start()
+            child_end.close()
+            self._connections.append(parent_end)
+            self._processes.append(process)
+        try:
+            self._collect([None] * self.workers)
+            self._share_vehicles()
+        except Exception:
+            self.stop()
+            raise
+
+    def _share_vehicles(self):
+        # moves the columns of the vehicle table into a new block of shared memory and announces it
+        table = self._vehicle_table
+        old_block = self._vehicle_block
+        self._vehicle_block = SharedArrays.create({name: getattr(table, name) for name in VEHICLE_COLUMNS})
+        table.use_columns(self._vehicle_block.arrays)
+        self._shared_rows = len(table)
+        payload = (list(table.vehicle_ids), list(table.edge_ids), self._vehicle_block.spec)
+        for connection in self._connections:
+            connection.send(("vehicles", payload))
+        self._collect([None] * self.workers)
+        if old_block is not None:
+            old_block.close()
+
+    def _collect(self, shards):
+        # receives one reply from every worker that was sent a shard, in the order of the shards
+        results = []
+        error = None
+        for connection, shard in zip(self._connections, shards):
+            if shard is None or len(shard) > 0:
+                status, result = connection.recv()
+                if status == "error":
+                    error = error or result
+                results.append(result)
+        if error is not None:
+            raise RuntimeError("A decision worker failed:\n" + error)
+        return results
+
+    def decide(self, vehicles, step, full_route=False):
+        """
+        :param vehicles: list of the vehicles to direct, views of the rows of the vehicle table
+        :param step: the current step
+        :param full_route: call make_route_decisions instead of make_decisions
+        :return: the decisions {vehicle_id: decision}, ordered like vehicles
+        """
+        controller = self.route_controller
+        connection_info = controller.connection_info
+        if len(vehicles) < self.min_shard * self.workers:
+            if full_route:
+                return controller.make_route_decisions(vehicles, connection_info)
+            return controller.make_decisions(vehicles, connection_info)
+
+        table = self._vehicle_table
+        shared_columns = self._vehicle_block.arrays
+        if len(table) != self._shared_rows or table.destination is not shared_columns["destination"]:
+            # vehicles were added to the table since it was shared, the workers do not know them
+            self._share_vehicles()
+        if self._refresh_network_state and not self._network_state.populated:
+            self._network_state.refresh()
+
+        # contiguous shards of nearly equal size, merged in order
+        vehicle_ids = [vehicle.vehicle_id for vehicle in vehicles]
+        bounds = np.linspace(0, len(vehicle_ids), self.workers + 1).astype(int).tolist()
+        shards = [vehicle_ids[bounds[i]:bounds[i + 1]] for i in range(self.workers)]
+        for connection, shard in zip(self._connections, shards):
+            if shard:
+                connection.send(("decide", (step, shard, full_route)))
+        decisions = {}
+        for result in self._collect(shards):
+            decisions.update(result)
+        return decisions
+
+    def stop(self):
+        """
+        Stops the workers and releases the shared memory; the vehicle table and the snapshot get private copies
+        of their arrays back.
+        """
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                logger.warning("Terminating decision worker %s", process.pid)
+                process.terminate()
+        for connection in self._connections:
+            connection.close()
+        self._connections = []
+        self._processes = []
+        if self._vehicle_block is not None:
+            table = self._vehicle_table
+            table.use_columns({name: getattr(table, name).copy() for name in VEHICLE_COLUMNS})
+            self._vehicle_block.close()
+            self._vehicle_block = None
+        if self._state_block is not None:
+            self._network_state.use_arrays(self._network_state.arrays.copy())
+            self._state_block.close()
+            self._state_block = None
+        if self._graph_block is not None:
+            self._graph_block.close()
+            self._graph_block = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
@@ -0,0 +1,255 @@
+"""
+    This file contains the profiler of the StrSumo run loop: per-phase timers
+    and per-step counters, the number of TraCI round-trips, and the decision
+    latency of the route controller, exported as JSON or CSV.
+
+    Profiling is off unless a StepProfiler is passed to StrSumo; the run loop
+    then only tests for None once per phase.
+"""
+
+import csv
+import json
+import time
+import types
+import numpy as np
+
+# phases of a step of StrSumo.run, in the order of the columns of the per-step table
+COLLECT = 0 # reading the states of the controlled vehicles, finding the ones to direct
+EDGE_STATES = 1 # refreshing the network snapshot, done when a controller first reads it in a step
+DECISIONS = 2 # make_decisions of the route controller, without EDGE_STATES
+CHANGE_TARGET = 3 # sending the local targets to SUMO
+ARRIVALS = 4 # bookkeeping of the arrived vehicles
+SIMULATION_STEP = 5 # traci.simulationStep, plus saving a state if requested
+PHASES = ("collect", "edge_states", "decisions", "change_target", "arrivals", "simulation_step")
+
+# per-step counters
+VEHICLES_DIRECTED = 0
+DECISIONS_ISSUED = 1
+ROUND_TRIPS = 2
+ARRIVED = 3
+COUNTERS = ("vehicles_directed", "decisions_issued", "round_trips", "arrived")
+
+# calls answered from the results SUMO sent with the last simulation step, they need no round-trip
+LOCAL_CALLS = frozenset(["getAllSubscriptionResults", "getSubscriptionResults",
+                         "getAllContextSubscriptionResults", "getContextSubscriptionResults"])
+
+# decision latency histogram bins: 100 ns to 10 s, 4 bins per decade
+LATENCY_BINS = np.logspace(-7, 1, 33)
+
+
+class _CountingDomain:
+    # stands in for a traci domain such as traci.vehicle, counting every call that costs a round-trip
+    def __init__(self, domain, counts):
+        self._domain = domain
+        self._counts = counts
+        self._wrapped = {}
+
+    def __getattr__(self, name):
+        if name in self._wrapped:
+            return self._wrapped[name]
+        value = getattr(self._domain, name)
+        if callable(value) and not isinstance(value, type) and name not in LOCAL_CALLS:
+            value = _counting(value, self._counts)
+        self._wrapped[name] = value
+        return value
+
+
+def _counting(function, counts):
+    def call(*args, **kwargs):
+        counts[ROUND_TRIPS] += 1
+        return function(*args, **kwargs)
+    return call
+
+
+class CallCounter:
+    """
+    Wrapper of a SUMO backend module (traci, libsumo, meso_sim) counting the calls that need a round-trip
+    to SUMO over traci into the ROUND_TRIPS counter of a StepProfiler. Installed with SumoBackend.instrument.
+    """
+    def __init__(self, module, profiler):
+        self._module = module
+        self._profiler = profiler
+        self._wrapped = {}
+
+    def __getattr__(self, name):
+        if name in self._wrapped:
+            return self._wrapped[name]
+        value = getattr(self._module, name)
+        # modules (traci.constants), classes (exceptions) and plain values are passed through
+        if isinstance(value, (types.ModuleType, type, int, float, str, tuple)):
+            pass
+        elif callable(value):
+            value = _counting(value, self._profiler.counts)
+        else:
+            value = _CountingDomain(value, self._profiler.counts)
+        self._wrapped[name] = value
+        return value
+
+
+class StepProfiler:
+    """
+    Collects the time spent in every phase and the counters of every step of StrSumo.run,
+    and the latency of every make_decisions call per route controller class.
+    :param count_round_trips: count the calls to SUMO through core.sumo_backend.traci while attached
+    """
+    def __init__(self, count_round_trips=True):
+        self.count_round_trips = count_round_trips
+        self.rows = [] # (step, phase seconds..., counters...) per step
+        self.times = [0.0] * len(PHASES)
+        self.counts = [0] * len(COUNTERS)
+        self.latencies = {} # {controller class name: ([seconds per call], [vehicles per call])}
+        self._step = None
+        self._last = 0.0
+        self._nested = 0.0
+        self._backend = None
+        self._started = None
+        self.wall_time = 0.0
+
+    def attach(self, backend):
+        """
+        Starts profiling a run talking to SUMO through backend (core.sumo_backend.traci).
+        """
+        self._started = time.perf_counter()
+        if self.count_round_trips:
+            self._backend = backend
+            backend.instrument(CallCounter(backend.module, self))
+
+    def detach(self):
+        if self._backend is not None:
+            self._backend.instrument(None)
+            self._backend = None
+        if self._started is not None:
+            self.wall_time += time.perf_counter() - self._started
+            self._started = None
+
+    def begin_step(self, step):
+        self._step = step
+        self.times = [0.0] * len(PHASES)
+        self.counts[:] = [0] * len(COUNTERS)
+        self._nested = 0.0
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        """
+        Attributes the time since the previous lap, minus the nested time recorded meanwhile, to phase.
+        :return: the seconds attributed to phase
+        """
+        now = time.perf_counter()
+        seconds = now - self._last - self._nested
+        self.times[phase] += seconds
+        self._last = now
+        self._nested = 0.0
+        return seconds
+
+    def add_nested(self, phase, seconds):
+        """
+        Attributes seconds spent inside the current lap to phase instead, e.g. a snapshot refresh
+        triggered by a controller.
+        """
+        self.times[phase] += seconds
+        self._nested += seconds
+
+    def count(self, counter, number=1):
+        self.counts[counter] += number
+
+    def record_decisions(self, controller, num_vehicles, seconds):
+        """
+        :param controller: the route controller, its class name keys the latency histogram
+        :param num_vehicles: number of vehicles passed to make_decisions
+        :param seconds: latency of the make_decisions call
+        """
+        if num_vehicles == 0:
+            return
+        name = type(controller).__name__
+        if name not in self.latencies:
+            self.latencies[name] = ([], [])
+        call_latencies, call_vehicles = self.latencies[name]
+        call_latencies.append(seconds)
+        call_vehicles.append(num_vehicles)
+
+    def end_step(self):
+        self.rows.append(tuple([self._step] + self.times + self.counts))
+
+    def phase_totals(self):
+        """
+        :return: {phase: total seconds}
+        """
+        if not self.rows:
+            return dict.fromkeys(PHASES, 0.0)
+        table = np.array(self.rows, dtype=np.float64)
+        return {phase: float(table[:, 1 + i].sum()) for i, phase in enumerate(PHASES)}
+
+    def counter_totals(self):
+        """
+        :return: {counter: total over all steps}
+        """
+        if not self.rows:
+            return dict.fromkeys(COUNTERS, 0)
+        table = np.array(self.rows, dtype=np.float64)
+        return {counter: int(table[:, 1 + len(PHASES) + i].sum()) for i, counter in enumerate(COUNTERS)}
+
+    def controller_statistics(self):
+        """
+        :return: {controller class name: {calls, vehicles, latency percentiles, per vehicle mean, histogram}}
+        """
+        statistics = {}
+        for name, (call_latencies, call_vehicles) in self.latencies.items():
+            latencies = np.array(call_latencies)
+            histogram, _ = np.histogram(latencies, bins=LATENCY_BINS)
+            statistics[name] = {
+                "calls": len(latencies),
+                "vehicles": int(np.sum(call_vehicles)),
+                "latency_p50": float(np.percentile(latencies, 50)),
+                "latency_p95": float(np.percentile(latencies, 95)),
+                "latency_p99": float(np.percentile(latencies, 99)),
+                "latency_max": float(latencies.max()),
+                "latency_per_vehicle": float(latencies.sum() / np.sum(call_vehicles)),
+                "histogram": {"bin_edges": LATENCY_BINS.tolist(), "counts": histogram.tolist()},
+            }
+        return statistics
+
+    def to_dict(self):
+        return {"steps": len(self.rows), "wall_time": self.wall_time, "phases": self.phase_totals(),
+                "counters": self.counter_totals(), "controllers": self.controller_statistics(),
+                "columns": ["step"] + list(PHASES) + list(COUNTERS), "rows": self.rows}
+
+    def write_json(self, file_name):
+        with open(file_name, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    def write_csv(self, file_name):
+        """
+        Writes the per-step table, one row per step with the seconds of every phase and the counters.
+        """
+        with open(file_name, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["step"] + list(PHASES) + list(COUNTERS))
+            writer.writerows(self.rows)
+
+    def write(self, file_name):
+        """
+        Writes the profile as JSON if file_name ends with .json, otherwise the per-step table as CSV.
+        """
+        if file_name.endswith(".json"):
+            self.write_json(file_name)
+        else:
+            self.write_csv(file_name)
+
+    def summary(self):
+        """
+        :return: a short text report of where the time of the run went
+        """
+        phases = self.phase_totals()
+        counters = self.counter_totals()
+        profiled = sum(phases.values())
+        lines = ["Profile of {} steps, {:.3f} s wall time, {:.3f} s in the profiled phases".format(
+            len(self.rows), self.wall_time, profiled)]
+        for phase in PHASES:
+            share = 100.0 * phases[phase] / profiled if profiled > 0 else 0.0
+            lines.append("  {:<16} {:>10.3f} s {:>6.1f} %".format(phase, phases[phase], share))
+        lines.append("  " + ", ".join("{}: {}".format(counter, counters[counter]) for counter in COUNTERS))
+        for name, statistics in self.controller_statistics().items():
+            lines.append("  {}: {} calls, latency p50 {:.3g} s, p95 {:.3g} s, p99 {:.3g} s, {:.3g} s per vehicle".format(
+                name, statistics["calls"], statistics["latency_p50"], statistics["latency_p95"],
+                statistics["latency_p99"], statistics["latency_per_vehicle"]))
+        return "\n".join(lines)
@@ -0,0 +1,190 @@
+"""
+    This file contains the reachability index of a map: the strongly connected
+    components of the passenger road graph and the reachability between them,
+    so that "is there a path from A to B" is answered without a path search.
+"""
+
+import numpy as np
+
+
+def strongly_connected_components(succ_ptr, succ_edge, num_nodes):
+    """
+    Iterative Tarjan's algorithm over CSR successor lists.
+    :param succ_ptr: list of num_nodes+1 offsets into succ_edge
+    :param succ_edge: list of successor node indices
+    :param num_nodes: number of nodes
+    :return: (component label list, number of components). Components are numbered in reverse topological
+             order, i.e. every arc between two components leads to a component with a smaller label.
+    """
+    index = [-1] * num_nodes
+    low = [0] * num_nodes
+    on_stack = [False] * num_nodes
+    component = [-1] * num_nodes
+    stack = []
+    counter = 0
+    num_components = 0
+
+    for root in range(num_nodes):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [[root, succ_ptr[root]]]
+        while work:
+            frame = work[-1]
+            node, k = frame
+            if k < succ_ptr[node + 1]:
+                frame[1] = k + 1
+                successor = succ_edge[k]
+                if index[successor] == -1:
+                    index[successor] = low[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    on_stack[successor] = True
+                    work.append([successor, succ_ptr[successor]])
+                elif on_stack[successor] and index[successor] < low[node]:
+                    low[node] = index[successor]
+                continue
+
+            work.pop()
+            if work and low[node] < low[work[-1][0]]:
+                low[work[-1][0]] = low[node]
+            if low[node] == index[node]:
+                # node is the root of a component, pop it from the stack
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component[member] = num_components
+                    if member == node:
+                        break
+                num_components += 1
+
+    return component, num_components
+
+
+class ReachabilityIndex:
+    """
+    Reachability between the edges of a CompiledGraph, following the passenger successor arrays.
+    The strongly connected components are condensed into a DAG, and the set of components reachable
+    from every component is stored as a bitset, so that reaches() is a single bit test. The bitsets take
+    up to num_components**2 / 8 bytes, fine for the few thousand components of a city map whose edges
+    mostly belong to one large component, but not meant for maps with 10**5 components and more.
+    Available collections:
+        - component int32[n] component label of every edge index
+        - num_components number of strongly connected components
+    :param graph: the CompiledGraph of the map
+    :param component: optional precomputed component labels (e.g. from a map bundle), numbered like
+                      strongly_connected_components numbers them
+    """
+    def __init__(self, graph, component=None):
+        self.graph = graph
+        succ_ptr, succ_edge, _, _ = graph.adjacency_lists()
+        if component is None:
+            component, self.num_components = strongly_connected_components(succ_ptr, succ_edge, graph.num_edges)
+        else:
+            component = np.asarray(component).tolist()
+            self.num_components = max(component) + 1 if component else 0
+        self.component = np.array(component, dtype=np.int32)
+        self._component_list = component
+
+        self._passenger_components = self.component[graph.passenger_edges]
+        self._passenger_sizes = np.bincount(self._passenger_components, minlength=self.num_components)
+        sizes = self._passenger_sizes.tolist()
+        # the components of every passenger edge count, as a bitset per count, for the weighted popcounts below
+        size_masks = {}
+        for label, size in enumerate(sizes):
+            if size:
+                size_masks[size] = size_masks.get(size, 0) | (1 << label)
+
+        # components are labelled sinks first, so every successor component is complete when it is used
+        members = [[] for _ in range(self.num_components)]
+        for node, label in enumerate(component):
+            members[label].append(node)
+        reach = [0] * self.num_components
+        counts = [0] * self.num_components
+        for label in range(self.num_components):
+            successor_labels = set()
+            for node in members[label]:
+                for k in range(succ_ptr[node], succ_ptr[node + 1]):
+                    successor_labels.add(component[succ_edge[k]])
+            successor_labels.discard(label)
+            bits = 1 << label
+            for successor_label in successor_labels:
+                bits |= reach[successor_label]
+            reach[label] = bits
+            # the passenger edges reachable from the component, added up along the DAG where it does not branch;
+            # only a component with several successor components may reach a component twice and needs a popcount
+            if len(successor_labels) <= 1:
+                counts[label] = sizes[label] + sum(counts[successor_label] for successor_label in successor_labels)
+            else:
+                counts[label] = sum(size * bin(bits & mask).count("1") for size, mask in size_masks.items())
+        self._reach = reach
+        self._reach_counts = np.array(counts, dtype=np.int64)
+
+    def reaches(self, source, destination):
+        """
+        :param source: edge index of the start edge
+        :param destination: edge index of the destination edge
+        :return: True if destination can be reached from source (an edge always reaches itself)
+        """
+        return (self._reach[self._component_list[source]] >> self._component_list[destination]) & 1 == 1
+
+    def reaches_edge(self, start_edge, destination):
+        """
+        :param start_edge: id of the start edge
+        :param destination: id of the destination edge
+        :return: True if destination can be reached from start_edge
+        """
+        edge_index = self.graph.edge_index
+        return self.reaches(edge_index[start_edge], edge_index[destination])
+
+    def _component_mask(self, label):
+        # bool[num_components] of the components reachable from component label
+        num_bytes = (self.num_components + 7) // 8
+        bits = np.frombuffer(self._reach[label].to_bytes(num_bytes, "little"), dtype=np.uint8)
+        return np.unpackbits(bits, bitorder="little")[:self.num_components].astype(bool)
+
+    def reachable_edges(self, source):
+        """
+        :param source: edge index of the start edge
+        :return: sorted int32 array of the passenger edge indices reachable from source, including itself
+        """
+        mask = self._component_mask(self._component_list[source])
+        return self.graph.passenger_edges[mask[self._passenger_components]]
+
+    def reach_counts(self):
+        """
+        :return: int64[num_components] number of passenger edges reachable from every component
+        """
+        return self._reach_counts
+
+    def sample_pairs(self, num_pairs, rng=None):
+        """
+        Samples ordered pairs of distinct passenger edges (start, destination) such that the destination is
+        reachable from the start, uniformly among all such pairs, without rejection sampling.
+        :param num_pairs: number of pairs to sample
+        :param rng: numpy.random.Generator, a fresh unseeded one if None
+        :return: (starts, destinations) as int32 arrays of edge indices, None if no such pair exists
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        passenger_edges = self.graph.passenger_edges
+        # every start edge reaches itself, which is not a valid destination
+        counts = self.reach_counts()[self._passenger_components] - 1
+        total = counts.sum()
+        if total <= 0:
+            return None
+        starts = passenger_edges[rng.choice(len(passenger_edges), size=num_pairs, p=counts / total)]
+
+        destinations = np.empty(num_pairs, dtype=np.int32)
+        start_components = self.component[starts]
+        for label in np.unique(start_components):
+            rows = np.flatnonzero(start_components == label)
+            candidates = self.reachable_edges(starts[rows[0]])
+            # draw among the candidates except the start itself by skipping its position
+            offsets = rng.integers(0, len(candidates) - 1, size=len(rows))
+            offsets += offsets >= np.searchsorted(candidates, starts[rows])
+            destinations[rows] = candidates[offsets]
+        return starts.astype(np.int32), destinations
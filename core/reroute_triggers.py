@@ -0,0 +1,109 @@
+"""
+    This file contains the bookkeeping of the full-route decision mode of StrSumo:
+    the route committed to every controlled vehicle and the triggers that make a
+    vehicle ask its route controller for a new route.
+
+    All triggers are evaluated when a vehicle enters a new edge, the only moment
+    a decision can be applied to a route that starts at the current edge.
+"""
+
+import numpy as np
+
+
+class RerouteTriggers:
+    """
+    :param on_deviation: re-decide when a vehicle enters an edge that is not the next edge of its route,
+                         e.g. after a teleport
+    :param congestion_change: re-decide when the travel time of the rest of the route, at the current edge
+                              travel times of connection_info.network_state, differs from the one at the commit
+                              by more than this fraction, e.g. 0.25; None disables the trigger
+    :param period: re-decide when at least period steps passed since the commit; None disables the trigger
+    """
+    def __init__(self, on_deviation=True, congestion_change=None, period=None):
+        self.on_deviation = on_deviation
+        self.congestion_change = congestion_change
+        self.period = period
+        self.network_state = None # set by StrSumo, read by the congestion trigger
+        self.routes = {} # {vehicle id: edge indices of the committed route}
+        self.positions = {} # {vehicle id: position of the vehicle's edge in its route}
+        self.commit_steps = {} # {vehicle id: step of the commit}
+        self.committed_costs = {} # {vehicle id: travel times of the route edges at the commit}
+
+    def due(self, vehicles, edge_index, step):
+        """
+        Advances the committed vehicles along their routes and selects the ones to decide for.
+        :param vehicles: the vehicles that entered a new edge in this step
+        :param edge_index: {edge id: edge index} of the graph
+        :param step: current step number
+        :return: list of the vehicles without a route or with a triggered re-decision
+        """
+        selected = []
+        travel_time = None
+        for vehicle in vehicles:
+            vehicle_id = vehicle.vehicle_id
+            route = self.routes.get(vehicle_id)
+            if route is None:
+                selected.append(vehicle)
+                continue
+            edge = edge_index[vehicle.current_edge]
+            position = self.positions[vehicle_id] + 1
+            if position < len(route) and route[position] == edge:
+                self.positions[vehicle_id] = position
+            elif self.on_deviation:
+                selected.append(vehicle)
+                continue
+            if self.period is not None and step - self.commit_steps[vehicle_id] >= self.period:
+                selected.append(vehicle)
+                continue
+            if self.congestion_change is not None:
+                if travel_time is None:
+                    travel_time = self.network_state.travel_time
+                position = self.positions[vehicle_id]
+                committed = self.committed_costs[vehicle_id][position:].sum()
+                current = travel_time[route[position:]].sum()
+                if abs(current - committed) > self.congestion_change * committed:
+                    selected.append(vehicle)
+        return selected
+
+    def commit(self, vehicle_id, route, edge_index, step):
+        """
+        :param route: list of edge ids, starting at the vehicle's current edge
+        """
+        indices = np.array([edge_index[edge_id] for edge_id in route], dtype=np.int64)
+        self.routes[vehicle_id] = indices
+        self.positions[vehicle_id] = 0
+        self.commit_steps[vehicle_id] = step
+        if self.congestion_change is not None:
+            self.committed_costs[vehicle_id] = self.network_state.travel_time[indices]
+
+    def forget(self, vehicle_ids):
+        """
+        Drops the routes of vehicles that left the simulation.
+        """
+        for vehicle_id in vehicle_ids:
+            self.routes.pop(vehicle_id, None)
+            self.positions.pop(vehicle_id, None)
+            self.commit_steps.pop(vehicle_id, None)
+            self.committed_costs.pop(vehicle_id, None)
+
+    def to_dict(self):
+        """
+        :return: the committed routes as JSON-compatible dict, e.g. for a saved simulation state
+        """
+        return {vehicle_id: {"route": route.tolist(), "position": self.positions[vehicle_id],
+                             "step": self.commit_steps[vehicle_id],
+                             "costs": self.committed_costs[vehicle_id].tolist()
+                             if vehicle_id in self.committed_costs else None}
+                for vehicle_id, route in self.routes.items()}
+
+    def load_dict(self, commitments):
+        """
+        Restores the committed routes written by to_dict.
+        """
+        self.forget(list(self.routes))
+        for vehicle_id, fields in commitments.items():
+            self.routes[vehicle_id] = np.array(fields["route"], dtype=np.int64)
+            self.positions[vehicle_id] = fields["position"]
+            self.commit_steps[vehicle_id] = fields["step"]
+            if fields["costs"] is not None:
+                self.committed_costs[vehicle_id] = np.array(fields["costs"], dtype=np.float64)
@@ -0,0 +1,172 @@
+"""
+    This file contains streaming helpers for SUMO route files (*.rou.xml and
+    *.rou.xml.gz). The files are read element by element, so their size does
+    not bound the memory needed to process them.
+"""
+
+import gzip
+import heapq
+import itertools
+import os
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+INDENT = "    "
+XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
+
+
+def open_route_file(file_name, mode="r"):
+    """
+        param @file_name <str>: name of the route file; names ending with '.gz' are (de)compressed on the fly.
+        param @mode <str>: 'r' or 'w'.
+
+        Returns a text file object for reading or writing the route file.
+    """
+    if file_name.endswith(".gz"):
+        return gzip.open(file_name, mode + "t", encoding="utf-8")
+    return open(file_name, mode, encoding="utf-8")
+
+
+def _depart_key(value):
+    # departures such as "triggered" are not numbers, they are kept behind the timed ones
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("inf")
+
+
+def iter_route_elements(file_name, root_attributes=None):
+    """
+        param @file_name <str>: name of the route file to read.
+        param @root_attributes <dict>: if given, filled with the attributes of the <routes> element.
+
+        Yields the top-level elements of the route file (vehicles, trips, vTypes, ...) one at a time.
+        Every element is released after it has been yielded, so only one is held in memory.
+    """
+    with open_route_file(file_name) as f:
+        depth = 0
+        root = None
+        for event, element in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if depth == 0:
+                    root = element
+                    if root_attributes is not None:
+                        root_attributes.update(element.attrib)
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                yield element
+                root.clear()
+
+
+def last_vehicle_id(file_name):
+    """
+        param @file_name <str>: name of the route file to read.
+
+        Returns the id of the last <vehicle> in the route file, or None if there is none.
+    """
+    last_id = None
+    for element in iter_route_elements(file_name):
+        if element.tag == "vehicle":
+            last_id = element.get("id")
+    return last_id
+
+
+def _root_tag(root_attributes):
+    # ElementTree reports namespaced attributes as {namespace}name, write them back with a prefix
+    namespaces = {}
+    attributes = []
+    for name, value in root_attributes.items():
+        if name.startswith("{"):
+            namespace, local_name = name[1:].split("}", 1)
+            if namespace not in namespaces:
+                namespaces[namespace] = "xsi" if namespace == XSI_NAMESPACE else "ns" + str(len(namespaces))
+            name = namespaces[namespace] + ":" + local_name
+        attributes.append(" " + name + "=" + quoteattr(value))
+    declarations = [" xmlns:" + prefix + "=" + quoteattr(namespace) for namespace, prefix in namespaces.items()]
+    return "<routes" + "".join(declarations) + "".join(attributes) + ">\n"
+
+
+def _serialize(element):
+    element.tail = None
+    return INDENT + ET.tostring(element, encoding="unicode") + "\n"
+
+
+def _background_stream(file_name, root_attributes):
+    # (depart, text) of every top-level element; elements without a departure keep the position
+    # they have relative to the preceding departure
+    depart = float("-inf")
+    for element in iter_route_elements(file_name, root_attributes):
+        if "depart" in element.attrib:
+            depart = _depart_key(element.get("depart"))
+        elif "begin" in element.attrib:
+            depart = _depart_key(element.get("begin"))
+        yield depart, _serialize(element)
+
+
+def controlled_vehicle_element(vehicle_id, depart, start_edge):
+    """
+        Returns the <vehicle> element of a controlled vehicle released at @depart on @start_edge.
+        Its route consists of the start edge only; the controller extends it during the simulation.
+    """
+    vehicle = ET.Element("vehicle")
+    vehicle.set("depart", str(depart))
+    vehicle.set("id", str(vehicle_id))
+    route = ET.SubElement(vehicle, "route")
+    route.set("edges", start_edge)
+    return vehicle
+
+
+def routed_vehicle_element(vehicle_id, depart, edges):
+    """
+        Returns the <vehicle> element of a vehicle released at @depart following the list of edge ids @edges.
+    """
+    vehicle = ET.Element("vehicle")
+    vehicle.set("id", str(vehicle_id))
+    vehicle.set("depart", "%.2f" % depart)
+    route = ET.SubElement(vehicle, "route")
+    route.set("edges", " ".join(edges))
+    return vehicle
+
+
+def write_route_file(file_name, elements):
+    """
+        param @file_name <str>: route file to write, compressed if the name ends with '.gz'.
+        param @elements <iterable>: top-level elements to write, consumed one at a time.
+    """
+    with open_route_file(file_name, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write(_root_tag({"{" + XSI_NAMESPACE + "}noNamespaceSchemaLocation": "http://sumo.dlr.de/xsd/routes_file.xsd"}))
+        for element in elements:
+            f.write(_serialize(element))
+        f.write("</routes>\n")
+
+
+def merge_route_files(background_file, controlled_elements, output_file):
+    """
+        param @background_file <str>: route file of the background vehicles, sorted by departure time.
+        param @controlled_elements <iterable>: (depart <float>, element <xml.etree.ElementTree.Element>)
+                                               pairs sorted by depart, e.g. from controlled_vehicle_element.
+        param @output_file <str>: route file to write; may be @background_file itself.
+
+        Merge-sorts the background elements and the controlled elements by departure time in a
+        single streaming pass; a controlled vehicle goes after every background element departing at
+        the same time. The output is written to a temporary file which replaces @output_file at the end.
+    """
+    root_attributes = {}
+    background = _background_stream(background_file, root_attributes)
+    controlled = ((depart, _serialize(element)) for depart, element in controlled_elements)
+    temp_file = output_file + ".tmp" + (".gz" if output_file.endswith(".gz") else "")
+    # read the first background element so that the attributes of <routes> are known
+    first = next(background, None)
+    with open_route_file(temp_file, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write(_root_tag(root_attributes))
+        head = [first] if first is not None else []
+        merged = heapq.merge(itertools.chain(head, background), controlled, key=lambda item: item[0])
+        for _, text in merged:
+            f.write(text)
+        f.write("</routes>\n")
+    os.replace(temp_file, output_file)
+
@@ -0,0 +1,265 @@
+"""
+    This file contains the shortest path engine shared by the routing policies.
+    It searches the CSR arrays of a CompiledGraph with a binary heap, either forward
+    from a start edge or backward from a destination into a cached shortest path tree.
+"""
+
+import heapq
+from collections import OrderedDict
+import numpy as np
+
+INFINITY = float("inf")
+
+
+class ShortestPathEngine:
+    """
+    Binary-heap Dijkstra over the successor arrays of a CompiledGraph.
+    The cost of a path is the summed weight of the edges entered after the start edge,
+    so the default weights (the edge lengths) give the driving distance to the end of the destination edge.
+    Only edges allowing passenger vehicles are entered, like the ones listed in ConnectionInfo.edge_list.
+    The distance and predecessor arrays are allocated once and reused for every query;
+    the path is only reconstructed from the predecessor arrays once the destination is settled.
+    :param graph: the CompiledGraph of the map, e.g. connection_info.graph
+    """
+    def __init__(self, graph):
+        self.graph = graph
+        self._succ_ptr, self._succ_edge, self._succ_dir, self._lengths = graph.adjacency_lists()
+        n = graph.num_edges
+        self._dist = [INFINITY] * n
+        self._pred = [-1] * n
+        self._pred_dir = [-1] * n
+        # query number that last touched / settled an entry, so the arrays never need resetting
+        self._visited_in = [0] * n
+        self._settled_in = [0] * n
+        self._query = 0
+
+    def search(self, source, target, weights=None):
+        """
+        Runs Dijkstra from source until target is settled.
+        :param source: edge index of the start edge
+        :param target: edge index of the destination edge
+        :param weights: optional list of per-edge costs indexed by edge index, defaults to the edge lengths
+        :return: (cost, edge index path from source to target, direction code list), or None if unreachable
+        """
+        if weights is None:
+            weights = self._lengths
+        succ_ptr, succ_edge, succ_dir = self._succ_ptr, self._succ_edge, self._succ_dir
+        dist, pred, pred_dir = self._dist, self._pred, self._pred_dir
+        visited_in, settled_in = self._visited_in, self._settled_in
+        self._query += 1
+        query = self._query
+
+        visited_in[source] = query
+        dist[source] = 0.0
+        pred[source] = -1
+        heap = [(0.0, source)]
+        found = False
+        while heap:
+            current_distance, current = heapq.heappop(heap)
+            if settled_in[current] == query:
+                continue
+            settled_in[current] = query
+            if current == target:
+                found = True
+                break
+            for k in range(succ_ptr[current], succ_ptr[current + 1]):
+                outgoing = succ_edge[k]
+                new_distance = current_distance + weights[outgoing]
+                if visited_in[outgoing] != query or new_distance < dist[outgoing]:
+                    visited_in[outgoing] = query
+                    dist[outgoing] = new_distance
+                    pred[outgoing] = current
+                    pred_dir[outgoing] = succ_dir[k]
+                    heapq.heappush(heap, (new_distance, outgoing))
+
+        if not found:
+            return None
+        return (dist[target],) + self._reconstruct(source, target)
+
+    def _reconstruct(self, source, target):
+        path = [target]
+        directions = []
+        current = target
+        while current != source:
+            directions.append(self._pred_dir[current])
+            current = self._pred[current]
+            path.append(current)
+        path.reverse()
+        directions.reverse()
+        return path, directions
+
+    def shortest_path(self, start_edge, destination, weights=None):
+        """
+        :param start_edge: id of the start edge
+        :param destination: id of the destination edge
+        :param weights: optional list of per-edge costs indexed by edge index
+        :return: (list of edge ids, list of directions) of the shortest path, ([], []) if there is none
+        """
+        edge_index = self.graph.edge_index
+        result = self.search(edge_index[start_edge], edge_index[destination], weights)
+        if result is None:
+            return [], []
+        _, path, directions = result
+        edge_ids, direction_names = self.graph.edge_ids, self.graph.direction_names
+        return [edge_ids[index] for index in path], [direction_names[code] for code in directions]
+
+    def directions(self, start_edge, destination, weights=None):
+        """
+        :return: the list of directions leading from start_edge to destination, [] if there is none.
+                 This is the decision_list expected by RouteController.compute_local_target.
+        """
+        return self.shortest_path(start_edge, destination, weights)[1]
+
+
+class ShortestPathTree:
+    """
+    Reverse shortest path tree towards one destination edge.
+    Available arrays (indexed by edge index):
+        - distance float64[n] cost from the edge to the destination, inf if the destination is unreachable
+        - next_edge int32[n] the successor to take on a shortest path, -1 if there is none
+        - next_dir int8[n] direction code leading to next_edge, -1 if there is none
+    :param graph: the CompiledGraph the tree was built on
+    :param destination: edge index of the destination edge
+    """
+    def __init__(self, graph, destination, distance, next_edge, next_dir):
+        self.graph = graph
+        self.destination = destination
+        self.distance = distance
+        self.next_edge = next_edge
+        self.next_dir = next_dir
+
+    @property
+    def nbytes(self):
+        return self.distance.nbytes + self.next_edge.nbytes + self.next_dir.nbytes
+
+    def reaches(self, source):
+        return source == self.destination or self.next_edge[source] >= 0
+
+    def search(self, source):
+        """
+        Follows the tree from source to the destination.
+        :param source: edge index of the start edge
+        :return: (cost, edge index path, direction code list) like ShortestPathEngine.search, or None if unreachable
+        """
+        if not self.reaches(source):
+            return None
+        path = [source]
+        directions = []
+        current = source
+        while current != self.destination:
+            directions.append(int(self.next_dir[current]))
+            current = int(self.next_edge[current])
+            path.append(current)
+        return float(self.distance[source]), path, directions
+
+
+class ShortestPathTreeCache:
+    """
+    Cache of reverse shortest path trees keyed by destination edge.
+    One backward search from a destination answers the route of every vehicle heading there,
+    so policies whose vehicles share destinations pay for one search per destination instead of one per vehicle.
+    Trees are evicted in least recently used order once their total size exceeds memory_budget bytes,
+    and all trees are dropped when the edge weights change (see set_weights).
+    :param graph: the CompiledGraph of the map, e.g. connection_info.graph
+    :param memory_budget: maximum number of bytes held by the cached trees
+    """
+    def __init__(self, graph, memory_budget=64 * 1024 * 1024):
+        self.graph = graph
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        self._trees = OrderedDict()
+        self._weights = None
+
+    def __len__(self):
+        return len(self._trees)
+
+    def set_weights(self, weights=None):
+        """
+        Sets the per-edge costs used by the trees; cached trees are invalidated if the weights differ.
+        :param weights: sequence of per-edge costs indexed by edge index, None for the edge lengths
+        """
+        if weights is not None:
+            # copied, so that a caller updating its weight array in place is seen as a change
+            weights = np.array(weights, dtype=np.float64)
+        if weights is None and self._weights is None:
+            return
+        if weights is not None and self._weights is not None and np.array_equal(weights, self._weights):
+            return
+        self._weights = weights
+        self.invalidate()
+
+    def invalidate(self, destination=None):
+        """
+        Drops the tree of one destination edge index, or every tree if destination is None.
+        """
+        if destination is None:
+            self._trees.clear()
+            self.memory_used = 0
+        elif destination in self._trees:
+            self.memory_used -= self._trees.pop(destination).nbytes
+
+    def tree(self, destination):
+        """
+        :param destination: edge index of the destination edge
+        :return: the ShortestPathTree towards destination, built on a cache miss
+        """
+        tree = self._trees.get(destination)
+        if tree is not None:
+            self._trees.move_to_end(destination)
+            return tree
+        tree = self._build(destination)
+        while self._trees and self.memory_used + tree.nbytes > self.memory_budget:
+            _, evicted = self._trees.popitem(last=False)
+            self.memory_used -= evicted.nbytes
+        self._trees[destination] = tree
+        self.memory_used += tree.nbytes
+        return tree
+
+    def _build(self, destination):
+        pred_ptr, pred_edge, pred_dir = self.graph.reverse_adjacency_lists()
+        weights = self._weights.tolist() if self._weights is not None else self.graph.adjacency_lists()[3]
+        n = self.graph.num_edges
+        distance = [INFINITY] * n
+        next_edge = [-1] * n
+        next_dir = [-1] * n
+        settled = [False] * n
+
+        distance[destination] = 0.0
+        heap = [(0.0, destination)]
+        while heap:
+            current_distance, current = heapq.heappop(heap)
+            if settled[current]:
+                continue
+            settled[current] = True
+            # entering current from any predecessor costs the weight of current
+            new_distance = current_distance + weights[current]
+            for k in range(pred_ptr[current], pred_ptr[current + 1]):
+                predecessor = pred_edge[k]
+                if new_distance < distance[predecessor]:
+                    distance[predecessor] = new_distance
+                    next_edge[predecessor] = current
+                    next_dir[predecessor] = pred_dir[k]
+                    heapq.heappush(heap, (new_distance, predecessor))
+
+        return ShortestPathTree(self.graph, destination, np.array(distance, dtype=np.float64),
+                                np.array(next_edge, dtype=np.int32), np.array(next_dir, dtype=np.int8))
+
+    def shortest_path(self, start_edge, destination):
+        """
+        :param start_edge: id of the start edge
+        :param destination: id of the destination edge
+        :return: (list of edge ids, list of directions) of the shortest path, ([], []) if there is none
+        """
+        edge_index = self.graph.edge_index
+        result = self.tree(edge_index[destination]).search(edge_index[start_edge])
+        if result is None:
+            return [], []
+        _, path, directions = result
+        edge_ids, direction_names = self.graph.edge_ids, self.graph.direction_names
+        return [edge_ids[index] for index in path], [direction_names[code] for code in directions]
+
+    def directions(self, start_edge, destination):
+        """
+        :return: the list of directions leading from start_edge to destination, [] if there is none
+        """
+        return self.shortest_path(start_edge, destination)[1]
@@ -0,0 +1,150 @@
+"""
+    This file contains the logging of the testbed: leveled messages through the
+    standard logging module, and machine-readable per-vehicle records (one JSON
+    object per line). Both are written by background threads, so that the
+    simulation loop only puts entries on a queue instead of waiting for the
+    terminal or the disk.
+
+    Per-vehicle events (arrivals, local targets, decisions) are logged at DEBUG
+    level and recorded only if a record file is configured, so they cost one
+    level check per event by default. Use get_logger in the modules and call
+    configure once, e.g. from main.py.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+
+LOGGER_NAME = "str_sumo"
+MESSAGE_FORMAT = "%(message)s"
+FILE_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener = None
+_records = None
+_atexit_registered = False
+
+
+def get_logger(name):
+    """
+    :param name: name of the module, e.g. "STR_SUMO"
+    :return: the logger of the module, below the testbed logger configured by configure
+    """
+    return logging.getLogger(LOGGER_NAME + "." + name)
+
+
+class RecordWriter:
+    """
+    Writes dicts as JSON lines to a file from a background thread.
+    :param file_name: the JSONL file, overwritten
+    :param flush_every: number of records after which the file is flushed
+    """
+    _STOP = object()
+
+    def __init__(self, file_name, flush_every=1000):
+        self.file_name = file_name
+        self.flush_every = flush_every
+        self._queue = queue.Queue()
+        self._file = open(file_name, "w")
+        self._thread = threading.Thread(target=self._write_records, name="record-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, record):
+        self._queue.put(record)
+
+    def _write_records(self):
+        pending = 0
+        while True:
+            record = self._queue.get()
+            if record is self._STOP:
+                break
+            self._file.write(json.dumps(record) + "\n")
+            pending += 1
+            # write out what accumulated once the queue runs empty, or every flush_every records
+            if pending >= self.flush_every or self._queue.empty():
+                self._file.flush()
+                pending = 0
+        self._file.close()
+
+    def close(self):
+        """
+        Writes the records still queued and closes the file.
+        """
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+
+def configure(level=logging.INFO, log_file=None, record_file=None, console=True):
+    """
+    Routes the messages of the testbed loggers through a queue to a background thread.
+    :param level: lowest level of the messages written, e.g. logging.DEBUG for every per-vehicle event
+    :param log_file: also write the messages to this file, with time stamp and level
+    :param record_file: write the per-vehicle records to this JSONL file
+    :param console: write the messages to stdout
+    """
+    shutdown()
+    global _listener, _records, _atexit_registered
+    handlers = []
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter(MESSAGE_FORMAT))
+        handlers.append(console_handler)
+    if log_file is not None:
+        file_handler = logging.FileHandler(log_file, mode="w")
+        file_handler.setFormatter(logging.Formatter(FILE_FORMAT))
+        handlers.append(file_handler)
+    message_queue = queue.Queue()
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    logger.addHandler(logging.handlers.QueueHandler(message_queue))
+    # the handlers only receive messages through the queue, nothing reaches the root logger twice
+    logger.propagate = False
+    _listener = logging.handlers.QueueListener(message_queue, *handlers)
+    _listener.start()
+    if record_file is not None:
+        _records = RecordWriter(record_file)
+    if not _atexit_registered:
+        atexit.register(shutdown)
+        _atexit_registered = True
+
+
+def shutdown():
+    """
+    Writes out the queued messages and records and restores the default logging of the testbed loggers.
+    """
+    global _listener, _records
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            if isinstance(handler, logging.FileHandler):
+                handler.close()
+        _listener = None
+        logger = logging.getLogger(LOGGER_NAME)
+        for handler in list(logger.handlers):
+            if isinstance(handler, logging.handlers.QueueHandler):
+                logger.removeHandler(handler)
+        logger.setLevel(logging.NOTSET)
+        logger.propagate = True
+    if _records is not None:
+        _records.close()
+        _records = None
+
+
+def recording():
+    """
+    :return: True if per-vehicle records are written, check it before building a record in a loop
+    """
+    return _records is not None
+
+
+def record(event, **fields):
+    """
+    Queues a per-vehicle record {"event": event, **fields}, if a record file is configured.
+    """
+    if _records is not None:
+        entry = {"event": event}
+        entry.update(fields)
+        _records.write(entry)
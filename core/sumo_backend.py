@@ -0,0 +1,100 @@
+"""
+    This file contains the switch between the two ways of talking to SUMO:
+    traci, which runs SUMO as a separate process and sends every command over
+    a TCP socket, and libsumo, which loads SUMO into the Python process and
+    offers the same API as plain function calls.
+
+    Modules talking to SUMO import the proxy instead of the traci module:
+        from core.sumo_backend import traci
+    and keep using traci.vehicle, traci.simulationStep() etc. The proxy forwards
+    every attribute to the backend selected with select_backend(), so the
+    controllers work unchanged with either backend.
+
+    A third backend, meso, is the queue-based simulator of core/meso_sim.py,
+    which needs no SUMO installation at all.
+"""
+
+import importlib
+import os
+import sys
+
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("No environment variable SUMO_HOME!")
+
+TRACI = "traci"
+LIBSUMO = "libsumo"
+MESO = "meso"
+BACKENDS = (TRACI, LIBSUMO, MESO)
+# module implementing every backend
+BACKEND_MODULES = {TRACI: "traci", LIBSUMO: "libsumo", MESO: "core.meso_sim"}
+
+
+class SumoBackend:
+    """
+    Proxy of the traci, the libsumo or the meso_sim module.
+    The backend is chosen on first use: the one given to select(), otherwise libsumo if the environment
+    variable LIBSUMO_AS_TRACI is set (the convention of the SUMO tools), otherwise traci.
+    """
+    def __init__(self):
+        self._module = None
+        self._instrumented = None
+        self.name = None
+
+    def select(self, name):
+        """
+        :param name: TRACI, LIBSUMO or MESO
+        :return: the proxy itself
+        """
+        if name not in BACKENDS:
+            raise ValueError("Unknown SUMO backend: " + str(name) + ", expected one of " + str(BACKENDS))
+        if self._module is not None and name != self.name and getattr(self._module, "isLoaded", lambda: False)():
+            raise RuntimeError("Cannot switch to " + name + " while a " + self.name + " simulation is running")
+        try:
+            self._module = importlib.import_module(BACKEND_MODULES[name])
+        except ImportError as err:
+            # libsumo ships with the SUMO binaries (or the libsumo wheel), it may be missing
+            raise ImportError("The SUMO backend " + name + " is not available: " + str(err))
+        self.name = name
+        return self
+
+    @property
+    def module(self):
+        if self._module is None:
+            self.select(LIBSUMO if "LIBSUMO_AS_TRACI" in os.environ else TRACI)
+        return self._module
+
+    @property
+    def in_process(self):
+        """
+        :return: True if the simulation runs inside this process, i.e. there is no GUI and a single
+                 simulation per process
+        """
+        return self.module.__name__ != BACKEND_MODULES[TRACI]
+
+    def instrument(self, wrapper):
+        """
+        Routes every attribute access through wrapper instead of the backend module, e.g. a
+        profiling.CallCounter; None removes the wrapper.
+        """
+        self._instrumented = wrapper
+
+    def __getattr__(self, name):
+        # only called for attributes not defined above, e.g. vehicle, edge, simulation, start, simulationStep
+        if self._instrumented is not None:
+            return getattr(self._instrumented, name)
+        return getattr(self.module, name)
+
+
+traci = SumoBackend()
+
+
+def select_backend(name):
+    """
+    Selects the module all users of core.sumo_backend.traci talk to. Call it before starting the simulation.
+    :param name: TRACI, LIBSUMO or MESO
+    :return: the proxy
+    """
+    return traci.select(name)
@@ -10,9 +10,16 @@
 import random
 import os
 import sys
-import xml.dom.minidom 
+import numpy as np
 from core import Util
+from core import route_files
+from core import background_traffic
 from core import network_map_data_structures
+from core.compiled_graph import CompiledGraph
+from core.reachability import ReachabilityIndex
+from core import map_bundle
+from core import sim_log
+from core.vehicle_table import VehicleTable
 
 
 # CHECK VERSION INFORMATION AND SET UP VERSION REFERENCE VARIABLES:
@@ -28,6 +35,8 @@ elif sys.version_info.major == 2 and sys.version_info.minor == 7:
 else:
     sys.exit("This python version is outdated for the project! Upgrade to python 2.7 or higher!")
 
+logger = sim_log.get_logger("target_vehicles_generation_protocols")
+
 # !!! Code borrowed from Guangli !!!
 if 'SUMO_HOME' in os.environ:
     tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
@@ -39,7 +48,8 @@ from sumolib import checkBinary
 import traci
 import sumolib
 
-
+# types accepted as edges by the generation patterns
+EDGE_TYPES = (sumolib.net.edge.Edge, network_map_data_structures.CompiledEdge)
 
 
 
@@ -60,20 +70,50 @@ class target_vehicles_generator:
     __ERROR_MESSAGE__ = "error message"
     
 
-    def __init__(self, net_file):
+    def __init__(self, net_file, use_bundle=True):
         """
             :param @net_file<str>: The name of the network file (in the form of XML)
+            :param @use_bundle<bool>: Build from the map bundle cache shared with ConnectionInfo (see map_bundle.py)
+                                      instead of parsing the network file. The edges in edge_list are then
+                                      CompiledEdge objects, and the sumolib network @net is only parsed on first use.
         """
         self.length_dict = None
         self.out_dict = None
         self.index_dict = None
         self.edge_list = None
-        self.net = network_map_data_structures.getNetInfo(net_file)
-        [self.length_dict, self.out_dict, self.index_dict, self.edge_list] = network_map_data_structures.getEdgesInfo(self.net)
+        self.net_file = net_file
+        self._net = None
+        if use_bundle:
+            bundle = map_bundle.load_map_bundle(net_file)
+            self.graph = bundle.graph()
+            [self.length_dict, self.out_dict, self.index_dict, self.edge_list] = network_map_data_structures.getEdgesInfoFromGraph(self.graph)
+            # answers the path-existence questions of the generation protocols without path searches
+            self.reachability = bundle.reachability()
+        else:
+            self.net = network_map_data_structures.getNetInfo(net_file)
+            [self.length_dict, self.out_dict, self.index_dict, self.edge_list] = network_map_data_structures.getEdgesInfo(self.net)
+            # answers the path-existence questions of the generation protocols without path searches
+            self.graph = CompiledGraph.from_net(self.net)
+            self.reachability = ReachabilityIndex(self.graph)
 
         self.__current_target_xml_file__ = ""
 
 
+    @property
+    def net(self):
+        """
+            The sumolib.net.Net of the map, parsed from @net_file on first access.
+            The protocols pass the unparsed value to the validators, which answer from @reachability.
+        """
+        if self._net is None:
+            self._net = network_map_data_structures.getNetInfo(self.net_file)
+        return self._net
+
+    @net.setter
+    def net(self, net):
+        self._net = net
+
+
     def generate_target_vehicles(self, num_vehicles, target_xml_file, pattern=None):
         """
             param @num_vehicles <int>: the number of target-vehicles desired.
@@ -107,8 +147,8 @@ class target_vehicles_generator:
         __error_message__ = None
         # Call appropriate member functions according to the pattern specified:
         if type(pattern) is tuple:
-            if type(pattern[0]) is sumolib.net.edge.Edge:
-                if type(pattern[1]) is sumolib.net.edge.Edge:
+            if isinstance(pattern[0], EDGE_TYPES):
+                if isinstance(pattern[1], EDGE_TYPES):
                     # -- CASE 1. --
                     vehicles_info = None
                     while vehicles_info is None:
@@ -116,7 +156,7 @@ class target_vehicles_generator:
                 else:
                     __error_message__ = "Invalid pattern for generating random vehicles: The 1st element of " + str(pattern) + " is not an instance of sumolib.net.edge.Edge!"
             elif type(pattern[0]) is list:
-                if type(pattern[1]) is sumolib.net.edge.Edge:
+                if isinstance(pattern[1], EDGE_TYPES):
                     # -- CASE 2. --
                     vehicles_info = self.generate_with_ranged_starts_one_dest(num_vehicles, pattern[0], pattern[1])
                 elif type(pattern[1]) is list:
@@ -170,10 +210,10 @@ class target_vehicles_generator:
         # TODO: Generate vehicle ID's:
         current_ID = target_vehicles_generator.target_vehicles_output_dict[self.__current_target_xml_file__]
         end_ID = current_ID + num_vehicles
-        if not validate_path(self.net, start_point, destination):
+        if not validate_path(self._net, start_point, destination, self.reachability):
             
-            ### UNCOMMENT TO DEBUG ###
-            print("No path from", start_point.getID(), "to", destination.getID())
+            ### SHOWN AT THE DEBUG LOG LEVEL ###
+            logger.debug("No path from %s to %s", start_point.getID(), destination.getID())
             
             return None
         while current_ID < end_ID:
@@ -215,16 +255,22 @@ class target_vehicles_generator:
         
         # TODO: Generate vehicle ID's:
         current_ID = target_vehicles_generator.target_vehicles_output_dict[self.__current_target_xml_file__]
+        # start-points from which @destination is reachable, invalid assignments are redrawn from these directly
+        valid_start_point_lst = [start_point for start_point in start_point_lst \
+            if validate_path(self._net, start_point, destination, self.reachability)]
+        if len(valid_start_point_lst) == 0:
+            logger.warning("No path from any start-point to %s", destination.getID())
+            return None
         i = 0
         while i < num_vehicles:
             valid_pair = True
-            if not validate_path(self.net, assigned_start_point_lst[i], destination):
+            if not validate_path(self._net, assigned_start_point_lst[i], destination, self.reachability):
                 valid_pair = False
                 
-                ### UNCOMMENT TO DEBUG ###
-                print("No path from", assigned_start_point_lst[i].getID(), "to", destination.getID())
+                ### SHOWN AT THE DEBUG LOG LEVEL ###
+                logger.debug("No path from %s to %s", assigned_start_point_lst[i].getID(), destination.getID())
                 
-                assigned_start_point_lst[i] = random.choice(start_point_lst)
+                assigned_start_point_lst[i] = random.choice(valid_start_point_lst)
                 continue
             
             vehicles_info.append( (current_ID + i, (assigned_start_point_lst[i], destination), valid_pair) )
@@ -273,11 +319,11 @@ class target_vehicles_generator:
         i = 0
         while i < num_vehicles:
             valid_pair = True
-            if not validate_path(self.net, assigned_start_point_lst[i], assigned_destination_lst[i]):
+            if not validate_path(self._net, assigned_start_point_lst[i], assigned_destination_lst[i], self.reachability):
                 valid_pair = False
                 
-                ### UNCOMMENT TO DEBUG ###
-                print("No path from", assigned_start_point_lst[i].getID(), "to", assigned_destination_lst[i].getID())
+                ### SHOWN AT THE DEBUG LOG LEVEL ###
+                logger.debug("No path from %s to %s", assigned_start_point_lst[i].getID(), assigned_destination_lst[i].getID())
                 
                 assigned_start_point_lst[i] = random.choice(start_point_lst)
                 assigned_destination_lst[i] = random.choice(destination_lst)
@@ -314,17 +360,35 @@ class target_vehicles_generator:
         # Generate @num_vehicle tuple-pairs of start_points and destinations:
         # TODO: Generate vehicle ID's:
         current_ID = target_vehicles_generator.target_vehicles_output_dict[self.__current_target_xml_file__]
-        i = 0
-        while i < num_vehicles:
-            pair = random.sample(self.edge_list, 2)
-            if validate_path(self.net, pair[0], pair[1]):
-                vehicles_info.append( (current_ID + i, pair, True) )
-                i += 1
-            ### UNCOMMENT TO DEBUG ###
-            #else:
-                #print("No path from", pair[0].getID(), "to", pair[1].getID())
+        # sample only connected pairs, uniformly among all of them
+        pairs = self.sample_connected_edge_pairs(num_vehicles)
+        if pairs is None:
+            logger.warning("No pair of connected edges in the map!")
+            return vehicles_info
+        for i, pair in enumerate(pairs):
+            vehicles_info.append( (current_ID + i, list(pair), True) )
                 
         return vehicles_info
+
+
+    def sample_connected_edge_pairs(self, num_pairs):
+        """
+            param @num_pairs <int>: the number of pairs desired.
+            
+            Returns @num_pairs (start-point, destination) tuples of distinct edges from
+            @target_vehicles_generator.edge_list such that the destination is reachable
+            from the start-point, drawn uniformly among all such pairs using the
+            reachability index instead of rejection sampling. Returns None if the map has
+            no such pair. The draws follow the state of the 'random' module.
+        """
+        rng = np.random.default_rng(random.getrandbits(64))
+        sampled = self.reachability.sample_pairs(num_pairs, rng)
+        if sampled is None:
+            return None
+        edge_ids = self.reachability.graph.edge_ids
+        edges_by_id = {edge.getID(): edge for edge in self.edge_list}
+        return [(edges_by_id[edge_ids[start]], edges_by_id[edge_ids[destination]]) \
+            for start, destination in zip(sampled[0].tolist(), sampled[1].tolist())]
     
     
     def random_select_edge_IDs(self, num_of_edges):
@@ -338,7 +402,7 @@ class target_vehicles_generator:
         """
         edge_count = len(self.edge_list)
         if (edge_count < num_of_edges):
-            print("Warning: Number of edges to select exceeds the maximum of " + str(edge_count) + "! Function 'select_edge_IDs' returns a 'None' value...")
+            logger.warning("Number of edges to select exceeds the maximum of %d! Function 'select_edge_IDs' returns a 'None' value...", edge_count)
             return None
         else:
             edge_indices = random.sample( self.edge_list, num_of_edges )
@@ -359,179 +423,187 @@ class target_vehicles_generator:
         
         target_vehicles_generator.target_vehicles_output_dict[target_xml_file] = 0
 
-    def generate_vehicles(self, num_target_vehicles, num_random_vehicles, pattern, target_xml_file, net_xml_file):
+    def generate_with_random_trips(self, num_random_vehicles, latest_release_time, target_xml_file, net_xml_file):
         """
-            param @num_target_vehicles <int>: The number of target vehicles.
             param @num_random_vehicles <int>: The number of uncontrolled vehicles.
-            param @pattern <tuple>: one of three possible patterns. FORMAT:
-            -- CASES BEGIN --
-                #1. one start point, one destination for all target vehicles
-                #2. ranged start point, one destination for all target vehicles
-                #3. ranged start points, ranged destination for all target vehicles
-            -- CASES ENDS --
+            param @latest_release_time <float>: The latest release time of the uncontrolled vehicles.
 
-            Returns the list of target vehicles if succeeds.
-            Returns None if the generation fails with error infromation output to the console.
-            The result will be written into the target_xml_file.
-            There is no guaratnee on the contents in target_xml_file if the generation fails, i.e., returns None
+            Generates the uncontrolled vehicles into @target_xml_file by invoking SUMO's randomTrips.py.
+            Returns True if succeeds, and False otherwise.
         """
-        #set the start time as 0 (by default) and the end time as 50
-        #calculate the density of vehicles accordingly
-        latest_release_time = 50.0 #a constant number for the latest release time of all vehicles
         num_random_vehicles *= 2 # this is done to compensate the loss when generating using scripts. Need to solve this later.
         density =  latest_release_time / float(num_random_vehicles)
         density = int(density * 100)/100.0
         #copy the file randomTrips.py to the current directory
         command_str = "cp $SUMO_HOME/tools/randomTrips.py ./"
         if os.system(command_str) != 0:
-            print("ERROR: Failed to copy randomTrips.py to current directory.")
-            return None
+            logger.error("Failed to copy randomTrips.py to current directory.")
+            return False
         #invoke randomTrips.py
         command_str = "./randomTrips.py -n "+net_xml_file+" -e 50 -p "+str(density) +" -r "+target_xml_file
         if os.system(command_str) != 0:
-            print("ERROR: Failed to invoke randomTrips.py.")
-            return None
+            logger.error("Failed to invoke randomTrips.py.")
+            return False
         #delete randomTrips.py
         command_str = "rm ./randomTrips.py"
         if os.system(command_str) != 0:
-            print("ERROR: Failed to remove randomTrips.py.")
+            logger.error("Failed to remove randomTrips.py.")
+            return False
+        return True
+
+    def generate_vehicles(self, num_target_vehicles, num_random_vehicles, pattern, target_xml_file, net_xml_file, \
+        use_random_trips=False, seed=None):
+        """
+            param @num_target_vehicles <int>: The number of target vehicles.
+            param @num_random_vehicles <int>: The number of uncontrolled vehicles.
+            param @pattern <tuple>: one of three possible patterns. FORMAT:
+            -- CASES BEGIN --
+                #1. one start point, one destination for all target vehicles
+                #2. ranged start point, one destination for all target vehicles
+                #3. ranged start points, ranged destination for all target vehicles
+            -- CASES ENDS --
+            param @use_random_trips <bool>: generate the uncontrolled vehicles by invoking SUMO's randomTrips.py
+                                            instead of the in-process generator (see background_traffic.py).
+            param @seed <int>: seed of the in-process generator; if None it is drawn from the 'random' module.
+
+            Returns the list of target vehicles if succeeds.
+            Returns None if the generation fails with error infromation logged (see sim_log.py).
+            The result will be written into the target_xml_file, which is compressed if its name ends with '.gz'.
+            The controlled vehicles are merged into the background vehicles in one streaming pass.
+            There is no guaratnee on the contents in target_xml_file if the generation fails, i.e., returns None
+        """
+        #set the start time as 0 (by default) and the end time as 50
+        #calculate the density of vehicles accordingly
+        latest_release_time = 50.0 #a constant number for the latest release time of all vehicles
+        if not use_random_trips:
+            #generate exactly num_random_vehicles routed vehicles in-process on the already loaded map
+            if seed is None:
+                seed = random.getrandbits(64)
+            if background_traffic.generate_background_routes(self.graph, self.reachability, num_random_vehicles, \
+                target_xml_file, latest_release_time, seed) == 0:
+                logger.error("Failed to generate background vehicles.")
+                return None
+        elif not self.generate_with_random_trips(num_random_vehicles, latest_release_time, target_xml_file, net_xml_file):
             return None
         #insert the generated vehicles into the xml file
         #use id to find the vehicles and modify their information directly
         result_dict = None
         if pattern==1:
-            param_start = random.choice(self.edge_list)
-            param_dest = random.choice(self.edge_list)
-            while not validate_path(self.net, param_start, param_dest):
-                param_start = random.choice(self.edge_list)
-                param_dest = random.choice(self.edge_list)
-                ### UNCOMMENT TO DEBUG ###
-                #print("DEBUG: pattern 1 regenerating.")
+            pairs = self.sample_connected_edge_pairs(1)
+            if pairs is None:
+                logger.error("No pair of connected edges in the map.")
+                return None
+            param_start, param_dest = pairs[0]
             result_dict = self.generate_target_vehicles(num_target_vehicles, target_xml_file, (param_start, param_dest) )
         elif pattern==2:
             param_start = __random_choices_with_rp__(self.edge_list, num_target_vehicles*2)
             param_dest = random.choice(self.edge_list)
             #all pairs must be valid
-            while not validate_path_start_points(self.net, param_start, param_dest):
+            while not validate_path_start_points(self._net, param_start, param_dest, self.reachability):
                 param_start = __random_choices_with_rp__(self.edge_list, num_target_vehicles*2)
                 param_dest = random.choice(self.edge_list)
                 ### UNCOMMENT TO DEBUG ###
-                #print("DEBUG: pattern 2 regenerating.")
+                #logger.debug("pattern 2 regenerating.")
             result_dict = self.generate_target_vehicles(num_target_vehicles, target_xml_file, (param_start, param_dest) )
         elif pattern==3:
             param_start = __random_choices_with_rp__(self.edge_list, num_target_vehicles*2)
             param_dest = __random_choices_with_rp__(self.edge_list, num_target_vehicles*2)
             #at least one group of start points and one destination is valid towards each other
-            while not validate_path_starts_ends(self.net, param_start, param_dest):
+            while not validate_path_starts_ends(self._net, param_start, param_dest, self.reachability):
                 param_start = __random_choices_with_rp__(self.edge_list, num_target_vehicles*2)
                 param_dest = __random_choices_with_rp__(self.edge_list, num_target_vehicles*2)
                 ### UNCOMMENT TO DEBUG ###
-                #print("DEBUG: pattern 3 regenerating.")
+                #logger.debug("pattern 3 regenerating.")
             result_dict = self.generate_target_vehicles(num_target_vehicles, target_xml_file, (param_start, param_dest) )
         else:
-            print("ERROR: Unknown pattern type.")
+            logger.error("Unknown pattern type.")
             return None
         error_message = result_dict[self.__ERROR_MESSAGE__]
         result_lst = result_dict[self.VEHICLES_INFO]
         if error_message != None:
-            print(error_message)
+            logger.error(error_message)
             return None
         #put the vehicle information into a list of Vehicle objects
         vehicle_list = []
         release_time = 0
         release_period = latest_release_time/float(num_target_vehicles)
 
-        #read the xml file
-        doc = xml.dom.minidom.parse(target_xml_file)
-        root = doc.documentElement
-        vs = root.getElementsByTagName("vehicle")
-        index = 0
-        print(len(vs))
-        id_now = int(vs.item(len(vs) - 1).getAttribute('id')) + 1
+        #find the id of the last background vehicle, the controlled vehicles are numbered after it
+        last_id = route_files.last_vehicle_id(target_xml_file)
+        if last_id is None:
+            logger.error("No background vehicle in %s.", target_xml_file)
+            return None
+        id_now = int(last_id) + 1
         #deadline set arbitrarily between a certain range
+        controlled_elements = []
+        #the vehicles are rows of one table, indexed by the edges of the map
+        vehicle_table = VehicleTable(self.graph.edge_ids)
         for r in result_lst:
-            #find the vehicle slot based on the depart time (departure time must be sorted in xml)
-            for i in range(index, len(vs)):
-                if float(vs.item(i).getAttribute('depart')) <= release_time:
-                    index = i
-                else:
-                    break
-            
-            #insert the vehicle into the xml file
-            #print(index)
-            temp_v = doc.createElement('vehicle')
-            temp_v.setAttribute('depart', str(release_time))
-            temp_v.setAttribute('id', str(id_now))
-            temp_r = doc.createElement('route')
-            temp_r.setAttribute('edges', r[1][0].getID()) #set the start edge as the route
-            temp_v.appendChild(temp_r)
-            if index == len(vs) - 1:
-                root.appendChild(temp_v)
-            else:
-                root.insertBefore(temp_v, vs[index+1])
-                #root.appendChild(temp_v)
+            #the start edge is the route of the controlled vehicle
+            controlled_elements.append( (release_time, route_files.controlled_vehicle_element(id_now, release_time, r[1][0].getID())) )
             #append the vehicle to the final vehicle list
             ddl_now = random.randint(500,1000)#randomly set ddl in a range for now
-            v_now = Util.Vehicle(str(id_now), r[1][1].getID(), release_time, ddl_now)
+            v_now = Util.Vehicle(str(id_now), r[1][1].getID(), release_time, ddl_now, vehicle_table)
             vehicle_list.append(v_now)
             release_time += release_period
             id_now += 1
-            vs = root.getElementsByTagName("vehicle")
-        #write the vehicle information into the xml file
-        with open(target_xml_file, 'w') as f:
-            f.write(doc.toprettyxml())
-            f.flush()
-            f.close
+        #merge the controlled vehicles into the background vehicles by departure time (departure time must be sorted in xml)
+        route_files.merge_route_files(target_xml_file, controlled_elements, target_xml_file)
         return vehicle_list
 
 
     
-def validate_path(net, start_point, destination):
+def validate_path(net, start_point, destination, reachability=None):
     """
         param @net <sumolib.net.Net>: parameter that stores the information of a map.
         param @start_point <sumolib.net.edge.Edge>: a start-point on the map from @net.
         param @destination <sumolib.net.edge.Edge>: a destination on the map from @net.
+        param @reachability <ReachabilityIndex>: optional reachability index of the map from @net.
         
         Function to validate the existence of a path from @start_point to @destination,
         using the shortest path algorithm offered by @net; returns True if such a path
-        exists, and False otherwise.
+        exists, and False otherwise. If @reachability is given, the answer is a constant
+        time lookup of the passenger road graph instead of a shortest path search.
         
     """
+    if reachability is not None:
+        return reachability.reaches_edge(start_point.getID(), destination.getID())
     shortestPath = net.getShortestPath(start_point, destination)
     return shortestPath[0] != None
     
-def validate_path_start_points(net, start_points, destination):
+def validate_path_start_points(net, start_points, destination, reachability=None):
     """
         param @net <sumolib.net.Net>: parameter that stores the information of a map.
         param @start_point <list of sumolib.net.edge.Edge>: a list of start-points on the map from @net.
         param @destination <sumolib.net.edge.Edge>: a destination on the map from @net.
+        param @reachability <ReachabilityIndex>: optional reachability index of the map from @net.
         
         Function to validate the existence of a path from @start_point to @destination,
         using the shortest path algorithm offered by @net; returns True if such a path
-        exists, and False otherwise.
+        exists, and False otherwise. With @reachability this takes O(len(@start_points)) lookups.
     """
     num = 0
     for s in start_points:
-        shortest_path = net.getShortestPath(s, destination)
-        if shortest_path[0]==None:
+        if not validate_path(net, s, destination, reachability):
             return False
         num += 1
         if num >= len(start_points)/2:
             return True
     return True
 
-def validate_path_starts_ends(net, start_points, destinations):
+def validate_path_starts_ends(net, start_points, destinations, reachability=None):
     """
         param @net <sumolib.net.Net>: parameter that stores the information of a map.
         param @start_point <list of sumolib.net.edge.Edge>: a list of start-points on the map from @net.
         param @destination <list of sumolib.net.edge.Edge>: a destination on the map from @net.
+        param @reachability <ReachabilityIndex>: optional reachability index of the map from @net.
         
         Function to validate the existence of a path from @start_point to @destination,
         using the shortest path algorithm offered by @net; returns True if such a path
         exists, and False otherwise.
     """
     for d in destinations:
-        if validate_path_start_points(net, start_points, d):
+        if validate_path_start_points(net, start_points, d, reachability):
             return True
     return False
     
@@ -0,0 +1,125 @@
+"""
+    This file contains the columnar table of the controlled vehicles: one NumPy
+    array per field with a row per vehicle, so that StrSumo can evaluate edge
+    changes, arrivals and deadlines of all vehicles of a step at once. The
+    Vehicle objects of Util.py are views of a row of such a table.
+
+    Edges are stored as indices into edge_ids; with the edge ids of a
+    CompiledGraph the indices are the rows of the edges in the graph. Edge ids
+    not known to the table yet are appended to edge_ids. NO_EDGE (-1) stands
+    for no edge, i.e. the empty edge id "".
+"""
+
+import numpy as np
+
+NO_EDGE = -1
+
+INITIAL_CAPACITY = 16
+
+
+class VehicleTable:
+    """
+    :param edge_ids: the edge ids indexed by the edge columns, e.g. CompiledGraph.edge_ids
+    Columns (valid up to row len(self)):
+        - vehicle_ids [vehicle_id]
+        - destination int64 edge index of the destination
+        - start_time float64 step the vehicle is released, updated by StrSumo when it departs
+        - deadline float64 step the vehicle should reach its destination by
+        - current_edge int64 edge index of the last edge the vehicle was directed on, NO_EDGE before
+        - current_speed float64 speed when it entered current_edge
+        - local_destination int64 edge index of the current target in SUMO, NO_EDGE before the first decision
+    """
+    COLUMNS = ("destination", "start_time", "deadline", "current_edge", "current_speed", "local_destination")
+
+    def __init__(self, edge_ids=()):
+        self.edge_ids = list(edge_ids)
+        self.edge_index = {edge_id: index for index, edge_id in enumerate(self.edge_ids)}
+        self.vehicle_ids = []
+        self.row_of = {} # {vehicle_id: row}
+        self.destination = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+        self.start_time = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        self.deadline = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        self.current_edge = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+        self.current_speed = np.empty(INITIAL_CAPACITY, dtype=np.float64)
+        self.local_destination = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.vehicle_ids)
+
+    def edge(self, edge_id):
+        """
+        :return: the index of edge_id, added to edge_ids if new; NO_EDGE for ""
+        """
+        if edge_id == "":
+            return NO_EDGE
+        index = self.edge_index.get(edge_id)
+        if index is None:
+            index = len(self.edge_ids)
+            self.edge_index[edge_id] = index
+            self.edge_ids.append(edge_id)
+        return index
+
+    def edge_id(self, index):
+        """
+        :return: the edge id of index, "" for NO_EDGE
+        """
+        return self.edge_ids[index] if index >= 0 else ""
+
+    def append(self, vehicle_id, destination, start_time, deadline):
+        """
+        Adds a vehicle that has not been directed yet.
+        :return: the row of the vehicle
+        """
+        row = len(self.vehicle_ids)
+        if row == len(self.destination):
+            for name in self.COLUMNS:
+                column = getattr(self, name)
+                grown = np.empty(2 * len(column), dtype=column.dtype)
+                grown[:row] = column
+                setattr(self, name, grown)
+        self.vehicle_ids.append(vehicle_id)
+        self.row_of[vehicle_id] = row
+        self.destination[row] = self.edge(destination)
+        self.start_time[row] = start_time
+        self.deadline[row] = deadline
+        self.current_edge[row] = NO_EDGE
+        self.current_speed[row] = 0.0
+        self.local_destination[row] = NO_EDGE
+        return row
+
+    def use_columns(self, columns, vehicle_ids=None):
+        """
+        Replaces the column arrays, e.g. by views of shared memory (see parallel_decisions.py).
+        :param columns: {column name: array} of every column, at least len(self) rows long; the rows are
+                        not copied, so they must hold the table already
+        :param vehicle_ids: [vehicle_id] of the rows, if the table does not know them yet
+        """
+        if vehicle_ids is not None:
+            self.vehicle_ids = list(vehicle_ids)
+            self.row_of = {vehicle_id: row for row, vehicle_id in enumerate(self.vehicle_ids)}
+        for name in self.COLUMNS:
+            setattr(self, name, columns[name])
+
+    def rows(self, vehicle_ids):
+        """
+        :return: int64 array of the rows of vehicle_ids
+        """
+        row_of = self.row_of
+        return np.fromiter((row_of[vehicle_id] for vehicle_id in vehicle_ids), dtype=np.int64, count=len(vehicle_ids))
+
+    def adopt(self, vehicles):
+        """
+        Copies the vehicles into rows of this table and makes them views of these rows, e.g. to gather
+        vehicles created separately into the table of a simulation.
+        :param vehicles: iterable of Util.Vehicle
+        """
+        for vehicle in vehicles:
+            source, source_row = vehicle._table, vehicle._row
+            if source is self:
+                continue
+            row = self.append(vehicle.vehicle_id, vehicle.destination, vehicle.start_time, vehicle.deadline)
+            self.current_edge[row] = self.edge(source.edge_id(source.current_edge[source_row]))
+            self.current_speed[row] = source.current_speed[source_row]
+            self.local_destination[row] = self.edge(source.edge_id(source.local_destination[source_row]))
+            vehicle._table = self
+            vehicle._row = row
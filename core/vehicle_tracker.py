@@ -0,0 +1,107 @@
+"""
+    This file contains the tracker of the controlled vehicles: it follows them
+    through the simulation from the vehicles SUMO reports as departed and
+    arrived after every step, instead of scanning every vehicle in the
+    simulation, so that the cost of a step grows with the number of controlled
+    vehicles and not with the background traffic.
+"""
+
+import os
+import sys
+
+if 'SUMO_HOME' in os.environ:
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    sys.path.append(tools)
+else:
+    sys.exit("No environment variable SUMO_HOME!")
+
+from core.sumo_backend import traci
+import traci.constants as tc
+
+CONTROLLED_COLOR = (255, 0, 0) # set color so we can visually track controlled vehicles
+
+
+class ControlledVehicleTracker:
+    """
+    Keeps the set of the controlled vehicles in the simulation and finds the ones that changed road.
+    :param controlled_vehicles: dictionary of the controlled Vehicles by id
+    :param subscribe: subscribe the road and speed of every departing controlled vehicle and detect the road
+                      changes from the subscription results; otherwise the road of every controlled vehicle
+                      in the simulation is queried once per step
+    """
+    def __init__(self, controlled_vehicles, subscribe):
+        self.controlled_vehicles = controlled_vehicles
+        self.subscribe = subscribe
+        self.active = {} # controlled vehicles in the simulation, in the order of departure (dict used as ordered set)
+        self.seen = set() # controlled vehicles that departed so far
+        self.arrived = [] # controlled vehicles that arrived in the last simulation step
+        self._roads = {} # last known road of every active vehicle
+
+    def update(self, step):
+        """
+        Processes the departures and arrivals of the last simulation step.
+        Only departing controlled vehicles cost round-trips to SUMO.
+        :param step: current step number, the start time of the departed vehicles
+        :return: list of the controlled vehicles that arrived in the last simulation step
+        """
+        controlled_vehicles = self.controlled_vehicles
+        self.arrived = [vehicle_id for vehicle_id in traci.simulation.getArrivedIDList()
+                        if vehicle_id in controlled_vehicles]
+        for vehicle_id in self.arrived:
+            self.active.pop(vehicle_id, None)
+            self._roads.pop(vehicle_id, None)
+
+        for vehicle_id in traci.simulation.getDepartedIDList():
+            # a vehicle can depart and arrive within the same step, it is gone already
+            if vehicle_id not in controlled_vehicles or vehicle_id in self._roads or vehicle_id in self.arrived:
+                continue
+            if self.subscribe:
+                traci.vehicle.subscribe(vehicle_id, (tc.VAR_ROAD_ID, tc.VAR_SPEED))
+            traci.vehicle.setColor(vehicle_id, CONTROLLED_COLOR)
+            controlled_vehicles[vehicle_id].start_time = float(step)#Use the detected release time as start time
+            self.active[vehicle_id] = None
+            self.seen.add(vehicle_id)
+            self._roads[vehicle_id] = None
+        return self.arrived
+
+    def moved(self):
+        """
+        :return: ({vehicle id: road id} of the controlled vehicles that entered a new road in the last step,
+                  {vehicle id: speed} of these vehicles, or None if the speeds are not subscribed)
+        """
+        roads = self._roads
+        moved_roads = {}
+        if self.subscribe:
+            moved_speeds = {}
+            for vehicle_id, results in traci.vehicle.getAllSubscriptionResults().items():
+                if vehicle_id in roads:
+                    road = results[tc.VAR_ROAD_ID]
+                    if road != roads[vehicle_id]:
+                        roads[vehicle_id] = road
+                        moved_roads[vehicle_id] = road
+                        moved_speeds[vehicle_id] = results[tc.VAR_SPEED]
+            return moved_roads, moved_speeds
+
+        for vehicle_id in self.active:
+            road = traci.vehicle.getRoadID(vehicle_id)
+            if road != roads[vehicle_id]:
+                roads[vehicle_id] = road
+                moved_roads[vehicle_id] = road
+        return moved_roads, None
+
+    def restore(self, seen):
+        """
+        Rebuilds the tracker after a simulation state was loaded. Subscriptions are not part of a SUMO state,
+        so the controlled vehicles in the simulation are subscribed again.
+        :param seen: the controlled vehicles that departed before the state was saved
+        """
+        self.seen = set(seen)
+        self.arrived = []
+        self.active = {}
+        self._roads = {}
+        for vehicle_id in traci.vehicle.getIDList():
+            if vehicle_id in self.controlled_vehicles:
+                if self.subscribe:
+                    traci.vehicle.subscribe(vehicle_id, (tc.VAR_ROAD_ID, tc.VAR_SPEED))
+                self.active[vehicle_id] = None
+                self._roads[vehicle_id] = None
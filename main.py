@@ -2,9 +2,11 @@
 This test file needs the following files:
 STR_SUMO.py, RouteController.py, Util.py, test.net.xml, test.rou.xml, myconfig.sumocfg and corresponding SUMO libraries.
 '''
-from core.STR_SUMO import StrSumo
+from core.STR_SUMO import StrSumo, FULL_ROUTE
+from core.reroute_triggers import RerouteTriggers
 import os
 import sys
+import optparse
 from xml.dom.minidom import parse, parseString
 from core.Util import *
 from controller.RouteController import *
@@ -18,7 +20,12 @@ else:
     sys.exit("No environment variable SUMO_HOME!")
 
 from sumolib import checkBinary
-import traci
+from core.sumo_backend import traci, select_backend, BACKENDS
+from core.profiling import StepProfiler
+from core.parallel_decisions import ParallelDecisions
+from core import sim_log
+
+logger = sim_log.get_logger("main")
 
 
 # use vehicle generation protocols to generate vehicle list
@@ -49,28 +56,87 @@ def get_controlled_vehicles(route_filename, connection_info, \
 
     return vehicle_dict
 
-def test_dijkstra_policy(vehicles):
+def test_dijkstra_policy(vehicles, run_options, profile_file=None, simulation_options=None):
     print("Testing Dijkstra's Algorithm Route Controller")
     scheduler = DijkstraPolicy(init_connection_info)
-    run_simulation(scheduler, vehicles)
-
+    run_simulation(scheduler, vehicles, run_options, profile_file, simulation_options)
 
-def run_simulation(scheduler, vehicles):
 
-    simulation = StrSumo(scheduler, init_connection_info, vehicles)
+def run_simulation(scheduler, vehicles, run_options, profile_file=None, simulation_options=None):
+    """
+    :param run_options: keyword arguments of StrSumo.run, e.g. to save or to start from a warm-up state
+    :param profile_file: profile the run and write the profile to this file (.json, otherwise .csv)
+    :param simulation_options: further keyword arguments of StrSumo, e.g. the decision mode
+    """
+    profiler = StepProfiler() if profile_file is not None else None
+    simulation = StrSumo(scheduler, init_connection_info, vehicles, profiler=profiler, **(simulation_options or {}))
 
     traci.start([sumo_binary, "-c", "./configurations/myconfig.sumocfg", \
                  "--tripinfo-output", "./configurations/trips.trips.xml", \
                  "--fcd-output", "./configurations/testTrace.xml"])
 
-    total_time, end_number, deadlines_missed = simulation.run()
+    total_time, end_number, deadlines_missed = simulation.run(**run_options)
+    if profiler is not None:
+        profiler.write(profile_file)
+        print(profiler.summary())
+    if end_number == 0:
+        print("No controlled vehicle reached its destination.")
+        return
     print("Average timespan: {}, total vehicle number: {}".format(str(total_time/end_number),\
         str(end_number)))
     print(str(deadlines_missed) + ' deadlines missed.')
 
+def get_options():
+    opt_parser = optparse.OptionParser()
+    opt_parser.add_option("--backend", type="choice", choices=list(BACKENDS),
+                          help="talk to SUMO over a socket (traci), run it in-process (libsumo) or replace it by the "
+                               "meso simulator (meso), defaults to libsumo if LIBSUMO_AS_TRACI is set and traci "
+                               "otherwise")
+    opt_parser.add_option("--nogui", action="store_true", default=False,
+                          help="run the command line version of SUMO instead of sumo-gui")
+    opt_parser.add_option("--save-state-step", type="int",
+                          help="save the simulation state at this step to --state-file and stop, "
+                               "e.g. after the warm-up of the background traffic")
+    opt_parser.add_option("--start-state",
+                          help="continue from a state saved with --save-state-step instead of generating vehicles")
+    opt_parser.add_option("--state-file", default="./configurations/warm_up.state.xml",
+                          help="file of the saved state [default: %default]")
+    opt_parser.add_option("--full-route", action="store_true", default=False,
+                          help="commit the controlled vehicles to whole routes (traci.vehicle.setRoute) instead of "
+                               "deciding a local target on every edge")
+    opt_parser.add_option("--reroute-period", type="int",
+                          help="with --full-route, decide again on the first edge entered this many steps after "
+                               "the last decision")
+    opt_parser.add_option("--reroute-congestion", type="float",
+                          help="with --full-route, decide again when the travel time of the rest of the route "
+                               "changed by more than this fraction, e.g. 0.25")
+    opt_parser.add_option("--decision-workers", type="int",
+                          help="decide large batches of controlled vehicles on this many worker processes, "
+                               "sharing the map and the edge states through shared memory")
+    opt_parser.add_option("--log-level", type="choice", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                          default="INFO",
+                          help="lowest level of the messages shown, DEBUG shows every per-vehicle event "
+                               "[default: %default]")
+    opt_parser.add_option("--log-file", help="also write the messages to this file")
+    opt_parser.add_option("--vehicle-records",
+                          help="write the arrivals, local targets and decisions of the controlled vehicles "
+                               "to this file, one JSON object per line")
+    opt_parser.add_option("--profile",
+                          help="profile the phases of every step and write the profile to this file, "
+                               "as JSON if it ends with .json and as per-step CSV table otherwise")
+    options, args = opt_parser.parse_args()
+    return options
+
 if __name__ == "__main__":
-    sumo_binary = checkBinary('sumo-gui')
-    # sumo_binary = checkBinary('sumo')#use this line if you do not want the UI of SUMO
+    options = get_options()
+    sim_log.configure(options.log_level, options.log_file, options.vehicle_records)
+    if options.backend is not None:
+        select_backend(options.backend)
+    # libsumo cannot drive the GUI, it always runs the command line version
+    if options.nogui or traci.in_process:
+        sumo_binary = checkBinary('sumo')
+    else:
+        sumo_binary = checkBinary('sumo-gui')
 
     # parse config file for map file name
     dom = parse("./configurations/myconfig.sumocfg")
@@ -84,9 +150,24 @@ if __name__ == "__main__":
     route_file_node = dom.getElementsByTagName('route-files')
     route_file_attr = route_file_node[0].attributes
     route_file = "./configurations/"+route_file_attr['value'].nodeValue
-    vehicles = get_controlled_vehicles(route_file, init_connection_info, 10, 50)
-    #print the controlled vehicles generated
+    run_options = {}
+    if options.start_state is not None:
+        # the controlled vehicles come from the state, the route file must be the one it was saved with
+        vehicles = {}
+        run_options["start_state"] = options.start_state
+    else:
+        vehicles = get_controlled_vehicles(route_file, init_connection_info, 10, 50)
+    if options.save_state_step is not None:
+        run_options.update(save_state_step=options.save_state_step, state_file=options.state_file,
+                           stop_after_save=True)
+    #log the controlled vehicles generated
     for vid, v in vehicles.items():
-        print("id: {}, destination: {}, start time:{}, deadline: {};".format(vid, \
-            v.destination, v.start_time, v.deadline))
-    test_dijkstra_policy(vehicles)
+        logger.debug("id: %s, destination: %s, start time:%s, deadline: %s;", vid, \
+            v.destination, v.start_time, v.deadline)
+    simulation_options = {}
+    if options.full_route:
+        simulation_options = {"decision_mode": FULL_ROUTE, "reroute_triggers": RerouteTriggers(
+            congestion_change=options.reroute_congestion, period=options.reroute_period)}
+    if options.decision_workers is not None:
+        simulation_options["parallel_decisions"] = ParallelDecisions(options.decision_workers)
+    test_dijkstra_policy(vehicles, run_options, options.profile, simulation_options)
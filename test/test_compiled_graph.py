@@ -0,0 +1,62 @@
+'''
+This test file needs the following files:
+Util.py, compiled_graph.py, map_bundle.py, test.net.xml and corresponding SUMO libraries.
+It checks that the dictionaries of ConnectionInfo agree with the compiled arrays they are built from,
+and that the map bundle cache gives the same arrays as parsing the network file.
+'''
+import os
+import shutil
+import tempfile
+import numpy as np
+from core.Util import ConnectionInfo
+from core import map_bundle
+
+NET_FILE = "./configurations/test.net.xml"
+
+
+def test_compiled_graph():
+    connection_info = ConnectionInfo(NET_FILE)
+    graph = connection_info.graph
+
+    assert graph.num_edges == len(connection_info.edge_index_dict)
+    assert len(graph.succ_ptr) == graph.num_edges + 1
+    for edge_id, index in connection_info.edge_index_dict.items():
+        assert graph.edge_ids[index] == edge_id
+        assert graph.lengths[index] == connection_info.edge_length_dict[edge_id]
+        # every successor in the CSR arrays is a direction in outgoing_edges_dict
+        successors = {graph.direction_names[direction]: graph.edge_ids[out_index]
+                      for direction, out_index in graph.successors(index)}
+        assert successors == connection_info.outgoing_edges_dict[edge_id]
+
+    assert [graph.edge_ids[index] for index in graph.passenger_edges] == connection_info.edge_list
+    print("TEST PASSED")
+
+
+def test_map_bundle():
+    parsed = ConnectionInfo(NET_FILE, use_bundle=False).graph
+    temp_directory = tempfile.mkdtemp()
+    try:
+        net_file = os.path.join(temp_directory, "test.net.xml")
+        shutil.copyfile(NET_FILE, net_file)
+        bundle = map_bundle.load_map_bundle(net_file)
+        assert bundle.directory is not None and bundle.directory.startswith(temp_directory)
+        graph = bundle.graph()
+        assert graph.edge_ids == parsed.edge_ids and graph.direction_names == parsed.direction_names
+        for name in map_bundle.GRAPH_ARRAYS:
+            assert np.array_equal(getattr(graph, name), getattr(parsed, name))
+
+        # a changed network file gets a new bundle and the old one is removed
+        with open(net_file, "a") as f:
+            f.write("<!-- changed -->\n")
+        rebuilt = map_bundle.load_map_bundle(net_file)
+        assert rebuilt.directory != bundle.directory
+        assert not os.path.exists(bundle.directory)
+        assert rebuilt.graph().edge_ids == parsed.edge_ids
+    finally:
+        shutil.rmtree(temp_directory)
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_compiled_graph()
+    test_map_bundle()
@@ -0,0 +1,70 @@
+'''
+This test file needs the following files:
+Util.py, map_bundle.py, contraction.py, shortest_path.py, test.net.xml, complex_grid1.net.xml and corresponding SUMO libraries.
+It checks that the contraction hierarchy queries return paths as short as Dijkstra's algorithm, that the unpacked
+paths follow the direction-labelled connections, and that the hierarchy is stored with the map bundle.
+'''
+import random
+import numpy as np
+from core.Util import ConnectionInfo
+from core.contraction import ContractionHierarchy, ContractionHierarchyEngine
+from core.shortest_path import ShortestPathEngine
+
+NET_FILES = ["./configurations/test.net.xml", "./configurations/maps/complex_grid1.net.xml"]
+
+
+def test_contraction_hierarchy():
+    for net_file in NET_FILES:
+        connection_info = ConnectionInfo(net_file)
+        graph = connection_info.graph
+        hierarchy = connection_info.map_bundle.contraction_hierarchy()
+        assert sorted(hierarchy.rank.tolist()) == list(range(graph.num_edges))
+        stored = connection_info.map_bundle.load_table("contraction_hierarchy")
+        assert stored is not None and np.array_equal(stored["up_head"], hierarchy.up_head)
+
+        dijkstra = ShortestPathEngine(graph)
+        ch = ContractionHierarchyEngine(graph, ContractionHierarchy.from_arrays(stored))
+        random.seed(7)
+        passenger = graph.passenger_edges.tolist()
+        for _ in range(500):
+            source, target = random.choice(passenger), random.choice(passenger)
+            expected = dijkstra.search(source, target)
+            result = ch.search(source, target)
+            if expected is None:
+                assert result is None
+                continue
+            cost, path, directions = result
+            assert abs(cost - expected[0]) < 1e-6
+            assert path[0] == source and path[-1] == target and len(directions) == len(path) - 1
+            # the shortcuts are unpacked into connections of the map, adding up to the cost
+            for i, direction in enumerate(directions):
+                assert (direction, path[i + 1]) in graph.successors(path[i])
+            assert abs(graph.lengths[path[1:]].sum() - cost) < 1e-6
+
+        # the decision list drives compute_local_target like the one of Dijkstra's algorithm
+        start, destination = graph.edge_ids[passenger[0]], graph.edge_ids[passenger[-1]]
+        edge_path, decision_list = ch.shortest_path(start, destination)
+        if edge_path:
+            current = start
+            for direction in decision_list:
+                current = connection_info.outgoing_edges_dict[current][direction]
+            assert current == destination == edge_path[-1]
+    print("TEST PASSED")
+
+
+def test_contraction_fallback():
+    connection_info = ConnectionInfo(NET_FILES[0])
+    graph = connection_info.graph
+    ch = ContractionHierarchyEngine(graph, ContractionHierarchy.build(graph))
+    dijkstra = ShortestPathEngine(graph)
+    passenger = graph.passenger_edges.tolist()
+    assert ch.search(passenger[3], passenger[3]) == (0.0, [passenger[3]], [])
+    # the hierarchy only holds for the edge lengths, other weights are searched with Dijkstra's algorithm
+    weights = (graph.lengths * 2.0 + 1.0).tolist()
+    assert ch.search(passenger[0], passenger[-1], weights) == dijkstra.search(passenger[0], passenger[-1], weights)
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_contraction_hierarchy()
+    test_contraction_fallback()
@@ -0,0 +1,107 @@
+'''
+This test file needs the following files:
+dense_model.py, QLearningController.py, Util.py, test.net.xml, rl-high-all-fixed-late.h5, and h5py
+(Keras only for the parity check).
+It checks the NumPy forward pass of the trained model against a direct computation from the .h5 weights
+and against Keras if Keras is installed, for the float32 and the int8 weights, and that the Q-learning policy
+reads no edge states in a step without vehicles to direct.
+File that will be generated during the unit test includes rl-high-all-fixed-late.*.npz in a temporary directory
+'''
+import os
+import shutil
+import tempfile
+import h5py
+import numpy as np
+from core import dense_model
+from core.Util import ConnectionInfo
+from core.network_state import NetworkSnapshot
+from controller.QLearningController import QLearningPolicy
+
+MODEL_FILE = "./test/rl-high-all-fixed-late.h5"
+NET_FILE = "./configurations/test.net.xml"
+
+
+def sample_states(model, num_states=200):
+    # states look like QLearningPolicy states: an edge index, 6 availability bits and the edge densities
+    rng = np.random.default_rng(0)
+    states = np.empty((num_states, model.input_size))
+    states[:, 0] = rng.integers(0, 200, num_states)
+    states[:, 1:7] = rng.integers(0, 2, (num_states, 6))
+    states[:, 7:] = rng.exponential(0.01, (num_states, model.input_size - 7))
+    return states
+
+
+def reference_predict(states):
+    # the layers of the model written out by hand: relu, leaky relu x2, sigmoid x2, linear
+    with h5py.File(MODEL_FILE, "r") as f:
+        weights = f["model_weights"]
+        layer = lambda name: (np.array(weights[name][name]["kernel:0"]), np.array(weights[name][name]["bias:0"]))
+        values = np.asarray(states, dtype=np.float64)
+        kernel, bias = layer("dense_1")
+        values = np.maximum(values.dot(kernel) + bias, 0)
+        for name in ["dense_2", "dense_3"]:
+            kernel, bias = layer(name)
+            values = values.dot(kernel) + bias
+            values = np.where(values > 0, values, 0.05 * values)
+        for name in ["dense_4", "dense_5"]:
+            kernel, bias = layer(name)
+            values = 0.5 * (1 + np.tanh((values.dot(kernel) + bias) / 2))
+        kernel, bias = layer("dense_6")
+        return values.dot(kernel) + bias
+
+
+def test_dense_model():
+    temp_directory = tempfile.mkdtemp()
+    try:
+        model_file = os.path.join(temp_directory, os.path.basename(MODEL_FILE))
+        shutil.copyfile(MODEL_FILE, model_file)
+        model = dense_model.load_model(model_file)
+        assert os.path.isfile(dense_model.converted_model_file(model_file))
+        assert model.input_size == 154 and model.output_size == 6
+
+        states = sample_states(model)
+        expected = reference_predict(states)
+        values = model.predict(states)
+        assert values.shape == (len(states), 6)
+        assert np.allclose(values, expected, rtol=1e-4, atol=1e-4)
+        # one row at a time gives the same values as the batch
+        assert np.allclose(model.predict(states[:1]), values[:1])
+
+        # the second load comes from the converted file
+        reloaded = dense_model.load_model(model_file)
+        assert np.array_equal(reloaded.predict(states), values)
+
+        quantized = dense_model.load_model(model_file, "int8")
+        converted = dense_model.converted_model_file(model_file, "int8")
+        assert os.path.getsize(converted) < os.path.getsize(dense_model.converted_model_file(model_file)) / 2
+        quantized_values = quantized.predict(states)
+        assert np.abs(quantized_values - expected).max() < 0.05 * np.abs(expected).max()
+
+        try:
+            from keras.models import load_model
+        except ImportError:
+            print("Keras is not installed, skipping the parity check against Keras")
+        else:
+            keras_values = load_model(model_file).predict(states)
+            assert np.allclose(values, keras_values, rtol=1e-4, atol=1e-4)
+    finally:
+        shutil.rmtree(temp_directory)
+    print("TEST PASSED")
+
+
+def test_qlearning_without_vehicles():
+    connection_info = ConnectionInfo(NET_FILE)
+    policy = QLearningPolicy(connection_info, MODEL_FILE, backend="numpy")
+    # without a snapshot the densities would be polled from TraCI, which is not connected here
+    assert policy.make_decisions([], connection_info) == {}
+    connection_info.network_state = NetworkSnapshot(connection_info.graph)
+    for batch_decisions in (False, True):
+        policy.batch_decisions = batch_decisions
+        assert policy.make_decisions([], connection_info) == {}
+    assert not connection_info.network_state.populated
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_dense_model()
+    test_qlearning_without_vehicles()
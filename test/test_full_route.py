@@ -0,0 +1,67 @@
+'''
+This test file needs the following files:
+STR_SUMO.py, reroute_triggers.py, meso_sim.py, sumo_backend.py, DijkstraController.py, RouteController.py,
+target_vehicles_generation_protocols.py, test.net.xml.
+It runs the full-route decision mode on the meso simulator: the vehicles are committed to whole routes and only
+decide again when a reroute trigger fires.
+File that will be generated during the unit test includes test.route.rou.xml
+'''
+import copy
+import os
+from core.sumo_backend import traci, select_backend, MESO, TRACI
+from core.STR_SUMO import StrSumo, SUBSCRIPTION, FULL_ROUTE
+from core.reroute_triggers import RerouteTriggers
+from core.profiling import StepProfiler
+from core.Util import ConnectionInfo
+from core.target_vehicles_generation_protocols import target_vehicles_generator
+from controller.DijkstraController import DijkstraPolicy
+from controller.RouteController import RandomPolicy
+
+NET_FILE = "./configurations/test.net.xml"
+ROUTE_FILE = "test.route.rou.xml"
+
+
+def simulate(policy_class, vehicles, reroute_triggers=None):
+    connection_info = ConnectionInfo(NET_FILE)
+    profiler = StepProfiler(count_round_trips=False)
+    simulation = StrSumo(policy_class(connection_info), connection_info, vehicles, SUBSCRIPTION, profiler,
+                         FULL_ROUTE, reroute_triggers)
+    traci.start(["sumo", "-n", NET_FILE, "-r", ROUTE_FILE])
+    try:
+        total_time, end_number, deadlines_missed = simulation.run()
+    finally:
+        traci.close()
+    return end_number, profiler.counter_totals()["decisions_issued"]
+
+
+def test_full_route():
+    select_backend(MESO)
+    try:
+        generator = target_vehicles_generator(NET_FILE)
+        vehicle_list = generator.generate_vehicles(10, 100, 3, ROUTE_FILE, NET_FILE, seed=7)
+        vehicles = {str(vehicle.vehicle_id): vehicle for vehicle in vehicle_list}
+
+        committed = copy.deepcopy(vehicles)
+        end_number, decisions = simulate(DijkstraPolicy, committed)
+        assert end_number == len(vehicles)
+        directed = [vehicle for vehicle in committed.values() if vehicle.local_destination]
+        # without deviations every vehicle is routed once, and its route ends at its destination
+        assert decisions == len(directed)
+        assert all(vehicle.local_destination == vehicle.destination for vehicle in directed)
+
+        # a periodic trigger makes the vehicles decide again on their way
+        end_number, periodic_decisions = simulate(DijkstraPolicy, copy.deepcopy(vehicles), RerouteTriggers(period=1))
+        assert end_number == len(vehicles) and periodic_decisions > decisions
+
+        # policies deciding local targets are followed by the default make_route_decisions
+        end_number, decisions = simulate(RandomPolicy, copy.deepcopy(vehicles))
+        assert end_number == len(vehicles)
+    finally:
+        select_backend(TRACI)
+        if os.path.exists(ROUTE_FILE):
+            os.remove(ROUTE_FILE)
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_full_route()
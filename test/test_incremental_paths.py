@@ -0,0 +1,84 @@
+'''
+This test file needs the following files:
+Util.py, map_bundle.py, incremental_paths.py, shortest_path.py, STR_SUMO.py, meso_sim.py, sumo_backend.py,
+IncrementalController.py, target_vehicles_generation_protocols.py, test.net.xml and corresponding SUMO libraries.
+It checks that the incremental shortest path trees, repaired after random changes of the edge weights, agree with
+trees rebuilt from scratch, and runs the incremental policy with rebuilt and with repaired trees on the meso simulator.
+File that will be generated during the unit test includes test.route.rou.xml
+'''
+import copy
+import os
+import random
+import numpy as np
+from core.sumo_backend import traci, select_backend, MESO, TRACI
+from core.STR_SUMO import StrSumo, SUBSCRIPTION
+from core.Util import ConnectionInfo
+from core.incremental_paths import IncrementalTreeCache
+from core.shortest_path import ShortestPathTreeCache
+from core.target_vehicles_generation_protocols import target_vehicles_generator
+from controller.IncrementalController import IncrementalPolicy
+
+NET_FILE = "./configurations/test.net.xml"
+ROUTE_FILE = "test.route.rou.xml"
+
+
+def test_incremental_trees():
+    graph = ConnectionInfo(NET_FILE).graph
+    rng = random.Random(1)
+    passenger = graph.passenger_edges.tolist()
+    destinations = rng.sample(passenger, 10)
+    incremental, rebuilt = IncrementalTreeCache(graph), ShortestPathTreeCache(graph)
+    weights = graph.lengths.copy()
+    for step in range(30):
+        # some destinations are skipped in a step, so their trees are repaired for several steps of changes
+        changed = rng.sample(range(graph.num_edges), 10)
+        weights[changed] = graph.lengths[changed] * rng.uniform(0.5, 4.0)
+        assert incremental.set_weights(weights) == len(changed)
+        rebuilt.set_weights(weights)
+        for destination in destinations:
+            if rng.random() < 0.3:
+                continue
+            tree = incremental.tree(destination)
+            distance = rebuilt.tree(destination).distance
+            # the trees only grow as far as the queries need, so the repairs also start from partial trees
+            for source in rng.sample(passenger, 5):
+                result = tree.search(source)
+                if result is None:
+                    assert not np.isfinite(distance[source])
+                    continue
+                cost, path, directions = result
+                assert abs(cost - distance[source]) < 1e-6
+                assert path[0] == source and path[-1] == destination and len(directions) == len(path) - 1
+                assert abs(weights[path[1:]].sum() - cost) < 1e-6
+    assert incremental.set_weights(weights) == 0
+    print("TEST PASSED")
+
+
+def test_incremental_policy():
+    select_backend(MESO)
+    try:
+        generator = target_vehicles_generator(NET_FILE)
+        vehicle_list = generator.generate_vehicles(10, 200, 3, ROUTE_FILE, NET_FILE, seed=3)
+        vehicles = {str(vehicle.vehicle_id): vehicle for vehicle in vehicle_list}
+        for incremental in (False, True):
+            connection_info = ConnectionInfo(NET_FILE)
+            policy = IncrementalPolicy(connection_info, incremental=incremental)
+            simulation = StrSumo(policy, connection_info, copy.deepcopy(vehicles), SUBSCRIPTION)
+            traci.start(["sumo", "-n", NET_FILE, "-r", ROUTE_FILE])
+            try:
+                total_time, end_number, deadlines_missed = simulation.run()
+            finally:
+                traci.close()
+            assert end_number == len(vehicles)
+            assert (policy.incremental_trees is None) != incremental
+            assert not incremental or len(policy.incremental_trees) > 0
+    finally:
+        select_backend(TRACI)
+        if os.path.exists(ROUTE_FILE):
+            os.remove(ROUTE_FILE)
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_incremental_trees()
+    test_incremental_policy()
@@ -0,0 +1,67 @@
+'''
+This test file needs the following files:
+Util.py, map_bundle.py, landmarks.py, shortest_path.py, test.net.xml and corresponding SUMO libraries.
+It checks that the A* search with landmark bounds returns paths as short as Dijkstra's algorithm,
+that the bounds never exceed the true costs, and that the landmarks are stored with the map bundle.
+'''
+import random
+import numpy as np
+from core.Util import ConnectionInfo
+from core.landmarks import AltEngine, LandmarkTable
+from core.shortest_path import ShortestPathEngine
+
+NET_FILE = "./configurations/test.net.xml"
+
+
+def test_alt_engine():
+    connection_info = ConnectionInfo(NET_FILE)
+    graph = connection_info.graph
+    landmarks = connection_info.map_bundle.landmarks()
+    assert len(landmarks.landmarks) > 0 and landmarks.from_landmark.shape == (len(landmarks.landmarks), graph.num_edges)
+    # a second bundle object reads the stored table instead of computing it again
+    stored = connection_info.map_bundle.load_table("landmarks")
+    assert stored is not None and np.array_equal(stored["to_landmark"], landmarks.to_landmark)
+
+    dijkstra = ShortestPathEngine(graph)
+    alt = AltEngine(graph, landmarks)
+    random.seed(5)
+    passenger = graph.passenger_edges.tolist()
+    settled_dijkstra = settled_alt = 0
+    for _ in range(500):
+        source, target = random.choice(passenger), random.choice(passenger)
+        expected = dijkstra.search(source, target)
+        result = alt.search(source, target)
+        settled_dijkstra += sum(1 for query in dijkstra._settled_in if query == dijkstra._query)
+        settled_alt += alt.settled
+        if expected is None:
+            assert result is None
+            continue
+        cost, path, directions = result
+        assert abs(cost - expected[0]) < 1e-6
+        assert path[0] == source and path[-1] == target
+        # the directions drive along the path
+        for i, direction in enumerate(directions):
+            assert (direction, path[i + 1]) in graph.successors(path[i])
+        assert landmarks.lower_bound(source, target) <= expected[0] + 1e-6
+    assert settled_alt < settled_dijkstra
+
+    # other weights than the edge lengths are searched without the landmark bounds
+    weights = (graph.lengths * 3.0).tolist()
+    source, target = passenger[0], passenger[-1]
+    assert alt.search(source, target, weights) == dijkstra.search(source, target, weights)
+    print("TEST PASSED")
+
+
+def test_landmarks_in_memory():
+    connection_info = ConnectionInfo(NET_FILE)
+    table = LandmarkTable.build(connection_info.graph, num_landmarks=3)
+    assert len(set(table.landmarks.tolist())) == 3
+    # every landmark is at distance 0 from and to itself
+    for i, landmark in enumerate(table.landmarks.tolist()):
+        assert table.from_landmark[i, landmark] == 0.0 and table.to_landmark[i, landmark] == 0.0
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_alt_engine()
+    test_landmarks_in_memory()
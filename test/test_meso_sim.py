@@ -0,0 +1,103 @@
+'''
+This test file needs the following files:
+meso_sim.py, sumo_backend.py, STR_SUMO.py, DijkstraController.py, target_vehicles_generation_protocols.py, test.net.xml.
+It runs the testbed on the meso simulator instead of SUMO, so it needs no SUMO installation.
+File that will be generated during the unit test includes test.meso.rou.xml
+'''
+import os
+import numpy as np
+from core.sumo_backend import traci, select_backend, MESO, TRACI
+from core.STR_SUMO import StrSumo, SUBSCRIPTION, POLLING
+from core.Util import ConnectionInfo
+from core.compiled_graph import CompiledGraph
+from core.target_vehicles_generation_protocols import target_vehicles_generator
+from controller.DijkstraController import DijkstraPolicy
+
+NET_FILE = "./configurations/test.net.xml"
+ROUTE_FILE = "test.meso.rou.xml"
+
+
+def run_testbed(collection_mode, num_controlled=10, num_background=100):
+    connection_info = ConnectionInfo(NET_FILE)
+    generator = target_vehicles_generator(NET_FILE)
+    vehicle_list = generator.generate_vehicles(num_controlled, num_background, 3, ROUTE_FILE, NET_FILE, seed=7)
+    vehicles = {str(vehicle.vehicle_id): vehicle for vehicle in vehicle_list}
+
+    simulation = StrSumo(DijkstraPolicy(connection_info), connection_info, vehicles, collection_mode)
+    traci.start(["sumo", "-n", NET_FILE, "-r", ROUTE_FILE])
+    try:
+        total_time, end_number, deadlines_missed = simulation.run()
+        assert traci.simulation.getMinExpectedNumber() == 0
+        assert len(traci.vehicle.getIDList()) == 0
+    finally:
+        traci.close()
+        os.remove(ROUTE_FILE)
+    return vehicles, total_time, end_number
+
+
+def test_meso_sim():
+    select_backend(MESO)
+    try:
+        for collection_mode in [POLLING, SUBSCRIPTION]:
+            vehicles, total_time, end_number = run_testbed(collection_mode)
+            # every controlled vehicle arrives, and every directed one is guided to its destination
+            # (pattern 3 may release a vehicle on its destination edge, which is never directed)
+            assert end_number == len(vehicles)
+            assert all(vehicle.local_destination == vehicle.destination
+                       for vehicle in vehicles.values() if vehicle.local_destination)
+            assert total_time > 0
+    finally:
+        select_backend(TRACI)
+    print("TEST PASSED")
+
+
+def queue_graph():
+    # a long edge feeding a short one holding two vehicles, followed by two longer edges
+    lengths = [100.0, 15.0, 100.0, 100.0]
+    return CompiledGraph(["a", "b", "c", "d"], lengths, [13.9] * 4, [1] * 4, [True] * 4,
+                         [0, 1, 2, 3, 3], [1, 2, 3], [0, 0, 0])
+
+
+def run_queues(time_to_teleport, num_vehicles=30):
+    from core import meso_sim
+    graph = queue_graph()
+    with open(ROUTE_FILE, "w") as f:
+        f.write("<routes>\n")
+        for i in range(num_vehicles):
+            f.write('    <vehicle id="%d" depart="0"><route edges="a b c d"/></vehicle>\n' % i)
+        f.write("</routes>\n")
+    try:
+        simulation = meso_sim.start_simulation(graph, [ROUTE_FILE], time_to_teleport=time_to_teleport)
+        inserted = arrived = 0
+        blocked = False
+        while simulation.expected_number() > 0:
+            simulation.step()
+            inserted += len(simulation.departed)
+            arrived += len(simulation.arrived)
+            # the edges never hold more than their capacity, not even after a teleport
+            assert np.all(simulation.edge_counts <= simulation.capacity)
+            assert simulation.edge_counts.sum() == len(simulation.vehicle_ids())
+            on_a = simulation.active[:simulation._size] & (simulation.edge[:simulation._size] == 0)
+            blocked |= bool(np.any(on_a & (simulation.waiting[:simulation._size] > 0)))
+        assert inserted == arrived == num_vehicles
+        return blocked, simulation.teleports
+    finally:
+        meso_sim.close()
+        os.remove(ROUTE_FILE)
+
+
+def test_meso_queues():
+    # the short edge fills up and the vehicles at the end of the long one wait in front of it
+    blocked, teleports = run_queues(-1)
+    assert blocked
+    assert teleports == 0
+    # with a short teleport time the waiting vehicles jump past the full edge
+    blocked, teleports = run_queues(5.0)
+    assert blocked
+    assert teleports > 0
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_meso_sim()
+    test_meso_queues()
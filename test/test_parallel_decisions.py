@@ -0,0 +1,121 @@
+'''
+This test file needs the following files:
+Util.py, map_bundle.py, parallel_decisions.py, network_state.py, vehicle_table.py, STR_SUMO.py, meso_sim.py,
+sumo_backend.py, DijkstraController.py, CongestionAwareController.py, IncrementalController.py,
+target_vehicles_generation_protocols.py, test.net.xml and corresponding SUMO libraries.
+It checks that the decisions made on a pool of worker processes sharing the map, the edge states and the vehicle
+table are the ones made in a single process, also after vehicles are added to the table, that the edge states
+are only fetched for controllers reading them, and runs a simulation on the meso simulator with and without
+workers.
+File that will be generated during the unit test includes test.route.rou.xml
+'''
+import copy
+import functools
+import os
+import random
+import numpy as np
+from core.sumo_backend import traci, select_backend, MESO, TRACI
+from core.STR_SUMO import StrSumo, SUBSCRIPTION
+from core.Util import ConnectionInfo, Vehicle
+from core.network_state import NetworkSnapshot, SharedNetworkSnapshot, SNAPSHOT_VARIABLES
+from core.parallel_decisions import ParallelDecisions
+from core.vehicle_table import VehicleTable
+from core.target_vehicles_generation_protocols import target_vehicles_generator
+from controller.CongestionAwareController import CongestionAwarePolicy
+from controller.DijkstraController import DijkstraPolicy
+from controller.IncrementalController import IncrementalPolicy
+from controller.RouteController import RandomPolicy
+
+NET_FILE = "./configurations/test.net.xml"
+ROUTE_FILE = "test.route.rou.xml"
+
+
+def add_vehicles(table, graph, rng, number):
+    passenger = graph.passenger_edges.tolist()
+    vehicles = []
+    for _ in range(number):
+        vehicle = Vehicle(str(len(table)), graph.edge_ids[rng.choice(passenger)], 0, 1000, table)
+        vehicle.current_edge = graph.edge_ids[rng.choice(passenger)]
+        vehicle.current_speed = rng.uniform(0.0, 15.0)
+        vehicles.append(vehicle)
+    return vehicles
+
+
+def test_parallel_decisions():
+    connection_info = ConnectionInfo(NET_FILE)
+    graph = connection_info.graph
+    rng = random.Random(1)
+    table = VehicleTable(graph.edge_ids)
+    vehicles = add_vehicles(table, graph, rng, 60)
+    # a snapshot that is filled here instead of by SUMO
+    network_state = SharedNetworkSnapshot(graph, np.zeros((len(SNAPSHOT_VARIABLES), graph.num_edges)))
+    connection_info.network_state = network_state
+    controller = CongestionAwarePolicy(connection_info)
+    parallel = ParallelDecisions(3, min_shard=1)
+    with parallel:
+        parallel.start(controller, table, network_state)
+        for step in range(3):
+            # travel times of the step, written into the shared arrays like a refresh of the snapshot
+            network_state.arrays[3] = controller.free_flow_time * np.array(
+                [rng.uniform(1.0, 3.0) for _ in range(graph.num_edges)])
+            network_state.advance(step)
+            if step == 2:
+                vehicles += add_vehicles(table, graph, rng, 40)
+            for full_route in (False, True):
+                decisions = parallel.decide(vehicles, step, full_route)
+                if full_route:
+                    serial = controller.make_route_decisions(vehicles, connection_info)
+                else:
+                    serial = controller.make_decisions(vehicles, connection_info)
+                assert list(decisions.items()) == list(serial.items())
+    # the table works on private columns again once the workers are stopped
+    assert not parallel.started and len(table) == 100
+    assert vehicles[-1].destination in graph.edge_index
+
+    for controller in (RandomPolicy(connection_info), IncrementalPolicy(connection_info, incremental=True)):
+        try:
+            ParallelDecisions(2).start(controller, table, network_state)
+            assert False, type(controller).__name__ + " is not parallel safe"
+        except ValueError:
+            pass
+
+    # the Dijkstra policy does not read the edge states, so they are not fetched from SUMO (not connected here)
+    connection_info.network_state = NetworkSnapshot(graph)
+    controller = DijkstraPolicy(connection_info)
+    with ParallelDecisions(2, min_shard=1) as parallel:
+        parallel.start(controller, table, connection_info.network_state)
+        decisions = parallel.decide(vehicles, 0)
+    assert list(decisions.items()) == list(controller.make_decisions(vehicles, connection_info).items())
+    assert not connection_info.network_state.populated
+    print("TEST PASSED")
+
+
+def test_parallel_simulation():
+    select_backend(MESO)
+    try:
+        generator = target_vehicles_generator(NET_FILE)
+        vehicle_list = generator.generate_vehicles(40, 200, 3, ROUTE_FILE, NET_FILE, seed=3)
+        vehicles = {str(vehicle.vehicle_id): vehicle for vehicle in vehicle_list}
+        factory = functools.partial(DijkstraPolicy, routing="trees")
+        results = []
+        for parallel in (None, ParallelDecisions(2, factory, min_shard=1)):
+            connection_info = ConnectionInfo(NET_FILE)
+            simulation = StrSumo(factory(connection_info), connection_info, copy.deepcopy(vehicles), SUBSCRIPTION,
+                                 parallel_decisions=parallel)
+            traci.start(["sumo", "-n", NET_FILE, "-r", ROUTE_FILE])
+            try:
+                results.append(simulation.run())
+            finally:
+                traci.close()
+        assert results[0] == results[1]
+        assert results[0][1] == len(vehicles)
+    finally:
+        select_backend(TRACI)
+        if os.path.exists(ROUTE_FILE):
+            os.remove(ROUTE_FILE)
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_parallel_decisions()
+    test_parallel_simulation()
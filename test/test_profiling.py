@@ -0,0 +1,66 @@
+'''
+This test file needs the following files:
+profiling.py, STR_SUMO.py, meso_sim.py, sumo_backend.py, DijkstraController.py, test.net.xml.
+It profiles a run on the meso simulator and checks the per-step table and the exported profile.
+Files that will be generated during the unit test include test.profile.rou.xml, test.profile.json and test.profile.csv
+'''
+import csv
+import json
+import os
+from core.sumo_backend import traci, select_backend, MESO, TRACI
+from core.STR_SUMO import StrSumo, SUBSCRIPTION
+from core.Util import ConnectionInfo
+from core.profiling import StepProfiler, PHASES, COUNTERS
+from core.target_vehicles_generation_protocols import target_vehicles_generator
+from controller.DijkstraController import DijkstraPolicy
+
+NET_FILE = "./configurations/test.net.xml"
+ROUTE_FILE = "test.profile.rou.xml"
+
+
+def test_profiling():
+    select_backend(MESO)
+    try:
+        generator = target_vehicles_generator(NET_FILE)
+        vehicle_list = generator.generate_vehicles(10, 50, 3, ROUTE_FILE, NET_FILE, seed=5)
+        vehicles = {str(vehicle.vehicle_id): vehicle for vehicle in vehicle_list}
+        connection_info = ConnectionInfo(NET_FILE)
+        profiler = StepProfiler()
+        simulation = StrSumo(DijkstraPolicy(connection_info), connection_info, vehicles, SUBSCRIPTION, profiler)
+        traci.start(["sumo", "-n", NET_FILE, "-r", ROUTE_FILE])
+        try:
+            total_time, end_number, deadlines_missed = simulation.run()
+            steps = int(traci.simulation.getTime())
+        finally:
+            traci.close()
+        # the round-trip counter is removed from the backend at the end of the run
+        assert traci._instrumented is None
+
+        # one row per simulation step, plus the arrivals reported after the last one
+        assert len(profiler.rows) == steps + 1
+        counters = profiler.counter_totals()
+        assert counters["arrived"] == end_number
+        assert counters["decisions_issued"] <= counters["vehicles_directed"]
+        # with subscriptions, only the departures, changeTarget, setColor and subscribe calls and the steps cost a round-trip
+        assert counters["round_trips"] >= steps
+        assert profiler.controller_statistics()["DijkstraPolicy"]["vehicles"] == counters["vehicles_directed"]
+
+        profiler.write("test.profile.json")
+        with open("test.profile.json") as f:
+            profile = json.load(f)
+        assert profile["counters"] == counters and len(profile["rows"]) == len(profiler.rows)
+        profiler.write("test.profile.csv")
+        with open("test.profile.csv") as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == ["step"] + list(PHASES) + list(COUNTERS) and len(rows) == len(profiler.rows) + 1
+        assert "DijkstraPolicy" in profiler.summary()
+    finally:
+        select_backend(TRACI)
+        for file_name in [ROUTE_FILE, "test.profile.json", "test.profile.csv"]:
+            if os.path.exists(file_name):
+                os.remove(file_name)
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_profiling()
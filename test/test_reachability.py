@@ -0,0 +1,57 @@
+'''
+This test file needs the following files:
+Util.py, compiled_graph.py, reachability.py, test.net.xml and corresponding SUMO libraries.
+It compares the reachability index with a breadth-first search over outgoing_edges_dict.
+'''
+import random
+import numpy as np
+from core.Util import ConnectionInfo
+from core.reachability import ReachabilityIndex
+
+NET_FILE = "./configurations/test.net.xml"
+
+
+def reachable_by_bfs(connection_info, start_edge):
+    reached = {start_edge}
+    frontier = [start_edge]
+    while frontier:
+        edge = frontier.pop()
+        for outgoing_edge in connection_info.outgoing_edges_dict[edge].values():
+            if outgoing_edge not in reached:
+                reached.add(outgoing_edge)
+                frontier.append(outgoing_edge)
+    return reached
+
+
+def test_reachability():
+    connection_info = ConnectionInfo(NET_FILE)
+    index = ReachabilityIndex(connection_info.graph)
+    random.seed(3)
+    for start_edge in random.sample(connection_info.edge_list, 40):
+        reached = reachable_by_bfs(connection_info, start_edge)
+        for destination in connection_info.edge_list:
+            assert index.reaches_edge(start_edge, destination) == (destination in reached)
+        reachable_ids = {connection_info.graph.edge_ids[edge] for edge in index.reachable_edges(
+            connection_info.edge_index_dict[start_edge])}
+        assert reachable_ids == reached & set(connection_info.edge_list)
+        # the counts summed up along the component DAG match the search
+        start_component = index.component[connection_info.edge_index_dict[start_edge]]
+        assert index.reach_counts()[start_component] == len(reached & set(connection_info.edge_list))
+    print("TEST PASSED")
+
+
+def test_sample_pairs():
+    connection_info = ConnectionInfo(NET_FILE)
+    index = ReachabilityIndex(connection_info.graph)
+    starts, destinations = index.sample_pairs(500, np.random.default_rng(5))
+    assert len(starts) == len(destinations) == 500
+    for start, destination in zip(starts, destinations):
+        assert start != destination
+        assert connection_info.graph.passenger[start] and connection_info.graph.passenger[destination]
+        assert index.reaches(start, destination)
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_reachability()
+    test_sample_pairs()
@@ -0,0 +1,60 @@
+'''
+This test file needs the following files:
+route_files.py.
+It merges controlled vehicles into a small background route file, plain and gzip-compressed.
+File that will be generated during the unit test includes test.merge*.xml*
+'''
+import os
+from core import route_files
+
+BACKGROUND = '''<?xml version="1.0" encoding="UTF-8"?>
+<routes xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:noNamespaceSchemaLocation="http://sumo.dlr.de/xsd/routes_file.xsd">
+    <vType id="car" accel="2.6"/>
+    <vehicle id="0" depart="0.00">
+        <route edges="a b"/>
+    </vehicle>
+    <vehicle id="1" depart="1.50">
+        <route edges="b c"/>
+    </vehicle>
+    <vehicle id="2" depart="3.00">
+        <route edges="c d"/>
+    </vehicle>
+</routes>
+'''
+
+
+def remove_temp_files(file_name):
+    if os.path.exists(file_name):
+        os.remove(file_name)
+
+
+def merge_into(output_file):
+    background_file = "test.merge.background.xml"
+    with open(background_file, "w") as f:
+        f.write(BACKGROUND)
+    controlled = [(depart, route_files.controlled_vehicle_element(vehicle_id, depart, "x"))
+                  for vehicle_id, depart in [(3, 0), (4, 1.5), (5, 2.25), (6, 10.0)]]
+    route_files.merge_route_files(background_file, controlled, output_file)
+    remove_temp_files(background_file)
+
+    root_attributes = {}
+    elements = [(element.tag, element.get("id"), element.findall("route"))
+                for element in route_files.iter_route_elements(output_file, root_attributes)]
+    remove_temp_files(output_file)
+    return elements, root_attributes
+
+
+def test_merge_route_files():
+    for output_file in ["test.merge.rou.xml", "test.merge.rou.xml.gz"]:
+        elements, root_attributes = merge_into(output_file)
+        # the vType stays in front, controlled vehicles go after background vehicles departing at the same time
+        assert [(tag, vehicle_id) for tag, vehicle_id, _ in elements] == [
+            ("vType", "car"), ("vehicle", "0"), ("vehicle", "3"), ("vehicle", "1"), ("vehicle", "4"),
+            ("vehicle", "5"), ("vehicle", "2"), ("vehicle", "6")]
+        assert all(len(routes) == 1 for tag, _, routes in elements if tag == "vehicle")
+        assert "{http://www.w3.org/2001/XMLSchema-instance}noNamespaceSchemaLocation" in root_attributes
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_merge_route_files()
@@ -0,0 +1,102 @@
+'''
+This test file needs the following files:
+Util.py, compiled_graph.py, shortest_path.py, test.net.xml and corresponding SUMO libraries.
+It compares the heap-based engine and the reverse shortest path trees with a plain Bellman-Ford
+relaxation over outgoing_edges_dict, and checks that the trees are dropped when the weights change,
+also when the caller updates its weight array in place.
+'''
+import random
+import numpy as np
+from core.Util import ConnectionInfo
+from core.shortest_path import ShortestPathEngine, ShortestPathTreeCache
+
+NET_FILE = "./configurations/test.net.xml"
+
+
+def bellman_ford(connection_info, start_edge):
+    distances = {start_edge: 0.0}
+    changed = True
+    while changed:
+        changed = False
+        for edge, distance in list(distances.items()):
+            for outgoing_edge in connection_info.outgoing_edges_dict[edge].values():
+                new_distance = distance + connection_info.edge_length_dict[outgoing_edge]
+                if new_distance < distances.get(outgoing_edge, float("inf")):
+                    distances[outgoing_edge] = new_distance
+                    changed = True
+    return distances
+
+
+def test_shortest_path():
+    connection_info = ConnectionInfo(NET_FILE)
+    engine = ShortestPathEngine(connection_info.graph)
+    random.seed(7)
+    for start_edge in random.sample(connection_info.edge_list, 10):
+        distances = bellman_ford(connection_info, start_edge)
+        for destination in random.sample(connection_info.edge_list, 20):
+            path, directions = engine.shortest_path(start_edge, destination)
+            if destination not in distances:
+                assert path == [] and directions == []
+                continue
+            # the directions must drive along the returned path, and the path must be as short as possible
+            assert path[0] == start_edge and path[-1] == destination
+            assert len(directions) == len(path) - 1
+            for i, direction in enumerate(directions):
+                assert connection_info.outgoing_edges_dict[path[i]][direction] == path[i + 1]
+            length = sum(connection_info.edge_length_dict[edge] for edge in path[1:])
+            assert abs(length - distances[destination]) < 1e-6
+    print("TEST PASSED")
+
+
+def test_shortest_path_tree_cache():
+    connection_info = ConnectionInfo(NET_FILE)
+    graph = connection_info.graph
+    engine = ShortestPathEngine(graph)
+    random.seed(11)
+    destinations = random.sample(connection_info.edge_list, 5)
+    tree_size = graph.num_edges * (8 + 4 + 1)
+    cache = ShortestPathTreeCache(graph, memory_budget=3 * tree_size)
+
+    for destination in destinations:
+        for start_edge in random.sample(connection_info.edge_list, 30):
+            expected = engine.search(graph.edge_index[start_edge], graph.edge_index[destination])
+            path, directions = cache.shortest_path(start_edge, destination)
+            if expected is None:
+                assert path == []
+                continue
+            assert path[0] == start_edge and path[-1] == destination
+            for i, direction in enumerate(directions):
+                assert connection_info.outgoing_edges_dict[path[i]][direction] == path[i + 1]
+            length = sum(connection_info.edge_length_dict[edge] for edge in path[1:])
+            assert abs(length - expected[0]) < 1e-6
+    # least recently used trees are evicted to respect the memory budget
+    assert len(cache) == 3 and cache.memory_used <= cache.memory_budget
+
+    # changing the weights drops the trees and the new trees follow the new weights
+    weights = graph.lengths * np.linspace(1.0, 3.0, graph.num_edges)
+    cache.set_weights(weights)
+    assert len(cache) == 0
+    start_edge = connection_info.edge_list[0]
+    for destination in destinations:
+        expected = engine.search(graph.edge_index[start_edge], graph.edge_index[destination], weights.tolist())
+        result = cache.tree(graph.edge_index[destination]).search(graph.edge_index[start_edge])
+        assert (expected is None) == (result is None)
+        if expected is not None:
+            assert abs(expected[0] - result[0]) < 1e-6
+
+    # updating the same weight array in place also drops the trees
+    cache.tree(graph.edge_index[destinations[0]])
+    weights *= 2.0
+    cache.set_weights(weights)
+    assert len(cache) == 0
+    result = cache.tree(graph.edge_index[destinations[0]]).search(graph.edge_index[start_edge])
+    expected = engine.search(graph.edge_index[start_edge], graph.edge_index[destinations[0]], weights.tolist())
+    assert (expected is None) == (result is None)
+    if expected is not None:
+        assert abs(expected[0] - result[0]) < 1e-6
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_shortest_path()
+    test_shortest_path_tree_cache()
@@ -0,0 +1,52 @@
+'''
+This test file needs the following files:
+sim_log.py
+It checks that the leveled messages and the per-vehicle records are written by the background threads.
+Files that will be generated during the unit test include test.sim_log.log and test.sim_log.jsonl
+'''
+import json
+import logging
+import os
+from core import sim_log
+
+LOG_FILE = "test.sim_log.log"
+RECORD_FILE = "test.sim_log.jsonl"
+
+
+def test_sim_log():
+    logger = sim_log.get_logger("test")
+    try:
+        assert not sim_log.recording()
+        sim_log.configure(logging.INFO, LOG_FILE, RECORD_FILE, console=False)
+        assert sim_log.recording()
+        for vehicle_id in range(5000):
+            logger.debug("Vehicle %s reaches the destination", vehicle_id)
+            sim_log.record("arrival", step=vehicle_id, vehicle=str(vehicle_id), deadline_missed=False)
+        logger.warning("Ending due to timeout.")
+        # shutdown writes out everything still queued
+        sim_log.shutdown()
+        assert not sim_log.recording()
+
+        with open(LOG_FILE) as f:
+            messages = f.read().splitlines()
+        # the per-vehicle messages are below the configured level
+        assert len(messages) == 1 and messages[0].endswith("WARNING str_sumo.test: Ending due to timeout.")
+        with open(RECORD_FILE) as f:
+            records = [json.loads(line) for line in f]
+        assert len(records) == 5000
+        assert records[0] == {"event": "arrival", "step": 0, "vehicle": "0", "deadline_missed": False}
+        assert [record["step"] for record in records] == list(range(5000))
+
+        # without configuration records are dropped and the testbed logger is back to the default
+        sim_log.record("arrival", step=0)
+        assert not logging.getLogger(sim_log.LOGGER_NAME).handlers
+    finally:
+        sim_log.shutdown()
+        for file_name in [LOG_FILE, RECORD_FILE]:
+            if os.path.exists(file_name):
+                os.remove(file_name)
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_sim_log()
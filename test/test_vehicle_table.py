@@ -0,0 +1,51 @@
+'''
+This test file needs the following files:
+Util.py, vehicle_table.py
+It checks that Vehicle objects read and write the rows of their VehicleTable, and that vehicles created separately
+can be gathered into one table.
+'''
+import copy
+import pickle
+from core.Util import Vehicle
+from core.vehicle_table import VehicleTable, NO_EDGE
+
+
+def test_vehicle_table():
+    table = VehicleTable(["a", "b", "c"])
+    # more vehicles than the initial capacity, so that the columns grow
+    vehicles = [Vehicle(str(i), "c", i * 0.5, 500 + i, table) for i in range(100)]
+    assert len(table) == 100
+    vehicle = vehicles[42]
+    assert vehicle.vehicle_id == "42" and vehicle.destination == "c"
+    assert vehicle.start_time == 21.0 and vehicle.deadline == 542.0
+    assert vehicle.current_edge == "" and vehicle.local_destination == "" and vehicle.current_speed == 0.0
+    assert table.current_edge[42] == NO_EDGE
+
+    vehicle.current_edge = "b"
+    vehicle.current_speed = 13.5
+    vehicle.local_destination = "x" # unknown edge ids are added to the table
+    assert table.current_edge[42] == 1 and table.current_speed[42] == 13.5
+    assert table.edge_ids[table.local_destination[42]] == "x" and vehicle.local_destination == "x"
+    assert list(table.rows(["3", "42"])) == [3, 42]
+    assert not hasattr(vehicle, "__dict__")
+
+    # copies keep the vehicles sharing one table, independent of the original
+    copies = copy.deepcopy({v.vehicle_id: v for v in vehicles})
+    copies["42"].current_edge = "a"
+    assert vehicle.current_edge == "b" and copies["42"]._table is copies["0"]._table
+    restored = pickle.loads(pickle.dumps(vehicle))
+    assert restored.current_edge == "b" and restored.local_destination == "x"
+
+    # a vehicle with a table of its own is moved into another table with all its fields
+    single = Vehicle("s", "a", 3, 700)
+    single.current_edge = "c"
+    single.local_destination = "b"
+    table.adopt([single, vehicle])
+    assert single._table is table and single._row == 100 and len(table) == 101
+    assert (single.vehicle_id, single.destination, single.current_edge, single.local_destination,
+            single.start_time, single.deadline) == ("s", "a", "c", "b", 3.0, 700.0)
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_vehicle_table()
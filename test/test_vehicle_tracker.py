@@ -0,0 +1,126 @@
+'''
+This test file needs the following files:
+vehicle_tracker.py, meso_sim.py, sumo_backend.py, compiled_graph.py.
+It runs on the meso simulator, so it needs no SUMO installation.
+Files that will be generated during the unit test include test.tracker.rou.xml and test.tracker.state
+'''
+import os
+from core.sumo_backend import traci, select_backend, MESO, TRACI
+from core.compiled_graph import CompiledGraph
+from core.Util import Vehicle
+from core.vehicle_tracker import ControlledVehicleTracker
+from core import meso_sim
+
+ROUTE_FILE = "test.tracker.rou.xml"
+STATE_FILE = "test.tracker.state"
+
+
+def chain_graph():
+    # three edges in a row, driven in 5 s each
+    return CompiledGraph(["a", "b", "c"], [50.0] * 3, [10.0] * 3, [1] * 3, [True] * 3,
+                         [0, 1, 2, 2], [1, 2], [0, 0])
+
+
+def write_routes():
+    with open(ROUTE_FILE, "w") as f:
+        f.write("<routes>\n")
+        for i in range(20):
+            # the controlled vehicles share the road with background traffic
+            prefix = "controlled" if i % 2 == 0 else "background"
+            f.write('    <vehicle id="%s%d" depart="%d"><route edges="a b c"/></vehicle>\n' % (prefix, i, i))
+        # a short trip that departs and arrives between two calls of simulationStep
+        f.write('    <vehicle id="short" depart="30"><route edges="c"/></vehicle>\n')
+        f.write("</routes>\n")
+    return {vehicle_id: Vehicle(vehicle_id, "c", 0, 1000)
+            for vehicle_id in ["controlled%d" % i for i in range(0, 20, 2)] + ["short"]}
+
+
+def run_tracker(subscribe, steps=40):
+    """
+    :return: list of the moved roads of every step, list of the arrived controlled vehicles of every step
+    """
+    vehicles = write_routes()
+    tracker = ControlledVehicleTracker(vehicles, subscribe)
+    meso_sim.start_simulation(chain_graph(), [ROUTE_FILE])
+    moves, arrivals = [], []
+    try:
+        step = 0
+        while step < steps:
+            # one call runs from 28 to 36, during which the short trip departs at 30 and arrives at 35
+            step += 8 if step == 28 else 1
+            traci.simulationStep(step)
+            arrivals.append(sorted(tracker.update(step)))
+            moved_roads, moved_speeds = tracker.moved()
+            for vehicle_id, road in moved_roads.items():
+                assert road == traci.vehicle.getRoadID(vehicle_id)
+                if subscribe:
+                    assert moved_speeds[vehicle_id] == traci.vehicle.getSpeed(vehicle_id)
+            assert moved_speeds is None or subscribe
+            moves.append(moved_roads)
+            assert set(tracker.active) == {vehicle_id for vehicle_id in traci.vehicle.getIDList()
+                                           if vehicle_id in vehicles}
+        # the short trip was never in the simulation between two steps: it arrived without being tracked
+        assert any("short" in arrived for arrived in arrivals)
+        assert "short" not in tracker.active and "short" not in tracker.seen
+    finally:
+        meso_sim.close()
+        os.remove(ROUTE_FILE)
+    return moves, arrivals
+
+
+def test_same_results():
+    select_backend(MESO)
+    try:
+        polling = run_tracker(subscribe=False)
+        subscription = run_tracker(subscribe=True)
+    finally:
+        select_backend(TRACI)
+    # both modes find the same road changes and arrivals
+    assert polling == subscription
+    assert any(polling[0])
+    print("TEST PASSED")
+
+
+def test_restore():
+    select_backend(MESO)
+    try:
+        for subscribe in (False, True):
+            vehicles = write_routes()
+            tracker = ControlledVehicleTracker(vehicles, subscribe)
+            meso_sim.start_simulation(chain_graph(), [ROUTE_FILE])
+            try:
+                for step in range(1, 11):
+                    traci.simulationStep()
+                    tracker.update(step)
+                    tracker.moved()
+                traci.simulation.saveState(STATE_FILE)
+                seen = sorted(tracker.seen)
+                active = list(tracker.active)
+                for step in range(11, 16):
+                    traci.simulationStep()
+                    tracker.update(step)
+                    tracker.moved()
+                traci.simulation.loadState(STATE_FILE)
+                tracker.restore(seen)
+                assert tracker.seen == set(seen)
+                assert list(tracker.active) == active
+                # the road of every restored vehicle is reported again, also when the subscriptions were lost
+                moved_roads, _ = tracker.moved()
+                assert moved_roads == {vehicle_id: traci.vehicle.getRoadID(vehicle_id) for vehicle_id in active}
+                traci.simulationStep()
+                tracker.update(11)
+                moved_roads, _ = tracker.moved()
+                assert all(road == traci.vehicle.getRoadID(vehicle_id) for vehicle_id, road in moved_roads.items())
+            finally:
+                meso_sim.close()
+                os.remove(ROUTE_FILE)
+                if os.path.exists(STATE_FILE):
+                    os.remove(STATE_FILE)
+    finally:
+        select_backend(TRACI)
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_same_results()
+    test_restore()
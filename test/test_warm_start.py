@@ -0,0 +1,58 @@
+'''
+This test file needs the following files:
+STR_SUMO.py, meso_sim.py, sumo_backend.py, DijkstraController.py, target_vehicles_generation_protocols.py, test.net.xml.
+It checks on the meso simulator that a run continued from a saved warm-up state gives the same results as a run
+simulated from step 0.
+Files that will be generated during the unit test include test.warm.rou.xml and test.warm.state(.json)
+'''
+import copy
+import os
+from core.sumo_backend import traci, select_backend, MESO, TRACI
+from core.STR_SUMO import StrSumo, SUBSCRIPTION, POLLING
+from core.Util import ConnectionInfo
+from core.target_vehicles_generation_protocols import target_vehicles_generator
+from controller.DijkstraController import DijkstraPolicy
+
+NET_FILE = "./configurations/test.net.xml"
+ROUTE_FILE = "test.warm.rou.xml"
+STATE_FILE = "test.warm.state"
+
+
+def simulate(vehicles, collection_mode, **run_options):
+    connection_info = ConnectionInfo(NET_FILE)
+    simulation = StrSumo(DijkstraPolicy(connection_info), connection_info, vehicles, collection_mode)
+    traci.start(["sumo", "-n", NET_FILE, "-r", ROUTE_FILE])
+    try:
+        return simulation.run(**run_options)
+    finally:
+        traci.close()
+
+
+def test_warm_start():
+    select_backend(MESO)
+    try:
+        generator = target_vehicles_generator(NET_FILE)
+        vehicle_list = generator.generate_vehicles(10, 100, 3, ROUTE_FILE, NET_FILE, seed=3)
+        vehicles = {str(vehicle.vehicle_id): vehicle for vehicle in vehicle_list}
+
+        for collection_mode in [POLLING, SUBSCRIPTION]:
+            expected = simulate(copy.deepcopy(vehicles), collection_mode)
+            # the state is saved while some controlled vehicles are on their way and some have not departed
+            simulate(copy.deepcopy(vehicles), collection_mode, save_state_step=30, state_file=STATE_FILE,
+                     stop_after_save=True)
+            # the controlled vehicles are restored from the state, none have to be passed in
+            restored = {}
+            assert simulate(restored, collection_mode, start_state=STATE_FILE) == expected
+            assert set(restored) == set(vehicles)
+            assert all(vehicle.local_destination == vehicle.destination
+                       for vehicle in restored.values() if vehicle.local_destination)
+    finally:
+        select_backend(TRACI)
+        for file_name in [ROUTE_FILE, STATE_FILE, STATE_FILE + ".json"]:
+            if os.path.exists(file_name):
+                os.remove(file_name)
+    print("TEST PASSED")
+
+
+if __name__ == "__main__":
+    test_warm_start()